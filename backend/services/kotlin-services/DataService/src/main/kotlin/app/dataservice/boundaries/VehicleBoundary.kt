@@ -23,7 +23,8 @@ class VehicleBoundary(
     var height: Int?,
     var latitude: Float?,
     var longitude: Float?,
-    var alert: Boolean?
+    var alert: Boolean?,
+    var embedding: String? = null // base64 float16 appearance vector
 ) {
     constructor(): this(null, null, null, null, null, null, null, null, null, null, null, null, null, null, null, null, null, null, null, null)
 
@@ -48,6 +49,7 @@ class VehicleBoundary(
         this.latitude = vehicleEntity.latitude
         this.longitude = vehicleEntity.longitude
         this.alert = vehicleEntity.alert
+        this.embedding = vehicleEntity.embedding
     }
 
     fun toEntity(): VehicleEntity{
@@ -73,6 +75,7 @@ class VehicleBoundary(
         vehicleEntity.latitude = latitude
         vehicleEntity.longitude = longitude
         vehicleEntity.alert = alert
+        vehicleEntity.embedding = embedding
 
         return vehicleEntity
     }
@@ -98,6 +101,7 @@ class VehicleBoundary(
                 " height=$height," +
                 " latitude=$latitude," +
                 " longitude=$longitude," +
-                " alert=$alert )"
+                " alert=$alert," +
+                " embedding=${embedding?.length ?: 0} chars )"
     }
 }
\ No newline at end of file
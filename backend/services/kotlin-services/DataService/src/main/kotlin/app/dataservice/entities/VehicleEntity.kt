@@ -26,7 +26,8 @@ class VehicleEntity (
     var height: Int?,
     var latitude: Float?,
     var longitude: Float?,
-    var alert: Boolean?
+    var alert: Boolean?,
+    var embedding: String? = null // base64 float16 appearance vector
 ) {
     constructor(): this(null, null ,null, null, null,null, null, null,null, null, null, null, null, null, null, null, null, null, null, null, null)
 
@@ -52,6 +53,7 @@ class VehicleEntity (
                 " height=$height," +
                 " latitude=$latitude," +
                 " longitude=$longitude,"+
-                " alert=$alert )"
+                " alert=$alert," +
+                " embedding=${embedding?.length ?: 0} chars )"
     }
 }
\ No newline at end of file
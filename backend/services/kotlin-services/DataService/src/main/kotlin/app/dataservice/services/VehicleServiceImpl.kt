@@ -63,6 +63,12 @@ class VehicleServiceImpl(
                 if (updatedVehicle.alert != null)
                     it.alert = updatedVehicle.alert
 
+                if (!updatedVehicle.embedding.isNullOrBlank())
+                    it.embedding = updatedVehicle.embedding
+
+                if (!updatedVehicle.description.isNullOrBlank())
+                    it.description = updatedVehicle.description
+
                 val now = LocalDateTime.now()
                 val duration = Duration.between(it.timestamp, now)
 
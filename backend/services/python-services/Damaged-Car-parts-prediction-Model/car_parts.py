@@ -2,22 +2,44 @@ import numpy as np
 import cv2
 from typing import List
 from numpy import ndarray
-from typing import Tuple
+from typing import Optional, Tuple
 import os
 
 
 class Detection:
-    def __init__(self, model_path: str, classes: List[str]):
+    def __init__(self, model_path: str, classes: List[str], target: Optional[int] = None):
         self.model_path = model_path
         self.classes = classes
+        self.target = target
         self.model = self.__load_model()
+        # optional preprocessing buffers (utils.buffer_pool.BufferPool), set by the service
+        self.buffers = None
 
     def __load_model(self) -> cv2.dnn_Net:
         net = cv2.dnn.readNet(self.model_path)
         net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA_FP16)
-        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        net.setPreferableTarget(
+            cv2.dnn.DNN_TARGET_CPU if self.target is None else self.target
+        )
         return net
 
+    def __blob(self, image: ndarray, width: int, height: int) -> ndarray:
+        if self.buffers is None:
+            return cv2.dnn.blobFromImage(
+                image, 1 / 255.0, (width, height), swapRB=True, crop=False
+            )
+        # same as blobFromImage, written into reused buffers
+        resized = cv2.resize(
+            image, (width, height), dst=self.buffers.get("damage_resize", (height, width, 3))
+        )
+        planes = self.buffers.get("damage_planes", (3, height, width))
+        cv2.split(resized, [planes[0], planes[1], planes[2]])
+        blob = self.buffers.get("damage_input", (1, 3, height, width), np.float32)
+        # BGR planes into RGB order, then scale in place
+        blob[0] = planes[::-1]
+        np.multiply(blob, np.float32(1 / 255.0), out=blob)
+        return blob
+
     def __extract_ouput(
         self,
         preds: ndarray,
@@ -75,10 +97,7 @@ class Detection:
         confidence: float = 0.0,
     ) -> dict[list, list, list]:
 
-        blob = cv2.dnn.blobFromImage(
-            image, 1 / 255.0, (width, height), swapRB=True, crop=False
-        )
-        self.model.setInput(blob)
+        self.model.setInput(self.__blob(image, width, height))
         preds = self.model.forward()
         preds = preds.transpose((0, 2, 1))
 
@@ -94,28 +113,18 @@ class Detection:
         return results
 
 
-base_path = os.path.dirname(os.path.abspath(__file__))
-best_model_path = os.path.join(base_path, "best.onnx")
-detection = Detection(
-    model_path=best_model_path,
-    classes=[
-        "damaged door",
-        "damaged window",
-        "damaged headlight",
-        "damaged mirror",
-        "dent",
-        "damaged hood",
-        "damaged bumper",
-        "damaged wind shield",
-    ],
-)
-
-
-def set_detection():
+def model_path():
     base_path = os.path.dirname(os.path.abspath(__file__))
-    best_model_path = os.path.join(base_path, "best.onnx")
+    return os.path.join(base_path, "best.onnx")
+
+
+def set_detection(best_model_path=None, target=None):
+    """
+    :param best_model_path: ONNX model to load, the FP32 best.onnx by default
+    :param target: OpenCV DNN target, the CPU by default
+    """
     detection = Detection(
-        model_path=best_model_path,
+        model_path=best_model_path or model_path(),
         classes=[
             "damaged door",
             "damaged window",
@@ -126,5 +135,6 @@ def set_detection():
             "damaged bumper",
             "damaged wind shield",
         ],
+        target=target,
     )
     return detection
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark of the upload decode path.
+
+Compares the previous PIL path (open -> convert RGB -> resize -> np.array ->
+cvtColor BGR) with utils.image_ingest.decode_frame on synthetic JPEGs.
+
+Run from services/python-services:
+    python -m benchmarks.bench_ingest [--repeat 20]
+"""
+import argparse
+import io
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.image_ingest import FRAME_SIZE, decode_frame, new_frame_buffer
+
+
+def synthetic_jpeg(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    # smooth gradients plus noise compress like a real scene, unlike pure noise
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    noise = rng.normal(0, 12, size=base.shape)
+    image = np.clip(base + noise, 0, 255).astype(np.uint8)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    assert ok
+    return encoded.tobytes()
+
+
+def legacy_decode(data):
+    image = Image.open(io.BytesIO(data)).convert("RGB")
+    image = image.resize(FRAME_SIZE)
+    return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+
+
+def timeit(fn, repeat):
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return samples[len(samples) // 2] * 1000
+
+
+def run(repeat=20):
+    results = []
+    buffer = new_frame_buffer()
+    for width, height in ((1280, 720), (1920, 1080), (4000, 3000), (6000, 4000)):
+        data = synthetic_jpeg(width, height)
+        legacy = timeit(lambda: legacy_decode(data), repeat)
+        fast = timeit(lambda: decode_frame(data), repeat)
+        reused = timeit(lambda: decode_frame(data, dst=buffer), repeat)
+        results.append(
+            {
+                "source": f"{width}x{height}",
+                "legacy_ms": round(legacy, 2),
+                "decode_frame_ms": round(fast, 2),
+                "decode_frame_dst_ms": round(reused, 2),
+                "speedup": round(legacy / reused, 2),
+            }
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(f"{'source':>10} {'legacy':>10} {'decode':>10} {'decode+dst':>11} {'speedup':>8}")
+    for row in run(args.repeat):
+        print(
+            f"{row['source']:>10} {row['legacy_ms']:>8.2f}ms {row['decode_frame_ms']:>8.2f}ms"
+            f" {row['decode_frame_dst_ms']:>9.2f}ms {row['speedup']:>7.2f}x"
+        )
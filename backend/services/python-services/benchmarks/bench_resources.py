@@ -0,0 +1,80 @@
+"""
+Throughput of concurrent inference workers at different splits of the core budget.
+
+Each worker is a thread with its own MNN classifier session (as each camera
+loop would have) that, per item, resizes and blurs a crop with OpenCV and
+classifies it. A split gives `workers` workers `threads` threads each for
+OpenCV and MNN (config.resources); "oversubscribed" runs every worker with
+the full budget, like the libraries' defaults do.
+
+Run from services/python-services:
+    python -m benchmarks.bench_resources [--seconds 3] [--budget N] [--pin]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import cv2
+
+from benchmarks import fakes
+from config import resources
+
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(BASE_PATH, "vehicle-recognition-api-yolov4-python-master"))
+
+
+def splits(budget):
+    """(workers, threads) pairs using the whole budget, plus the oversubscribed default."""
+    pairs = [(w, budget // w) for w in range(1, budget + 1) if budget % w == 0]
+    if budget > 1:
+        pairs.append((budget, budget))
+    return pairs
+
+
+def run_split(workers, threads, seconds, plan=None):
+    import classifier
+    from vehicle_detection import get_items
+
+    items = get_items()
+    cv2.setNumThreads(threads)
+    crops = [fakes.synthetic_frame(width=360, height=240, boxes=2, seed=i) for i in range(8)]
+    models = [classifier.Classifier(items[3], items[4], num_threads=threads) for _ in range(workers)]
+    counts = [0] * workers
+    stop = threading.Event()
+
+    def work(index):
+        if plan is not None:
+            resources.pin_current_thread(plan.partition(index))
+        model = models[index]
+        while not stop.is_set():
+            crop = crops[counts[index] % len(crops)]
+            smooth = cv2.GaussianBlur(cv2.resize(crop, (720, 480)), (5, 5), 0)
+            model.predict(smooth)
+            counts[index] += 1
+
+    pool = [threading.Thread(target=work, args=(i,)) for i in range(workers)]
+    for thread in pool:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in pool:
+        thread.join()
+    return sum(counts) / seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--budget", type=int, help="cores to use (default: all available)")
+    parser.add_argument("--pin", action="store_true", help="pin each worker to its share of the cores")
+    args = parser.parse_args()
+    budget = args.budget or len(resources.available_cores())
+    print(f"core budget {budget}")
+    print(f"{'workers':>8} {'threads':>8} {'items/s':>10}")
+    for workers, threads in splits(budget):
+        plan = resources.make_plan(budget, workers, pin=True) if args.pin and threads * workers == budget else None
+        rate = run_split(workers, threads, args.seconds, plan)
+        label = " (oversubscribed)" if workers * threads > budget else ""
+        print(f"{workers:>8} {threads:>8} {rate:>10.1f}{label}")
@@ -0,0 +1,219 @@
+"""
+In-process stand-ins for the external services used by the processing path
+(data service over HTTP, Kafka, Azure blob storage), plus synthetic frames and
+vehicle records, so hot paths can be measured without the live stack.
+"""
+import copy
+import sys
+import types
+from contextlib import ExitStack
+from unittest import mock
+
+import numpy as np
+
+VEHICLE_TYPES = ["car", "truck", "bus"]
+MANUFACTURERS = ["Toyota", "Hyundai", "Kia", "Mazda", "Skoda", "Ford", "BMW", "Tesla"]
+COLORS = ["white", "black", "silver", "gray", "blue", "red"]
+DAMAGE_CLASSES = ["dent", "damaged door", "damaged bumper", "damaged headlight"]
+
+
+class FakeFuture:
+    is_done = True
+    exception = None
+
+    def succeeded(self):
+        return True
+
+
+class FakeKafkaProducer:
+    """Serializes like the real producer but only records topic and payload size."""
+
+    def __init__(self, value_serializer=None, **kwargs):
+        self.value_serializer = value_serializer
+        self.sent = []
+
+    def send(self, topic, value=None, headers=None):
+        payload = self.value_serializer(value) if self.value_serializer else value
+        self.sent.append((topic, len(payload)))
+        return FakeFuture()
+
+    def flush(self, timeout=None):
+        pass
+
+
+def install_fake_kafka():
+    """
+    Register a fake `kafka` module so utils.kafka_queue can be imported without a
+    broker. Must run before the service module is imported.
+    """
+    if "kafka" in sys.modules and getattr(sys.modules["kafka"], "IS_FAKE", False):
+        return sys.modules["kafka"]
+    module = types.ModuleType("kafka")
+    module.KafkaProducer = FakeKafkaProducer
+    module.IS_FAKE = True
+    sys.modules["kafka"] = module
+    return module
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+        self.text = ""
+
+    def json(self):
+        # the caller mutates the list it gets back, like a fresh HTTP body
+        return copy.deepcopy(self._payload)
+
+
+class FakeDataService:
+    """Answers getVehiclesByCameraId with a fixed list of stored vehicles."""
+
+    def __init__(self, vehicles):
+        self.vehicles = vehicles
+        self.requests = 0
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests += 1
+        if not self.vehicles:
+            return FakeResponse(404, [])
+        return FakeResponse(200, self.vehicles)
+
+
+class FakeBlobStorage:
+    """Accepts uploads like the outbox blob sink and returns deterministic URLs."""
+
+    def __init__(self):
+        self.uploaded = 0
+        self.bytes = 0
+
+    def url(self, blob_name, container_name="images"):
+        return f"https://fake.blob.core.windows.net/{container_name}/{blob_name}"
+
+    def upload_batch(self, items):
+        for _, data in items:
+            self.bytes += len(data)
+            self.uploaded += 1
+        return len(items)
+
+
+class FakeImageBlur:
+    """Same contract as blur.ImageBlur.image_blur without the YOLO models."""
+
+    def image_blur(self, image):
+        return image.copy()
+
+
+class FakeDamageModel:
+    def __call__(self, image, **kwargs):
+        return {"boxes": [], "confidences": [], "classes": []}
+
+
+def patch_service(service, stored_vehicles):
+    """
+    Patch the processing service module to use the fakes.
+
+    :param service: the imported services.vehicle_processing_service module
+    :param stored_vehicles: vehicles returned by the fake data service
+    :return: (ExitStack to close, dict with the fakes)
+    """
+    from utils import kafka_queue
+    from utils.outbox import Outbox
+
+    data_service = FakeDataService(stored_vehicles)
+    blobs = FakeBlobStorage()
+    # in-memory outbox, not drained: writes cost what enqueueing costs
+    outbox = Outbox(":memory:")
+    outbox.register("kafka", kafka_queue.send_batch)
+    outbox.register("blob", blobs.upload_batch)
+    stack = ExitStack()
+    stack.enter_context(
+        mock.patch.object(service, "httpx", types.SimpleNamespace(get=data_service.get))
+    )
+    stack.enter_context(mock.patch.object(service, "blob_url", blobs.url))
+    stack.enter_context(mock.patch.object(service, "outbox", outbox))
+    stack.enter_context(mock.patch.object(kafka_queue, "outbox", outbox))
+    return stack, {"data_service": data_service, "blobs": blobs, "outbox": outbox}
+
+
+def synthetic_vehicle(rng, index=0, frame_size=(1280, 720), with_damage=False, with_embedding=False):
+    width, height = frame_size
+    w = int(rng.integers(80, 260))
+    h = int(rng.integers(60, 200))
+    left = int(rng.integers(0, width - w))
+    top = int(rng.integers(0, height - h))
+    vehicle = {
+        "id": f"v{index}",
+        "cameraId": "bench-camera",
+        "type": str(rng.choice(VEHICLE_TYPES)),
+        "manufacturer": str(rng.choice(MANUFACTURERS)),
+        "color": str(rng.choice(COLORS)),
+        "typeProb": float(rng.uniform(0.3, 1.0)),
+        "manufacturerProb": float(rng.uniform(0.1, 1.0)),
+        "colorProb": float(rng.uniform(0.2, 1.0)),
+        "imageUrl": "none",
+        "description": "{}",
+        "stayDuration": 0,
+        "top": top,
+        "left": left,
+        "width": w,
+        "height": h,
+        "latitude": round(top + h / 2, 3),
+        "longitude": round(left + w / 2, 3),
+    }
+    if with_damage:
+        k = int(rng.integers(0, 3))
+        vehicle["details"] = {
+            "classes": [str(c) for c in rng.choice(DAMAGE_CLASSES, size=k)],
+            "confidences": [float(c) for c in rng.uniform(0.2, 1.0, size=k)],
+        }
+    if with_embedding:
+        from utils import embedding
+
+        # two 1024-d features, like the make and color classifiers
+        features = rng.standard_normal((2, 1024)).astype(np.float32)
+        vehicle["embedding"] = embedding.encode(embedding.compact(*features))
+    return vehicle
+
+
+def synthetic_vehicles(count, seed=0, **kwargs):
+    rng = np.random.default_rng(seed)
+    return [synthetic_vehicle(rng, i, **kwargs) for i in range(count)]
+
+
+def synthetic_records(count, seed=0, **kwargs):
+    """Detected vehicles as process_image returns them."""
+    from utils.records import VehicleRecord
+
+    return [
+        VehicleRecord(
+            camera_id=v["cameraId"],
+            type=v["type"],
+            manufacturer=v["manufacturer"],
+            color=v["color"],
+            type_prob=v["typeProb"],
+            manufacturer_prob=v["manufacturerProb"],
+            color_prob=v["colorProb"],
+            left=v["left"],
+            top=v["top"],
+            width=v["width"],
+            height=v["height"],
+            embedding=v.get("embedding"),
+            details=v.get("details"),
+        )
+        for v in synthetic_vehicles(count, seed=seed, **kwargs)
+    ]
+
+
+def synthetic_frame(width=1280, height=720, boxes=8, seed=0):
+    """A road-like BGR frame with car-sized blocks; stable for a given seed."""
+    rng = np.random.default_rng(seed)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:] = (90, 95, 100)
+    frame += rng.integers(0, 20, size=frame.shape, dtype=np.uint8)
+    for _ in range(boxes):
+        w = int(rng.integers(max(1, width // 16), max(2, width // 4)))
+        h = int(rng.integers(max(1, height // 12), max(2, height // 3)))
+        x, y = int(rng.integers(0, width - w)), int(rng.integers(0, height - h))
+        frame[y : y + h, x : x + w] = rng.integers(0, 255, size=3, dtype=np.uint8)
+    return frame
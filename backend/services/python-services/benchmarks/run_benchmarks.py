@@ -0,0 +1,313 @@
+"""
+Benchmark suite for the processing hot paths.
+
+Uses synthetic frames and in-process fakes for the data service, Kafka and
+Azure (see benchmarks/fakes.py). Cases that need model files which are not
+present are reported as skipped.
+
+Run from services/python-services:
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --baseline bench.json --threshold 0.2
+
+With --baseline, the run exits with status 1 if any case's median time grew by
+more than the threshold (0.2 = 20%).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks import fakes
+
+fakes.install_fake_kafka()
+
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CASES = []
+
+
+class Skip(Exception):
+    pass
+
+
+def case(name, repeat=None):
+    """Register a benchmark. The decorated function does the setup and returns the callable to time."""
+
+    def register(setup):
+        CASES.append({"name": name, "setup": setup, "repeat": repeat})
+        return setup
+
+    return register
+
+
+def _service():
+    from services import vehicle_processing_service
+
+    return vehicle_processing_service
+
+
+def _vendored(folder):
+    path = os.path.join(BASE_PATH, folder)
+    if path not in sys.path:
+        sys.path.append(path)
+
+
+@case("compare_vehicles")
+def bench_compare_vehicles():
+    service = _service()
+    db_vehicle, image_vehicle = fakes.synthetic_vehicles(2, seed=1, with_damage=True)
+    return lambda: service.compare_vehicles(db_vehicle, image_vehicle)
+
+
+def _compare_many_case(stored_count, detected_count):
+    def setup():
+        service = _service()
+        stored = fakes.synthetic_vehicles(stored_count, seed=2, with_damage=True)
+        detected = fakes.synthetic_vehicles(detected_count, seed=3, with_damage=True)
+        return lambda: service.compare_many(stored, detected)
+
+    return setup
+
+
+for _n, _m in ((20, 20), (100, 20), (500, 50)):
+    case(f"compare_many[{_n}x{_m}]")(_compare_many_case(_n, _m))
+
+
+def _compare_all_case(stored_count, detected_count):
+    def setup():
+        service = _service()
+        stored = fakes.synthetic_vehicles(stored_count, seed=2)
+        frame = fakes.synthetic_frame(boxes=detected_count)
+        models = {"image_blur": fakes.FakeImageBlur()}
+        stack, _ = fakes.patch_service(service, stored)
+
+        def run():
+            # fresh records each run, the matcher sets imageUrl on new ones
+            detected = fakes.synthetic_records(detected_count, seed=3)
+            service.compare_all_vehicles_from_db(
+                "Bearer bench", detected, models, frame, "bench-camera"
+            )
+
+        # the fakes stay patched in until the case has been measured
+        run.cleanup = stack.close
+        return run
+
+    return setup
+
+
+for _n, _m in ((5, 5), (20, 20), (50, 50), (100, 20)):
+    case(f"compare_all_vehicles_from_db[{_n}x{_m}]", repeat=10)(_compare_all_case(_n, _m))
+
+
+@case("vehicle_index_query[100k]")
+def bench_vehicle_index_query():
+    from utils.vehicle_index import VehicleIndex
+
+    rng = np.random.default_rng(7)
+    # clustered like real appearance vectors: many sightings of fewer vehicles
+    centers = rng.standard_normal((2000, 128)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), 100_000)]
+    vectors += 0.5 * rng.standard_normal(vectors.shape).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = VehicleIndex()
+    for i, vector in enumerate(vectors):
+        index.insert(i, vector, f"camera-{i % 20}")
+    query = vectors[12345]
+    return lambda: index.query(query, top_k=5, threshold=0.85, exclude_camera="camera-0")
+
+
+@case("classifier_predict")
+def bench_classifier_predict():
+    _vendored("vehicle-recognition-api-yolov4-python-master")
+    try:
+        import classifier
+        from vehicle_detection import get_items
+    except ImportError as e:
+        raise Skip(f"classifier unavailable: {e}")
+    items = get_items()
+    model = classifier.Classifier(items[2], items[5])
+    crop = fakes.synthetic_frame(width=180, height=120, boxes=1, seed=4)
+    return lambda: model.predict(crop)
+
+
+@case("damage_extract_output")
+def bench_damage_extract_output():
+    _vendored("Damaged-Car-parts-prediction-Model")
+    from car_parts import Detection
+
+    # skip model loading; only the post-processing is measured
+    detection = object.__new__(Detection)
+    detection.classes = ["damaged door", "damaged window", "damaged headlight", "damaged mirror",
+                         "dent", "damaged hood", "damaged bumper", "damaged wind shield"]
+    rng = np.random.default_rng(5)
+    preds = rng.uniform(0, 0.05, size=(1, 8400, 12)).astype(np.float32)
+    preds[0, :, :4] = rng.uniform(10, 600, size=(8400, 4))
+    hits = rng.choice(8400, size=40, replace=False)
+    preds[0, hits, 4 + rng.integers(0, 8, size=40)] = rng.uniform(0.2, 0.9, size=40)
+    extract = detection._Detection__extract_ouput
+    return lambda: extract(preds=preds, image_shape=(200, 300), input_shape=(640, 640))
+
+
+def _damage_preprocess_case(pooled):
+    def setup():
+        _vendored("Damaged-Car-parts-prediction-Model")
+        from car_parts import Detection
+        from utils.buffer_pool import BufferPool
+
+        detection = object.__new__(Detection)
+        detection.buffers = BufferPool() if pooled else None
+        crop = fakes.synthetic_frame(width=420, height=300, boxes=1, seed=7)
+        return lambda: detection._Detection__blob(crop, 640, 640)
+
+    return setup
+
+
+case("damage_preprocess[alloc]")(_damage_preprocess_case(False))
+case("damage_preprocess[pooled]")(_damage_preprocess_case(True))
+
+
+@case("image_blur", repeat=5)
+def bench_image_blur():
+    _vendored("face-bluring")
+    try:
+        from blur import ImageBlur, load_model
+    except ImportError as e:
+        raise Skip(f"blur unavailable: {e}")
+    paths = load_model()
+    missing = [p for p in paths if not os.path.exists(p)]
+    if missing:
+        raise Skip(f"missing model files: {', '.join(map(os.path.basename, missing))}")
+    model = ImageBlur(paths)
+    crop = fakes.synthetic_frame(width=240, height=160, boxes=1, seed=6)
+    return lambda: model.image_blur(crop)
+
+
+@case("process_image[frame]", repeat=5)
+def bench_process_image():
+    service = _service()
+    try:
+        vehicle_model = service.VehicleRecognitionModel(*service.get_items())
+    except Exception as e:
+        raise Skip(f"vehicle model unavailable: {e}")
+    try:
+        damage_model = service.set_detection()
+    except Exception:
+        damage_model = fakes.FakeDamageModel()
+    frame_path = os.path.join(BASE_PATH, "tests", "test1.jpg")
+    if os.path.exists(frame_path):
+        with open(frame_path, "rb") as f:
+            frame = service.decode_frame(f.read())
+    else:
+        frame = fakes.synthetic_frame()
+    models = {"vehicle": vehicle_model, "car_damage": damage_model}
+    return lambda: service.process_image(frame, models, "bench-camera")
+
+
+def measure(fn, repeat, min_time=0.2):
+    """Time fn; fast functions are looped so each sample lasts at least ~min_time/repeat."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+        started = time.perf_counter()
+        fn()
+        once = time.perf_counter() - started
+        loops = max(1, int((min_time / repeat) / max(once, 1e-9)))
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            samples.append((time.perf_counter() - started) / loops)
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 4),
+        "min_ms": round(samples[0] * 1000, 4),
+        "repeat": repeat,
+        "loops": loops,
+    }
+
+
+def run(selected=None, repeat=20):
+    results = {}
+    for entry in CASES:
+        name = entry["name"]
+        if selected and not any(s in name for s in selected):
+            continue
+        try:
+            fn = entry["setup"]()
+        except Skip as e:
+            results[name] = {"skipped": str(e)}
+            continue
+        try:
+            results[name] = measure(fn, entry["repeat"] or repeat)
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            cleanup = getattr(fn, "cleanup", None)
+            if cleanup:
+                cleanup()
+    return {
+        "meta": {
+            "timestamp": datetime.now().astimezone().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Return the list of (name, baseline_ms, current_ms, change) that regressed beyond threshold."""
+    regressions = []
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name, {})
+        if "median_ms" not in result or "median_ms" not in before:
+            continue
+        change = result["median_ms"] / before["median_ms"] - 1.0
+        if change > threshold:
+            regressions.append((name, before["median_ms"], result["median_ms"], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the processing hot paths.")
+    parser.add_argument("-k", dest="selected", action="append", help="only run cases containing this text")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="write results JSON to this file")
+    parser.add_argument("--baseline", help="results JSON of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    current = run(args.selected, args.repeat)
+    for name, result in current["results"].items():
+        if "median_ms" in result:
+            print(f"{name:45} {result['median_ms']:>10.3f} ms  (p95 {result['p95_ms']:.3f} ms)")
+        else:
+            print(f"{name:45} {result.get('skipped') or result.get('error')}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: {before:.3f} ms -> {after:.3f} ms (+{change:.0%})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,120 @@
 import os
+import copy
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
 from fastapi import Request, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
-from typing import List, Union # חשוב לייבא את זה!
+from typing import List, Optional, Union # חשוב לייבא את זה!
+
+
+logger = logging.getLogger(__name__)
+
+_jwt_secret: Optional[str] = None
+
+
+def get_jwt_secret() -> Optional[str]:
+    """
+    Returns the JWT secret, reading the JWT_SECRET environment variable only once.
+    A missing secret is not cached, so it can still be provided later.
+    """
+    global _jwt_secret
+    if _jwt_secret is None:
+        _jwt_secret = os.getenv("JWT_SECRET")
+    return _jwt_secret
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of already verified JWT payloads.
+
+    Entries are keyed by a SHA-256 digest of the secret and the token (the raw token
+    is never kept), so entries verified with another secret never match, and are
+    dropped once the token's `exp` claim has passed, so a cached token is never
+    accepted after it would have failed a full decode. Callers get their own copy
+    of the payload.
+    """
+    def __init__(self, max_size: int = 4096, max_ttl: float = 300.0, clock=time.time):
+        """
+        :param max_size: Maximum number of tokens kept; the least recently used is evicted first.
+        :param max_ttl: Upper bound in seconds for caching any token, with or without an `exp` claim.
+        :param clock: Time source in seconds since the epoch, as `exp` is.
+        """
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self.clock = clock
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token: str, secret: str) -> bytes:
+        digest = hashlib.sha256(secret.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(token.encode("utf-8"))
+        return digest.digest()
+
+    def get(self, token: str, secret: str) -> Optional[dict]:
+        """The payload verified earlier with this secret, or None."""
+        key = self._key(token, secret)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # a handler changing its payload must not change it for the next request
+        return copy.deepcopy(payload)
+
+    def put(self, token: str, secret: str, payload: dict) -> None:
+        """Cache a payload that jwt.decode verified with this secret."""
+        now = self.clock()
+        expires_at = now + self.max_ttl
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, float(exp))
+        if expires_at <= now:
+            return
+        key = self._key(token, secret)
+        payload = copy.deepcopy(payload)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+token_cache = VerifiedTokenCache(max_size=int(os.getenv("JWT_CACHE_SIZE", "4096")))
 
 class JWTBearer(HTTPBearer):
     """
@@ -33,15 +145,20 @@ class JWTBearer(HTTPBearer):
 
         if credentials:
             # Ensure the JWT_SECRET environment variable is set
-            jwt_secret = os.getenv("JWT_SECRET")
+            jwt_secret = get_jwt_secret()
             if not jwt_secret:
                 # Log this error as it indicates a configuration issue
-                print("Error: JWT_SECRET environment variable is not set.")
+                logger.error("JWT_SECRET environment variable is not set.")
                 raise HTTPException(
                     status_code=500,
                     detail="Server configuration error: JWT secret not found."
                 )
 
+            # Tokens verified earlier with this secret are reused until their `exp`
+            payload = token_cache.get(credentials.credentials, jwt_secret)
+            if payload is not None:
+                return payload
+
             try:
                 # Decode the JWT token
                 payload = jwt.decode(
@@ -49,14 +166,15 @@ class JWTBearer(HTTPBearer):
                     jwt_secret,               # The secret key for decoding
                     algorithms=["HS384"]      # The algorithm used for signing
                 )
+                token_cache.put(credentials.credentials, jwt_secret, payload)
                 return payload
             except JWTError as e:
                 # Log the specific JWT error for debugging
-                print(f"JWT Authentication Error: {e}")
+                logger.info("JWT Authentication Error: %s", e)
                 raise HTTPException(status_code=403, detail="Invalid or expired token")
             except Exception as e:
                 # Catch any other unexpected errors during processing
-                print(f"An unexpected error occurred during token processing: {e}")
+                logger.exception("An unexpected error occurred during token processing: %s", e)
                 raise HTTPException(status_code=500, detail="Authentication failed due to server error.")
 
         # If no credentials were provided in the request
@@ -81,7 +199,7 @@ def roles_required(required_roles: Union[str, List[str]]):
     def role_checker(payload: dict = Depends(JWTBearer())):
         """
         Inner dependency function that performs the role check.
-        It uses JWTBearer to get the authenticated payload.
+        It uses JWTBearer to get the authenticated payload (cached after the first verification).
         """
         user_roles: List[str] = payload.get("roles", []) # Get user roles from JWT payload, default to empty list
 
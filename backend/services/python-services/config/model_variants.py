@@ -0,0 +1,158 @@
+"""
+Reduced-precision model variants, selected per model by configuration.
+
+MODEL_VARIANTS picks a variant per model, e.g.
+    MODEL_VARIANTS="make_classifier=int8,color_classifier=int8,damage=fp16"
+Models not listed run the original FP32 files.
+
+A variant is either a runtime setting (FP16 arithmetic in OpenCV DNN) or an
+artifact produced by `python -m utils.quantize build` next to the original
+file, named <stem>-<variant><ext>. Every variant other than fp32 must also be
+approved in the gate manifest (`python -m utils.quantize gate`), which records
+how closely it agrees with FP32 on a sample set and the hash of the artifact
+that was evaluated. A variant that is missing, not approved, or whose artifact
+changed since the gate is refused and the FP32 model is loaded instead.
+"""
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST_PATH = os.getenv("MODEL_VARIANT_MANIFEST", os.path.join(BASE_PATH, "model_variants.json"))
+
+FP32 = "fp32"
+
+# model -> variant -> how it is built and loaded:
+#   artifact: extension of the quantized file (absent for runtime-only variants)
+#   target: OpenCV DNN target name, precision: MNN session precision
+VARIANTS = {
+    "vehicle_detector": {"fp16": {"target": "cpu_fp16"}},
+    "make_classifier": {
+        "fp16": {"artifact": ".mnn", "precision": "low"},
+        "int8": {"artifact": ".mnn", "precision": "low"},
+    },
+    "color_classifier": {
+        "fp16": {"artifact": ".mnn", "precision": "low"},
+        "int8": {"artifact": ".mnn", "precision": "low"},
+    },
+    "damage": {"fp16": {"target": "cpu_fp16"}, "int8": {"artifact": ".onnx"}},
+    "blur_face": {"int8": {"artifact": ".onnx"}},
+    "blur_plate": {"int8": {"artifact": ".onnx"}},
+}
+
+_DNN_TARGETS = {"cpu": "DNN_TARGET_CPU", "cpu_fp16": "DNN_TARGET_CPU_FP16"}
+
+
+@dataclass
+class Variant:
+    model: str
+    name: str
+    path: str
+    options: dict = field(default_factory=dict)
+
+    @property
+    def dnn_target(self):
+        """OpenCV DNN target constant of the variant, or None to keep the default."""
+        target = self.options.get("target")
+        if target is None:
+            return None
+        value = getattr(cv2.dnn, _DNN_TARGETS[target], None)
+        if value is None:
+            logger.warning("OpenCV has no %s target, %s runs on the default target", target, self.model)
+        return value
+
+    @property
+    def precision(self):
+        return self.options.get("precision")
+
+
+def parse_variants(text):
+    """Parse "model=variant,..." into a dict, ignoring malformed entries."""
+    selected = {}
+    for part in (text or "").split(","):
+        name, _, variant = part.partition("=")
+        if name.strip() and variant.strip():
+            selected[name.strip()] = variant.strip().lower()
+    return selected
+
+
+def artifact_path(fp32_path, model, variant):
+    """Path of the quantized artifact of a variant, or None for runtime-only variants."""
+    spec = VARIANTS.get(model, {}).get(variant, {})
+    if "artifact" not in spec:
+        return None
+    stem = os.path.splitext(fp32_path)[0]
+    return f"{stem}-{variant}{spec['artifact']}"
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning("Unreadable model variant manifest %s: %s", path, e)
+        return {}
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _refusal(model, variant, fp32_path, manifest):
+    if variant not in VARIANTS.get(model, {}):
+        return "unknown variant"
+    entry = manifest.get(f"{model}:{variant}")
+    if not entry:
+        return "not evaluated by the gate"
+    if not entry.get("approved"):
+        return f"refused by the gate (score {entry.get('score')} < {entry.get('threshold')})"
+    path = artifact_path(fp32_path, model, variant)
+    if path is not None:
+        if not os.path.exists(path):
+            return f"missing artifact {path}"
+        if entry.get("sha256") != file_hash(path):
+            return "artifact changed since it was evaluated"
+    return None
+
+
+def resolve(model, fp32_path, variant=None, manifest=None):
+    """
+    The variant of a model to load.
+
+    :param model: key of VARIANTS, e.g. "damage"
+    :param fp32_path: path of the original model file
+    :param variant: requested variant, defaults to the MODEL_VARIANTS setting
+    :param manifest: gate manifest, read from MANIFEST_PATH by default
+    :return: Variant, the FP32 one when the requested variant is refused
+    """
+    if variant is None:
+        variant = parse_variants(os.getenv("MODEL_VARIANTS")).get(model, FP32)
+    if variant == FP32:
+        return Variant(model, FP32, fp32_path)
+    reason = _refusal(model, variant, fp32_path, load_manifest() if manifest is None else manifest)
+    if reason is not None:
+        logger.warning("Model %s: variant %s not used (%s), loading fp32", model, variant, reason)
+        return Variant(model, FP32, fp32_path)
+    spec = VARIANTS[model][variant]
+    path = artifact_path(fp32_path, model, variant) or fp32_path
+    logger.info("Model %s: using variant %s (%s)", model, variant, os.path.basename(path))
+    return Variant(model, variant, path, {k: v for k, v in spec.items() if k != "artifact"})
@@ -0,0 +1,171 @@
+"""
+CPU budget shared by the inference libraries and the executors.
+
+OpenCV DNN, MNN sessions, torch (ultralytics) and the asyncio default
+executor each size their thread pools from the machine's core count, so on a
+4-8 core box several of them together run far more threads than cores. One
+plan is derived here from a core budget and applied to all of them:
+
+* `workers` inference callers run at the same time (camera loops, ingest
+  batches, or worker processes); each gets `threads_per_worker` threads for
+  OpenCV, MNN and torch intra-op work, with torch inter-op parallelism off;
+* the default executor gets `executor_workers` threads, enough for the
+  inference callers plus capture and HTTP calls that mostly wait.
+
+MNN runs multi-threaded sessions on one shared pool with a small number of
+slots; sessions beyond it log "MNN_THREAD_POOL_MAX_TASKS" and run
+single-threaded, so many workers are better served with one thread each.
+
+Settings:
+    CPU_BUDGET          cores to use (default: all cores the process may run on)
+    CPU_CORES           explicit core list, e.g. "0-3,6" (overrides CPU_BUDGET)
+    INFERENCE_WORKERS   concurrent inference callers (default 1)
+    EXECUTOR_WORKERS    default executor size (default 2 * workers + 2)
+    PIN_WORKERS         "1" to pin each worker to its own share of the cores
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+def parse_cores(text):
+    """Core ids of a list like "0-3,6", in order and without duplicates."""
+    cores = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        for core in range(int(first), int(last or first) + 1):
+            if core not in cores:
+                cores.append(core)
+    return tuple(cores)
+
+
+def available_cores():
+    try:
+        return tuple(sorted(os.sched_getaffinity(0)))
+    except AttributeError:
+        return tuple(range(os.cpu_count() or 1))
+
+
+@dataclass(frozen=True)
+class ResourcePlan:
+    cores: tuple
+    workers: int
+    threads_per_worker: int
+    executor_workers: int
+    pin: bool = False
+
+    def partition(self, index):
+        """Cores of worker `index`: contiguous shares of the budget, the first ones a core larger."""
+        index %= self.workers
+        if self.workers >= len(self.cores):
+            # more workers than cores, they share single cores
+            return (self.cores[index % len(self.cores)],)
+        share, extra = divmod(len(self.cores), self.workers)
+        start = index * share + min(index, extra)
+        return self.cores[start : start + share + (1 if index < extra else 0)]
+
+    def as_dict(self):
+        return {
+            "cores": list(self.cores),
+            "workers": self.workers,
+            "threads_per_worker": self.threads_per_worker,
+            "executor_workers": self.executor_workers,
+            "pin": self.pin,
+        }
+
+
+def make_plan(budget=None, workers=1, executor_workers=None, cores=None, pin=False):
+    """
+    Split a core budget between concurrent inference workers.
+
+    :param budget: number of cores to use, all available cores by default
+    :param workers: concurrent inference callers
+    :param executor_workers: default executor size, 2 * workers + 2 by default
+    :param cores: explicit core ids, overrides budget
+    :param pin: pin each worker to its partition of the cores
+    """
+    if cores is None:
+        cores = available_cores()
+        if budget:
+            cores = cores[: max(1, budget)]
+    workers = max(1, workers)
+    return ResourcePlan(
+        cores=tuple(cores),
+        workers=workers,
+        threads_per_worker=max(1, len(cores) // workers),
+        executor_workers=executor_workers or 2 * workers + 2,
+        pin=pin,
+    )
+
+
+def plan_from_env():
+    cores = os.getenv("CPU_CORES")
+    return make_plan(
+        budget=int(os.getenv("CPU_BUDGET", "0")) or None,
+        workers=int(os.getenv("INFERENCE_WORKERS", "1")),
+        executor_workers=int(os.getenv("EXECUTOR_WORKERS", "0")) or None,
+        cores=parse_cores(cores) if cores else None,
+        pin=os.getenv("PIN_WORKERS", "0") == "1",
+    )
+
+
+def apply_libraries(threads):
+    """Set the OpenCV and torch thread pools (MNN threads are set per session by the classifiers)."""
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # only possible before torch ran any parallel work
+        pass
+
+
+def pin_current_thread(cores):
+    """Restrict the calling thread (Linux) to the given cores; no-op where unsupported."""
+    try:
+        os.sched_setaffinity(0, cores)
+    except (AttributeError, OSError) as e:
+        logger.debug("Could not pin thread to cores %s: %s", cores, e)
+
+
+def executor(plan):
+    """Default executor of the plan; with pinning its threads take the worker partitions in turn."""
+    if not plan.pin:
+        return ThreadPoolExecutor(max_workers=plan.executor_workers, thread_name_prefix="worker")
+    counter = iter(range(1 << 30))
+
+    def initializer():
+        pin_current_thread(plan.partition(next(counter)))
+
+    return ThreadPoolExecutor(
+        max_workers=plan.executor_workers, thread_name_prefix="worker", initializer=initializer
+    )
+
+
+plan = plan_from_env()
+_installed_loops = set()
+
+
+def apply(loop=None):
+    """
+    Apply the plan to OpenCV and torch, and to the loop's default executor
+    when a loop is given (once per loop).
+    """
+    apply_libraries(plan.threads_per_worker)
+    if loop is not None and id(loop) not in _installed_loops:
+        loop.set_default_executor(executor(plan))
+        _installed_loops.add(id(loop))
+    logger.info("CPU plan: %s", plan.as_dict())
+    return plan
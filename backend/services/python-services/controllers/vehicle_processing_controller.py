@@ -1,31 +1,99 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
-import cv2
-from PIL import Image
-import io
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 import uvicorn
 import base64
 import json
+import logging
+import os
+import shutil
+import asyncio
+import tempfile
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
 from services.vehicle_processing_service import (
-    compare_vehicles,
+    matching_pairs,
+    seen_elsewhere,
     build,
     process_image,
     start,
     stop,
     demo_work,
     remove_images,
+    model_status,
+    use_vehicle_index,
 )
+from services.ingest_service import ingest_stream, source_kind
 
 import traceback
-from config.auth_middleware import JWTBearer, roles_required
+from config.auth_middleware import JWTBearer, roles_required, token_cache
 from config.securitySchemes import custom_openapi
+from config import resources
+from utils.stream_hub import stream_hub, sse_events
+from utils.vehicle_index import RemoteVehicleIndex, serve_call, vehicle_index
+from utils.crop_cache import crop_cache
+from utils.buffer_pool import buffer_pool
+from utils.planner import planner
+from utils.scheduler import scheduler
+from utils.admission import content_key, inference_gate
+from utils.jobs import job_events, jobs
+from utils.outbox import outbox
+from utils.update_coalescer import update_coalescer
+from utils.records import plain
+from utils.image_ingest import decode_frame
+from utils import metrics, prefork, profiling
+from utils.logging_config import setup_logging
 
+setup_logging()
+logger = logging.getLogger(__name__)
 
 start_flag = 0
 models = {}
-app = FastAPI(title="AI Vehicle & Face Processing API")
+# set once the startup load finished (successfully or not)
+models_loaded = False
+# models that must be loaded for /health/ready; the camera is optional for uploads and ingest
+READY_MODELS = [m.strip() for m in os.getenv("READY_MODELS", "vehicle,car_damage,image_blur").split(",") if m.strip()]
+
+
+async def load_models():
+    """Load the models in the background, concurrently (see build)."""
+    global models, models_loaded
+    try:
+        answers = await asyncio.get_running_loop().run_in_executor(None, build)
+        models = answers["models"]
+        logger.info("Models loaded: %s", answers["status"])
+    except Exception as e:
+        logger.exception("Model loading failed: %s", e)
+    finally:
+        models_loaded = True
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # executor threads for the camera loops and ingest, sized from the core budget
+    plan = resources.apply(asyncio.get_running_loop())
+    # one frame in flight per inference worker of the plan; their inference shares inference_gate's slots
+    scheduler.slots = plan.workers
+    if prefork.drains_outbox():
+        # deliver queued Kafka/blob writes, including those left by a previous run
+        outbox.start()
+    if not prefork.holds_vehicle_index():
+        # one cross-camera index for all workers, held by prefork.INDEX_WORKER
+        use_vehicle_index(RemoteVehicleIndex(prefork.vehicle_index_url()))
+    # under utils.prefork the models are loaded before the worker starts
+    loading = None if models_loaded else asyncio.create_task(load_models())
+    jobs.start()
+    yield
+    await jobs.stop()
+    await stop()
+    if loading is not None and not loading.done():
+        # the load itself runs on executor threads and cannot be interrupted
+        loading.cancel()
+    outbox.stop()
+
+
+app = FastAPI(title="AI Vehicle & Face Processing API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,13 +104,156 @@ app.add_middleware(
 )
 
 app.openapi = lambda: custom_openapi(app)
+# with pre-fork workers, camera-scoped requests go to the camera's worker
+app.middleware("http")(prefork.route)
+
+
+def _auth_cache_metrics():
+    stats = token_cache.stats()
+    return [
+        "# TYPE jwt_cache_hits_total counter",
+        f"jwt_cache_hits_total {stats['hits']}",
+        "# TYPE jwt_cache_misses_total counter",
+        f"jwt_cache_misses_total {stats['misses']}",
+        "# TYPE jwt_cache_size gauge",
+        f"jwt_cache_size {stats['size']}",
+    ]
+
+
+metrics.registry.add_collector(_auth_cache_metrics)
+
+
+def _vehicle_index_metrics():
+    if not prefork.holds_vehicle_index():
+        return []
+    stats = vehicle_index.stats()
+    return [
+        "# TYPE vehicle_index_size gauge",
+        f"vehicle_index_size {stats['size']}",
+        "# TYPE vehicle_index_evicted_total counter",
+        f"vehicle_index_evicted_total {stats['evicted']}",
+    ]
+
+
+metrics.registry.add_collector(_vehicle_index_metrics)
+
+
+def _crop_cache_metrics():
+    stats = crop_cache.stats()
+    return [
+        "# TYPE crop_cache_hits_total counter",
+        f"crop_cache_hits_total {stats['hits']}",
+        "# TYPE crop_cache_misses_total counter",
+        f"crop_cache_misses_total {stats['misses']}",
+        "# TYPE crop_cache_size gauge",
+        f"crop_cache_size {stats['size']}",
+    ]
+
+
+metrics.registry.add_collector(_crop_cache_metrics)
+
+
+def _buffer_pool_metrics():
+    stats = buffer_pool.stats()
+    return [
+        "# TYPE buffer_pool_bytes gauge",
+        f"buffer_pool_bytes {stats['bytes']}",
+        "# TYPE buffer_pool_reuses_total counter",
+        f"buffer_pool_reuses_total {stats['reuses']}",
+    ]
+
+
+metrics.registry.add_collector(_buffer_pool_metrics)
+
+
+def _planner_metrics():
+    return [
+        "# TYPE planner_estimated_seconds_saved gauge",
+        f"planner_estimated_seconds_saved {planner.stats()['estimated_seconds_saved']}",
+    ]
+
+
+metrics.registry.add_collector(_planner_metrics)
+
+
+def _outbox_metrics():
+    stats = outbox.stats()
+    lines = ["# TYPE outbox_pending gauge"]
+    for kind, count in stats["pending"].items():
+        lines.append(f'outbox_pending{{kind="{kind}"}} {count}')
+    lines += [
+        "# TYPE outbox_bytes gauge",
+        f"outbox_bytes {stats['bytes']}",
+        "# TYPE outbox_sent_total counter",
+        f"outbox_sent_total {stats['sent']}",
+        "# TYPE outbox_dropped_total counter",
+        f"outbox_dropped_total {stats['dropped']}",
+        "# TYPE outbox_stripped_total counter",
+        f"outbox_stripped_total {stats['stripped']}",
+        "# TYPE outbox_refused_total counter",
+    ]
+    for kind, count in stats["refused"].items():
+        lines.append(f'outbox_refused_total{{kind="{kind}"}} {count}')
+    return lines
+
+
+metrics.registry.add_collector(_outbox_metrics)
+
+
+def _admission_metrics():
+    stats = inference_gate.stats()
+    lines = [
+        "# TYPE inference_running gauge",
+        f"inference_running {stats['running']}",
+        "# TYPE inference_waiting gauge",
+        f"inference_waiting {stats['waiting']}",
+        "# TYPE inference_requests_total counter",
+    ]
+    for outcome in ("admitted", "coalesced", "queue_full", "timed_out"):
+        lines.append(f'inference_requests_total{{outcome="{outcome}"}} {stats[outcome]}')
+    return lines
+
+
+metrics.registry.add_collector(_admission_metrics)
+
+
+def _process_memory_metrics():
+    # the worker label is added when /metrics merges the workers
+    lines = ["# TYPE process_memory_bytes gauge"]
+    for kind, value in prefork.memory_usage().items():
+        lines.append(f'process_memory_bytes{{kind="{kind}"}} {value}')
+    return lines
+
+
+metrics.registry.add_collector(_process_memory_metrics)
+
+
+@app.get("/health/live")
+async def health_live():
+    """The process is up and serving requests."""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    """200 once the required models are loaded, 503 before or when one failed; per-model state and load time."""
+    states = {name: dict(entry) for name, entry in model_status.items()}
+    ready = models_loaded and all(states.get(name, {}).get("state") == "ready" for name in READY_MODELS)
+    body = {"ready": ready, "required": READY_MODELS, "models": states}
+    if not ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
 
 
 @app.get("/build", dependencies=[Depends(roles_required(["ADMIN", "USER"]))])
 def build_models():
-    global models
+    global models, models_loaded
+    if prefork.worker is not None:
+        # a rebuild would give this worker private copies of the shared weights
+        raise HTTPException(status_code=409, detail="Models are loaded by the pre-fork master; restart to reload.")
     answers = build()
     models = answers["models"]
+    models_loaded = True
     return {
         "message": "Models built successfully",
         "status": answers["status"],
@@ -50,16 +261,23 @@ def build_models():
 
 
 @app.get("/start/{camera_id}", dependencies=[Depends(roles_required(["ADMIN", "USER"]))])
-async def start_work(request: Request, camera_id: str):
-    global models
+async def start_work(
+    request: Request, camera_id: str, period: Optional[float] = None, priority: Optional[int] = None
+):
+    """
+    Start the camera's work loop, one frame every `period` seconds. Under overload
+    cameras with a higher `priority` keep their rate, frames of the others are shed.
+    """
     auth_header = request.headers.get("Authorization")
-    models = build().get("models",{})
+    if not models_loaded:
+        raise HTTPException(status_code=503, detail="Models are still loading.")
+    if period is not None and period <= 0:
+        raise HTTPException(status_code=400, detail="period must be positive.")
     try:
-        return await start(auth_header, models,camera_id)
+        return await start(auth_header, models, camera_id, period, priority)
     except Exception as e:
-        tb = traceback.format_exc()
-        print(f"{str(e)}\n Location:\n{tb}")
-        return await stop()
+        logger.exception("Work loop for camera %s failed to start: %s", camera_id, e)
+        return await stop(camera_id)
 
 
 @app.get("/stop", dependencies=[Depends(roles_required(["ADMIN", "USER"]))])
@@ -67,38 +285,53 @@ async def stop_work():
     return await stop()
 
 
+@app.get("/stop/{camera_id}", dependencies=[Depends(roles_required(["ADMIN", "USER"]))])
+async def stop_camera(camera_id: str):
+    return await stop(camera_id)
+
+
+def _demo(file_content, models, camera_id):
+    return plain(process_image(decode_frame(file_content), models, camera_id))
+
+
 @app.post(
     "/demo/{camera_id}", dependencies=[Depends(roles_required(["ADMIN", "USER"]))]
 )
 async def process_image_demo(camera_id: str, file: UploadFile = File(...)):
     try:
         file_content = await file.read()
-        image = Image.open(io.BytesIO(file_content)).convert("RGB")
-        new_width, new_height = 1280, 720
-        image = image.resize((new_width, new_height))
-        answer = process_image(image, models, camera_id)
-
-        return answer
+        # identical uploads in flight share one inference
+        return await inference_gate.run(
+            _demo, file_content, models, camera_id, key=("demo", camera_id, content_key(file_content))
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         tb = traceback.format_exc()
         raise HTTPException(status_code=500, detail=f"{str(e)}\nLocation:\n{tb}")
 
 
+def _demo_work(auth_header, file_content, models, camera_id, flag):
+    return plain(demo_work(auth_header, file_content, models, camera_id, flag=flag))
+
+
 @app.post(
     "/demo_work/{camera_id}", dependencies=[Depends(roles_required(["ADMIN", "USER"]))]
 )
 async def demo_work_flow(request: Request, camera_id: str, file1: UploadFile = File(None)):
-    global models
     auth_header = request.headers.get("Authorization")
     flag = 0
     try:
         file_content = await file1.read() if file1 is not None else None
         if file_content is None:
             flag = 1
-        output = demo_work(auth_header, file_content, models, camera_id, flag=flag)
-
-        return output
-
+        # concurrent captures of a camera (or identical uploads) share one frame and inference
+        key = ("demo_work", camera_id, content_key(file_content) if file_content is not None else "capture")
+        return await inference_gate.run(
+            _demo_work, auth_header, file_content, models, camera_id, flag, key=key
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         tb = traceback.format_exc()
         raise HTTPException(status_code=500, detail=f"{str(e)}\nLocation:\n{tb}")
@@ -106,6 +339,272 @@ async def demo_work_flow(request: Request, camera_id: str, file1: UploadFile = F
 
 
 
+def _submitted(job):
+    return {
+        "job_id": job.id,
+        "state": job.state,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }
+
+
+@app.post(
+    "/jobs/demo/{camera_id}",
+    status_code=202,
+    dependencies=[Depends(roles_required(["ADMIN", "USER"]))],
+)
+async def submit_demo_job(camera_id: str, files: List[UploadFile] = File(...)):
+    """Queue /demo for one or more images; the result lists one answer per image."""
+    if not models_loaded:
+        raise HTTPException(status_code=503, detail="Models are still loading.")
+    contents, size = await jobs.read_uploads(files)
+    steps = [
+        (_demo, (content, models, camera_id), ("demo", camera_id, content_key(content)))
+        for content in contents
+    ]
+    return _submitted(jobs.submit("demo", camera_id, steps, id_prefix=prefork.job_prefix(), size=size))
+
+
+@app.post(
+    "/jobs/demo_work/{camera_id}",
+    status_code=202,
+    dependencies=[Depends(roles_required(["ADMIN", "USER"]))],
+)
+async def submit_demo_work_job(
+    request: Request, camera_id: str, files: List[UploadFile] = File(None)
+):
+    """
+    Queue /demo_work for one or more images, or for a camera capture when no
+    file is sent; the result lists one answer per image, in order.
+    """
+    if not models_loaded:
+        raise HTTPException(status_code=503, detail="Models are still loading.")
+    auth_header = request.headers.get("Authorization")
+    contents, size = await jobs.read_uploads(files) if files else ([None], 0)
+    steps = [
+        (
+            _demo_work,
+            (auth_header, content, models, camera_id, 1 if content is None else 0),
+            ("demo_work", camera_id, content_key(content) if content is not None else "capture"),
+        )
+        for content in contents
+    ]
+    return _submitted(jobs.submit("demo_work", camera_id, steps, id_prefix=prefork.job_prefix(), size=size))
+
+
+def _job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    return job
+
+
+@app.get("/jobs/{job_id}", dependencies=[Depends(roles_required(["ADMIN", "USER"]))])
+async def get_job(job_id: str, wait: float = 0.0):
+    """State of a job, with its result once done; `wait` seconds (up to 60) long-polls for completion."""
+    job = _job(job_id)
+    if wait > 0:
+        await jobs.wait(job, min(wait, 60.0))
+    return plain(job.as_dict(jobs.clock()))
+
+
+@app.get("/jobs/{job_id}/events", dependencies=[Depends(roles_required(["ADMIN", "USER"]))])
+async def job_event_stream(request: Request, job_id: str):
+    """Server-Sent-Events of the job's state changes, the last one with the result."""
+    return StreamingResponse(
+        job_events(request, jobs, _job(job_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post(
+    "/ingest/{camera_id}", dependencies=[Depends(roles_required(["ADMIN", "USER"]))]
+)
+async def ingest_batch(
+    request: Request,
+    camera_id: str,
+    files: List[UploadFile] = File(...),
+    every_n: int = 1,
+    chunk_size: int = 8,
+    max_frames: Optional[int] = None,
+    persist: bool = True,
+):
+    """
+    Bulk ingestion of videos (mp4/avi), zips of images or several images.
+    Streams back one JSON line per processed frame. Frames are processed
+    `chunk_size` per executor call, each inferred on its own.
+    """
+    if not models_loaded:
+        raise HTTPException(status_code=503, detail="Models are still loading.")
+    if max_frames is not None and max_frames <= 0:
+        raise HTTPException(status_code=400, detail="max_frames must be positive; leave it out for no limit.")
+    if chunk_size <= 0 or every_n <= 0:
+        raise HTTPException(status_code=400, detail="chunk_size and every_n must be positive.")
+    auth_header = request.headers.get("Authorization")
+    sources = []
+    try:
+        for f in files:
+            kind = source_kind(f.filename)
+            if kind is None:
+                raise HTTPException(
+                    status_code=400, detail=f"Unsupported file type: {f.filename}"
+                )
+            # uploads are closed once we return, and videos and zips are read
+            # from disk piece by piece instead of whole from memory
+            tmp = tempfile.NamedTemporaryFile(
+                delete=False, suffix=os.path.splitext(f.filename)[1]
+            )
+            with tmp:
+                sources.append({"name": f.filename, "path": tmp.name})
+                await asyncio.get_running_loop().run_in_executor(
+                    None, shutil.copyfileobj, f.file, tmp
+                )
+    except Exception:
+        for source in sources:
+            os.remove(source["path"])
+        raise
+
+    return StreamingResponse(
+        ingest_stream(
+            auth_header,
+            sources,
+            models,
+            camera_id,
+            every_n=every_n,
+            chunk_size=chunk_size,
+            max_frames=max_frames,
+            persist=persist,
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+@app.get("/stream/{camera_id}", dependencies=[Depends(roles_required(["ADMIN", "USER"]))])
+async def stream_detections(request: Request, camera_id: str):
+    subscriber = stream_hub.subscribe(camera_id)
+    return StreamingResponse(
+        sse_events(request, subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/stream_stats", dependencies=[Depends(roles_required("ADMIN"))])
+async def stream_stats():
+    return stream_hub.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Metrics of this process, or of all pre-fork workers with a worker label."""
+    text = metrics.render()
+    if prefork.worker is not None:
+        text = await prefork.scrape_metrics(text)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get(
+    "/internal/metrics",
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+    dependencies=[Depends(prefork.internal_only)],
+)
+async def worker_metrics():
+    """Metrics of this worker, for the /metrics of the worker answering a scrape."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.post("/admin/profile/{camera_id}", dependencies=[Depends(roles_required("ADMIN"))])
+async def profile_camera(
+    camera_id: str,
+    seconds: float = 10.0,
+    frames: Optional[int] = None,
+    mode: str = "sample",
+    interval_ms: float = 5.0,
+    trace: bool = False,
+):
+    """
+    Profile the camera's work loop for `seconds` or `frames` (whichever ends first).
+    Returns collapsed stacks (mode=sample), pstats text (mode=cprofile, sampled
+    on Python 3.12+, see X-Profile-Mode), or with trace=true a Chrome trace of
+    the per-frame stage spans.
+    """
+    if seconds <= 0 or seconds > 300:
+        raise HTTPException(status_code=400, detail="seconds must be in (0, 300].")
+    try:
+        session = profiling.start_session(
+            camera_id=camera_id,
+            seconds=seconds,
+            frames=frames,
+            mode=mode,
+            interval=interval_ms / 1000.0,
+            trace=trace,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    # polled on the loop: the few executor threads also run the camera loops
+    await session.wait(seconds + 1)
+    session.finish()
+
+    if trace:
+        return session.trace_events()
+    # cprofile falls back to sampling where per-thread profiles are impossible (Python 3.12+)
+    body = session.collapsed() if session.mode == "sample" else session.pstats_text()
+    extension = "folded" if session.mode == "sample" else "txt"
+    return PlainTextResponse(
+        body,
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{camera_id}.{extension}"',
+            "X-Profiled-Frames": str(session.frames_seen),
+            "X-Profile-Mode": session.mode,
+        },
+    )
+
+
+@app.get("/auth/cache_stats", dependencies=[Depends(roles_required("ADMIN"))])
+async def auth_cache_stats():
+    return token_cache.stats()
+
+
+@app.get("/crop_cache_stats", dependencies=[Depends(roles_required("ADMIN"))])
+async def crop_cache_stats():
+    return crop_cache.stats()
+
+
+@app.get("/planner_stats", dependencies=[Depends(roles_required("ADMIN"))])
+async def planner_stats():
+    return planner.stats()
+
+
+@app.get("/scheduler_stats", dependencies=[Depends(roles_required("ADMIN"))])
+async def scheduler_stats():
+    return scheduler.stats()
+
+
+@app.get("/admission_stats", dependencies=[Depends(roles_required("ADMIN"))])
+async def admission_stats():
+    return inference_gate.stats()
+
+
+@app.get("/job_stats", dependencies=[Depends(roles_required("ADMIN"))])
+async def job_stats():
+    return jobs.stats()
+
+
+@app.get("/outbox_stats", dependencies=[Depends(roles_required("ADMIN"))])
+async def outbox_stats():
+    return outbox.stats()
+
+
+@app.get("/update_stats", dependencies=[Depends(roles_required("ADMIN"))])
+async def update_stats():
+    return update_coalescer.stats()
+
+
 @app.get("/")
 async def root():
     return RedirectResponse(url="/docs")
@@ -131,20 +630,57 @@ async def compare_vehicles_endpoint(
             raise HTTPException(
                 status_code=400, detail="No vehicles found in the provided images."
             )
-        results = []
-        for db_v in db_vehicle:
-            for img_v in image_vehicle:
-                score = compare_vehicles(db_v, img_v)
-                if score > 70:
-                    results.append(
-                        {"db_vehicle": db_v, "image_vehicle": img_v, "score": score}
-                    )
+        results = await inference_gate.run(
+            matching_pairs, db_vehicle, image_vehicle, key=("compare", content_key(image1, image2))
+        )
         return {"results": results}
+    except HTTPException:
+        raise
     except Exception as e:
         tb = traceback.format_exc()
         raise HTTPException(status_code=500, detail=f"{str(e)}\nLocation:\n{tb}")
 
 
+@app.post("/lookup/{camera_id}", dependencies=[Depends(roles_required(["ADMIN", "USER"]))])
+async def lookup_vehicles(
+    camera_id: str, file: UploadFile = File(...), top_k: int = 5, threshold: float = 0.85
+):
+    """Recent sightings on other cameras of each vehicle in a {"vehicles": [...]} JSON file."""
+    try:
+        vehicles = json.loads(await file.read())["vehicles"]
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid vehicles file: {str(e)}")
+
+    def lookup():
+        # a loopback call to the worker holding the index under utils.prefork, so off the event loop
+        return [
+            {"vehicle": vehicle, "seen_on": seen_elsewhere(vehicle, camera_id, top_k, threshold)}
+            for vehicle in vehicles
+        ]
+
+    return {"results": await asyncio.get_running_loop().run_in_executor(None, lookup)}
+
+
+@app.get("/vehicle_index_stats", dependencies=[Depends(roles_required("ADMIN"))])
+async def vehicle_index_stats():
+    return vehicle_index.stats()
+
+
+@app.post(
+    "/internal/vehicle_index/{op}",
+    include_in_schema=False,
+    dependencies=[Depends(prefork.internal_only)],
+)
+async def vehicle_index_call(op: str, request: Request):
+    """Calls of the RemoteVehicleIndex of the other pre-fork workers."""
+    try:
+        return serve_call(vehicle_index, op, await request.json())
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid vehicle index call: {str(e)}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "vehicle_processing_controller:app", host="0.0.0.0", port=5000, reload=True
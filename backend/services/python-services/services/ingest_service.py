@@ -0,0 +1,258 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zipfile
+
+import cv2
+
+from services.vehicle_processing_service import (
+    process_image,
+    compare_all_vehicles_from_db,
+    fetch_stored_vehicles,
+)
+from utils.admission import inference_gate
+from utils.image_ingest import decode_frame, fit_frame
+from utils.records import json_default
+
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+_END = object()
+
+logger = logging.getLogger(__name__)
+
+
+def source_kind(filename):
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in VIDEO_EXTENSIONS:
+        return "video"
+    if ext == ".zip":
+        return "zip"
+    if ext in IMAGE_EXTENSIONS:
+        return "image"
+    return None
+
+
+def _read_source(source):
+    if source.get("path"):
+        with open(source["path"], "rb") as f:
+            return f.read()
+    return source["data"]
+
+
+def iter_frames(sources, every_n=1, max_frames=None):
+    """
+    Yield (source, index, frame) for every sampled frame of the given sources.
+
+    :param sources: list of dicts with "name" and either "path" (upload spooled to disk)
+                    or "data" (bytes); videos need a path
+    :param every_n: keep one video frame out of every `every_n`
+    :param max_frames: stop after this many frames in total (None for no limit)
+    """
+    if max_frames is not None and max_frames <= 0:
+        raise ValueError("max_frames must be positive.")
+    produced = 0
+    for source in sources:
+        kind = source_kind(source["name"])
+        if kind == "video":
+            cap = cv2.VideoCapture(source["path"])
+            if not cap.isOpened():
+                raise ValueError(f"Could not open video {source['name']}")
+            index = 0
+            try:
+                while True:
+                    # grab() skips decoding of frames we are not going to keep
+                    if not cap.grab():
+                        break
+                    if index % every_n == 0:
+                        ok, frame = cap.retrieve()
+                        if ok:
+                            yield source["name"], index, fit_frame(frame)
+                            produced += 1
+                            if max_frames and produced >= max_frames:
+                                return
+                    index += 1
+            finally:
+                cap.release()
+        elif kind == "zip":
+            # a spooled zip is read member by member, never whole
+            archive_file = source.get("path") or io.BytesIO(source["data"])
+            with zipfile.ZipFile(archive_file) as archive:
+                names = sorted(
+                    n for n in archive.namelist() if source_kind(n) == "image"
+                )
+                for index, name in enumerate(names):
+                    yield f"{source['name']}/{name}", index, decode_frame(archive.read(name))
+                    produced += 1
+                    if max_frames and produced >= max_frames:
+                        return
+        elif kind == "image":
+            yield source["name"], 0, decode_frame(_read_source(source))
+            produced += 1
+            if max_frames and produced >= max_frames:
+                return
+        else:
+            raise ValueError(f"Unsupported file type: {source['name']}")
+
+
+class FrameReader(threading.Thread):
+    """
+    Decodes frames in a background thread into a bounded queue so decoding
+    overlaps with inference and memory stays flat for long videos.
+    """
+
+    def __init__(self, sources, every_n=1, max_frames=None, queue_size=32):
+        super().__init__(daemon=True)
+        self.sources = sources
+        self.every_n = max(1, int(every_n))
+        self.max_frames = max_frames
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+
+    def _put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.frames.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self):
+        try:
+            for item in iter_frames(self.sources, self.every_n, self.max_frames):
+                if not self._put(item):
+                    return
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(_END)
+
+    def take_chunk(self, chunk_size):
+        """Block for the first frame, then drain up to chunk_size without waiting."""
+        while True:
+            try:
+                chunk = [self.frames.get(timeout=0.5)]
+                break
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    return [_END]
+        while len(chunk) < chunk_size and chunk[-1] is not _END and not isinstance(chunk[-1], Exception):
+            try:
+                chunk.append(self.frames.get_nowait())
+            except queue.Empty:
+                break
+        return chunk
+
+
+def process_chunk(auth_header, chunk, models, camera_id, persist=True, created=None):
+    """
+    Run the frames of a chunk through the pipeline in one executor call.
+
+    The frames are still inferred one at a time (the detector takes one image
+    per call); chunking only saves the hand-offs between the event loop and the
+    executor.
+
+    :param created: vehicles queued for creation by the earlier frames of the
+                    run; new vehicles are added to it. They reach the data
+                    service later (outbox, Kafka), so until the fetched
+                    vehicles include them they are matched from here, and the
+                    same car on the next frames is not created again.
+    """
+    results = []
+    for source, index, frame in chunk:
+        try:
+            stored = fetch_stored_vehicles(auth_header, camera_id) if persist else None
+            if stored is not None and created:
+                known = {vehicle.get("imageUrl") for vehicle in stored}
+                stored = stored + [vehicle for vehicle in created if vehicle.get("imageUrl") not in known]
+            vehicles = process_image(frame, models, camera_id, stored).get("vehicles", [])
+            entry = {"source": source, "frame": index, "vehicles": vehicles}
+            if persist:
+                entry["matches"] = None
+                if stored is not None:
+                    sightings = []
+                    entry["matches"] = compare_all_vehicles_from_db(
+                        auth_header, vehicles, models, frame, camera_id, stored_vehicles=stored,
+                        sightings=sightings, created=created,
+                    )
+                    if sightings:
+                        entry["seen_on"] = sightings
+        except Exception as e:
+            entry = {"source": source, "frame": index, "error": str(e)}
+        results.append(entry)
+    return results
+
+
+async def ingest_stream(
+    auth_header,
+    sources,
+    models,
+    camera_id,
+    every_n=1,
+    chunk_size=8,
+    max_frames=None,
+    persist=True,
+):
+    """
+    Run every sampled frame of the uploaded sources through the pipeline and
+    yield one JSON line per frame, followed by a summary line.
+
+    :param chunk_size: frames processed per executor call (see process_chunk);
+                       each call goes through the inference admission gate
+    """
+    reader = FrameReader(sources, every_n=every_n, max_frames=max_frames)
+    reader.start()
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    frames = vehicles = errors = 0
+    # vehicles this run queued for creation, matched on its later frames
+    created = []
+    try:
+        finished = False
+        while not finished:
+            chunk = await loop.run_in_executor(None, reader.take_chunk, chunk_size)
+            if chunk[-1] is _END:
+                finished = True
+                chunk = chunk[:-1]
+            elif isinstance(chunk[-1], Exception):
+                finished = True
+                yield json.dumps({"error": str(chunk[-1])}) + "\n"
+                chunk = chunk[:-1]
+            if not chunk:
+                continue
+            # shares the inference slots with the interactive requests and jobs
+            results = await inference_gate.run_waiting(
+                process_chunk, auth_header, chunk, models, camera_id, persist, created
+            )
+            for entry in results:
+                frames += 1
+                vehicles += len(entry.get("vehicles", []))
+                errors += "error" in entry
+                yield json.dumps(entry, default=json_default) + "\n"
+        yield json.dumps(
+            {
+                "summary": {
+                    "frames": frames,
+                    "vehicles": vehicles,
+                    "errors": errors,
+                    "seconds": round(time.perf_counter() - started, 3),
+                }
+            }
+        ) + "\n"
+    except Exception as e:
+        logger.exception("Ingest failed: %s", e)
+        yield json.dumps({"error": str(e)}) + "\n"
+    finally:
+        reader.stop_event.set()
+        for source in sources:
+            if source.get("path"):
+                try:
+                    os.remove(source["path"])
+                except OSError:
+                    pass
@@ -1,13 +1,15 @@
 import sys
 from fastapi import HTTPException
 import os
+import logging
 import cv2
 import numpy as np
 from datetime import datetime
-from PIL import Image
-import io
 import httpx
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 from azure.storage.blob import BlobServiceClient
 
@@ -27,43 +29,136 @@ from image import camera_use
 sys.path.append(
     os.path.join(os.path.dirname(__file__), "..", "Damaged-Car-parts-prediction-Model")
 )
-from car_parts import set_detection
-from utils.kafka_queue import create_vehicle, update_vehicle
+from car_parts import set_detection, model_path as damage_model_path
+from config import model_variants, resources
+from utils.kafka_queue import create_vehicle, send_batch, update_vehicle
+from utils.stream_hub import stream_hub
+from utils.vehicle_index import vehicle_index
+from utils.crop_cache import crop_cache
+from utils.buffer_pool import buffer_pool
+from utils.planner import planner
+from utils.scheduler import scheduler
+from utils.admission import inference_gate
+from utils.outbox import outbox
+from utils.records import VehicleRecord, vehicle_field
+from utils.image_ingest import FRAME_SIZE, decode_frame, fit_frame, new_frame_buffer
+from utils import embedding, metrics
+from utils.metrics import timed, timed_call
+from utils import profiling
+from utils.logging_config import SampledLogger
 import asyncio
 
+logger = logging.getLogger(__name__)
+# per-pair records (weights, candidate scores) are sampled and rate limited
+pair_log = SampledLogger(logger)
+
+
+# Load state of each model for the health endpoints:
+# name -> {"state": "pending" | "loading" | "ready" | "error", "seconds", "error", "variants"}
+model_status = {}
+_model_status_lock = threading.Lock()
+
+
+def _set_model_status(name, **fields):
+    with _model_status_lock:
+        model_status.setdefault(name, {"state": "pending"}).update(fields)
+
+
+def _load_vehicle(variants):
+    item_paths = get_items()
+    detector = variants["vehicle_detector"] = model_variants.resolve("vehicle_detector", item_paths[1])
+    make = variants["make_classifier"] = model_variants.resolve("make_classifier", item_paths[2])
+    color = variants["color_classifier"] = model_variants.resolve("color_classifier", item_paths[3])
+    item_paths[2], item_paths[3] = make.path, color.path
+    model = VehicleRecognitionModel(
+        *item_paths,
+        dnn_target=detector.dnn_target,
+        make_precision=make.precision,
+        color_precision=color.precision,
+        num_threads=resources.plan.threads_per_worker,
+    )
+    model.crop_cache = crop_cache
+    return model
+
+
+def _load_image_blur(variants):
+    face_path, plate_path = load_model()
+    face = variants["blur_face"] = model_variants.resolve("blur_face", face_path)
+    plate = variants["blur_plate"] = model_variants.resolve("blur_plate", plate_path)
+    return ImageBlur([face.path, plate.path])
+
+
+def _load_car_damage(variants):
+    damage = variants["damage"] = model_variants.resolve("damage", damage_model_path())
+    model = set_detection(damage.path, damage.dnn_target)
+    model.buffers = buffer_pool
+    return model
+
+
+def _load_camera(variants):
+    # need to be port 1 when not running on a raspberry pi
+    return camera_use(0)
+
+
+# model name -> (loader, status key and message of the /build response)
+MODEL_LOADERS = {
+    "vehicle": (_load_vehicle, "vehicle", "initialized"),
+    "image_blur": (_load_image_blur, "image_blur", "initialized"),
+    "car_damage": (_load_car_damage, "car_damage", "initialized"),
+    "camera": (_load_camera, "capture_image", "ready"),
+}
+
+
+# one call at a time per model: the OpenCV nets, MNN sessions and the damage
+# Detection keep per-call state (setInput/forward, session inputs) and are
+# shared by every inference slot (INFERENCE_WORKERS), which can then only
+# overlap calls to different models
+model_locks = {name: threading.Lock() for name in MODEL_LOADERS}
+
+
+def _load_one(name):
+    loader = MODEL_LOADERS[name][0]
+    variants = {}
+    _set_model_status(name, state="loading", error=None)
+    started = time.perf_counter()
+    try:
+        model = loader(variants)
+    except Exception as e:
+        logger.error("Loading %s failed: %s", name, e)
+        _set_model_status(name, state="error", error=str(e), seconds=round(time.perf_counter() - started, 3))
+        return None
+    seconds = round(time.perf_counter() - started, 3)
+    _set_model_status(
+        name,
+        state="ready",
+        seconds=seconds,
+        variants={model_name: variant.name for model_name, variant in variants.items()},
+    )
+    logger.info("Loaded %s in %.2fs", name, seconds)
+    return model
+
 
 def build():
+    """
+    Load all models concurrently; the time to load is that of the slowest model.
+    A model that fails to load is reported in the status and left out.
+    """
     try:
-        status = {
-            "vehicle": "not initialized",
-            "image_blur": "not initialized",
-            "capture_image": "not ready",
-            "car_damage": "not initialized",
-        }
-        models = {}
-        try:
-            item_paths = get_items()
-            models["vehicle"] = VehicleRecognitionModel(*item_paths)
-            status["vehicle"] = "initialized"
-        except Exception as e:
-            status["vehicle"] = f"error: {str(e)}"
-        try:
-            model_path = load_model()
-            models["image_blur"] = ImageBlur(model_path)
-            status["image_blur"] = "initialized"
-        except Exception as e:
-            status["image_blur"] = f"error: {str(e)}"
-        try:
-            models["car_damage"] = set_detection()
-            status["car_damage"] = "initialized"
-        except Exception as e:
-            status["car_damage"] = f"error: {str(e)}"
-        try:
-            # need to be port 1 when not running on a raspberry pi
-            models["camera"] = camera_use(0)
-            status["capture_image"] = "ready"
-        except Exception as e:
-            status["capture_image"] = f"error: {str(e)}"
+        # thread pools of OpenCV and torch sized from the core budget, before the models load
+        resources.apply()
+        for name in MODEL_LOADERS:
+            _set_model_status(name, state="pending", error=None)
+        with ThreadPoolExecutor(max_workers=len(MODEL_LOADERS), thread_name_prefix="model-load") as pool:
+            loaded = dict(zip(MODEL_LOADERS, pool.map(_load_one, MODEL_LOADERS)))
+        models = {name: model for name, model in loaded.items() if model is not None}
+        metrics.instrument_models(models)
+        status = {}
+        variants = {}
+        for name, (_, key, message) in MODEL_LOADERS.items():
+            entry = model_status[name]
+            status[key] = message if entry["state"] == "ready" else f"error: {entry['error']}"
+            variants.update(entry.get("variants") or {})
+        status["variants"] = variants
         return {
             "message": "Model initialization status.",
             "status": status,
@@ -80,84 +175,224 @@ def build():
         )
 
 
-stop_event = asyncio.Event()
-loop_task = None
+def warm_up(models):
+    """
+    Run each loaded model once on a blank input, so that lazy initialization
+    (OpenCV DNN layer setup and weight packing, ultralytics layer fusing)
+    happens now instead of on the first frame. A failing model is logged and skipped.
+    """
+    camera_token = metrics.current_camera.set("warmup")
+    blank = np.zeros((FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+    crop = np.zeros((224, 224, 3), dtype=np.uint8)
+    steps = []
+    vehicle = models.get("vehicle")
+    if vehicle is not None:
+        steps += [
+            ("vehicle", vehicle.detect, blank),
+            ("make_classifier", vehicle.car_make_classifier.predict, crop),
+            ("color_classifier", vehicle.car_color_classifier.predict, crop),
+        ]
+    if models.get("car_damage") is not None:
+        steps.append(("car_damage", models["car_damage"], crop))
+    if models.get("image_blur") is not None:
+        steps.append(("image_blur", models["image_blur"].image_blur, crop))
+    try:
+        for name, fn, image in steps:
+            started = time.perf_counter()
+            try:
+                fn(image)
+            except Exception as e:
+                logger.warning("Warm-up of %s failed: %s", name, e)
+                continue
+            logger.info("Warmed up %s in %.2fs", name, time.perf_counter() - started)
+    finally:
+        metrics.current_camera.reset(camera_token)
 
 
-async def start(auth_header, models, camera_id):
-    global loop_task
-    if loop_task and not loop_task.done():
+# camera id -> (work loop task, its stop event)
+loops = {}
+
+
+async def start(auth_header, models, camera_id, period=None, priority=None):
+    """
+    Start the work loop of a camera, scheduled by utils.scheduler.
+
+    :param period: seconds between frames, SCHED_DEFAULT_PERIOD when None
+    :param priority: higher runs first and is shed last, SCHED_DEFAULT_PRIORITY when None
+    """
+    running = loops.get(camera_id)
+    if running and not running[0].done():
         return {"message": "Already running"}
 
-    stop_event.clear()
-    loop_task = asyncio.create_task(work(auth_header, models, camera_id))
+    stop_event = asyncio.Event()
+    scheduler.register(camera_id, period, priority)
+    task = asyncio.create_task(work(auth_header, models, camera_id, stop_event))
+    loops[camera_id] = (task, stop_event)
     return {"message": "Started"}
 
 
-async def stop():
-    global loop_task
-    if not loop_task or loop_task.done():
+async def stop(camera_id=None):
+    """Stop the work loop of a camera, or of every camera when camera_id is None."""
+    selected = [camera_id] if camera_id is not None else list(loops)
+    running = [c for c in selected if c in loops and not loops[c][0].done()]
+    for c in selected:
+        if c in loops and c not in running:
+            # ended on its own (an error), forget it
+            task = loops.pop(c)[0]
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning("Work loop for camera %s had failed: %s", c, task.exception())
+            scheduler.unregister(c)
+    if not running:
         return {"message": "Not running"}
-    stop_event.set()
-    await loop_task
-    return {"message": "Stopped"}
+    for c in running:
+        loops[c][1].set()
+    results = await asyncio.gather(*(loops[c][0] for c in running), return_exceptions=True)
+    for c, result in zip(running, results):
+        loops.pop(c, None)
+        scheduler.unregister(c)
+        if isinstance(result, Exception):
+            logger.warning("Work loop for camera %s ended with an error: %s", c, result)
+    return {"message": "Stopped", "cameras": running}
+
+
+def _in_camera(camera_id, frame_id, fn, *args):
+    """
+    Run fn on an executor thread with the metrics camera/frame labels set,
+    inside the profiling scope when a session for this camera is active.
+    """
+    # executor threads are reused, so the labels are reset instead of left to the next task
+    camera_token = metrics.current_camera.set(camera_id)
+    frame_token = metrics.current_frame.set(frame_id)
+    session = profiling.active
+    try:
+        if session is None:
+            return fn(*args)
+        token = session.enter_thread(camera_id)
+        try:
+            return fn(*args)
+        finally:
+            session.leave_thread(token)
+    finally:
+        metrics.current_frame.reset(frame_token)
+        metrics.current_camera.reset(camera_token)
+
+
+# make and color of a box the planner left unclassified
+UNCLASSIFIED = "unknown"
+
+_timed_fit_frame = timed_call(fit_frame, "resize")
+_timed_decode_frame = timed_call(decode_frame, "resize")
 
 
-def process_image(image, models, camera_id):
+def process_image(image, models, camera_id, stored=None):
+    """
+    Detect, classify and check the vehicles of a frame for damage.
+
+    The planner (utils.planner) decides per detection which models run: tiny
+    boxes (when configured) are kept with the detector's label only, small ones
+    skip damage detection, and boxes that overlap a stored vehicle whose damage
+    result is still fresh reuse its description.
+
+    :param stored: stored vehicles of the camera (fetch_stored_vehicles), or None
+                   when unknown, then only the size rules apply
+    :return: {"vehicles": [VehicleRecord, ...]}; records become dicts only at the
+             Kafka/HTTP boundary (VehicleRecord.to_dict, records.plain)
+    """
+    camera_token = metrics.current_camera.set(camera_id)
     try:
         vehicle_model = models.get("vehicle")
         car_damage_model = models.get("car_damage")
         if not vehicle_model or not car_damage_model:
             raise HTTPException(status_code=500, detail="Models are not initialized.")
-        vehicle_results = vehicle_model.objectDetect(image).get("vehicles")
+        with model_locks["vehicle"]:
+            detections = vehicle_model.detect(image)
+        plans = planner.plan(detections, stored, camera_id)
         full_list = []
-        for vehicle in vehicle_results:
-            rect = vehicle.get("rect")
-            car_img = image[
-                int(rect["top"]) : int(rect["top"]) + int(rect["height"]),
-                int(rect["left"]) : int(rect["left"]) + int(rect["width"]),
-            ]
-            car_damage_results = car_damage_model(car_img)
-            if not car_damage_results:
-                raise HTTPException(
-                    status_code=500, detail="Car damage detection failed."
+        for detection, plan in zip(detections, plans):
+            if plan.classify:
+                with model_locks["vehicle"]:
+                    vehicle_model.classify(image, detection, scope=camera_id)
+            record = VehicleRecord(
+                camera_id=camera_id,
+                type=detection.object,
+                # label-only records of unclassified boxes have no make, color or embedding
+                manufacturer=detection.make or UNCLASSIFIED,
+                color=detection.color or UNCLASSIFIED,
+                type_prob=detection.object_prob,
+                manufacturer_prob=detection.make_prob,
+                color_prob=detection.color_prob,
+                left=detection.left,
+                top=detection.top,
+                width=detection.width,
+                height=detection.height,
+                embedding=embedding.encode(embedding.compact(*detection.features)),
+            )
+            if plan.damage:
+                car_damage_results = _detect_damage(
+                    car_damage_model, record.crop(image), camera_id, record, detection.crop_hash
                 )
-            v = {
-                "id": 0,
-                "cameraId": camera_id,
-                "type": str(vehicle.get("object")),
-                "manufacturer": str(vehicle.get("make")),
-                "color": str(vehicle.get("color")),
-                "typeProb": float(vehicle.get("object_prob", 0)),
-                "manufacturerProb": float(vehicle.get("make_prob", 0)),
-                "colorProb": float(vehicle.get("color_prob", 0)),
-                "imageUrl": "none",
-                "description": str(car_damage_results),
-                "stayDuration": 0,
-                "top": int(rect["top"]),
-                "left": int(rect["left"]),
-                "width": int(rect["width"]),
-                "height": int(rect["height"]),
-                "latitude": round(float(rect["top"]) + (float(rect["height"]) / 2), 3),
-                "longitude": round(float(rect["left"]) + (float(rect["width"]) / 2), 3),
-            }
-            full_list.append(v)
+                if not car_damage_results:
+                    raise HTTPException(
+                        status_code=500, detail="Car damage detection failed."
+                    )
+                record.description = str(car_damage_results)
+                record.damage_checked = True
+            elif plan.known is not None and plan.known.get("description"):
+                record.description = plan.known["description"]
+            else:
+                record.description = str(_skipped_damage(plan.reason))
+            full_list.append(record)
+        metrics.frames_total.inc(camera_id)
+        metrics.vehicles_total.inc(camera_id, amount=len(full_list))
         return {
             "vehicles": full_list,
         }
     except Exception as e:
+        metrics.errors_total.inc(camera_id, "process_image")
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+    finally:
+        metrics.current_camera.reset(camera_token)
 
 
-def crop_image(image, model):
-    base_path = os.path.dirname(os.path.abspath(__file__))
-    folderPath = os.path.join(base_path, "..", "image_output")
+def _skipped_damage(reason):
+    """Damage result placeholder in the car damage model's shape (the description must not be blank)."""
+    return {"boxes": [], "confidences": [], "classes": [], "skipped": reason}
+
+
+def _detect_damage(car_damage_model, car_img, camera_id, record, crop_hash):
+    """Damage detection, reusing the result of an unchanged crop at the same place."""
+    if crop_hash is None:
+        with model_locks["car_damage"]:
+            return car_damage_model(car_img)
+    box = (record.left, record.top, record.width, record.height)
+    result = crop_cache.lookup(camera_id, box, crop_hash, "damage")
+    if result is None:
+        with model_locks["car_damage"]:
+            result = car_damage_model(car_img)
+        if result:
+            crop_cache.store(camera_id, box, crop_hash, "damage", result)
+    return result
+
+
+def _capture(camera):
+    with model_locks["camera"]:
+        return camera.capture_image()
+
+
+def encode_crop(image, model):
+    """
+    Blur a vehicle crop and encode it as PNG in memory.
+
+    :return: (blob name, PNG bytes)
+    """
     now = datetime.now().astimezone(pytz.timezone("Asia/Jerusalem"))
     name = now.strftime("%Y-%m-%d_%H-%M-%S") + f"-{now.microsecond // 1000:03d}"
-    output_path = os.path.join(folderPath, f"{name}.png")
-    blur_image = model.image_blur(image)
-    cv2.imwrite(output_path, blur_image)
-    return output_path
+    with model_locks["image_blur"]:
+        blur_image = model.image_blur(image)
+    ok, encoded = cv2.imencode(".png", blur_image)
+    if not ok:
+        raise ValueError("Could not encode the vehicle image")
+    return f"{name}.png", encoded.tobytes()
 
 
 def demo_work(auth_header, image_upload, models, camera_id, flag=0):
@@ -168,62 +403,91 @@ def demo_work(auth_header, image_upload, models, camera_id, flag=0):
     """
     camera = models.get("camera")
     if flag == 1:
-        camera_name = camera.capture_image()
+        camera_name = _capture(camera)
         if not camera_name:
             raise HTTPException(status_code=500, detail="Camera is not working.")
-        image = camera_name["image"]
-        # If the image is PIL, convert to a numpy array
-        if isinstance(image, Image.Image):
-            image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+        image = _timed_fit_frame(camera_name["image"])
     else:
-        image = Image.open(io.BytesIO(image_upload)).convert("RGB")
-        new_width, new_height = 1280, 720
-        image = image.resize((new_width, new_height))
-        image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-    full_list = process_image(image, models, camera_id).get("vehicles", [])
-
-    output = compare_all_vehicles_from_db(auth_header, full_list, models, image, camera_id)
+        image = _timed_decode_frame(image_upload)
+    # stored vehicles first, the planner uses them to skip work on known vehicles
+    stored = fetch_stored_vehicles(auth_header, camera_id)
+    full_list = process_image(image, models, camera_id, stored).get("vehicles", [])
+
+    output = None
+    sightings = []
+    if stored is not None:
+        output = compare_all_vehicles_from_db(
+            auth_header, full_list, models, image, camera_id, stored_vehicles=stored, sightings=sightings
+        )
+    stream_hub.publish(camera_id, full_list, output, sightings)
 
     return output
 
 
-async def work(auth_header, models, camera_id):
+async def work(auth_header, models, camera_id, stop_event):
     camera = models.get("camera")
     if not camera:
         raise HTTPException(status_code=500, detail="camera is not initialized.")
 
+    frame_buffer = new_frame_buffer()
+    frame_id = 0
     while not stop_event.is_set():
-        camera_name = await asyncio.get_running_loop().run_in_executor(
-            None, camera.capture_image
-        )
+        # waits for the camera's next period and an inference slot; False when the frame is shed
+        if not await scheduler.acquire(camera_id, stop_event):
+            continue
+        try:
+            frame_id += 1
+            await _work_frame(auth_header, models, camera_id, camera, frame_id, frame_buffer)
+        finally:
+            scheduler.release(camera_id)
 
-        if not camera_name:
-            raise HTTPException(status_code=500, detail="Camera is not working.")
+    logger.info("Work loop for camera %s stopped", camera_id)
 
-        image = camera_name["image"]
-        if image is None:
-            raise HTTPException(status_code=500, detail="didn't get image")
 
-        new_image = await asyncio.get_running_loop().run_in_executor(
-            None, cv2.resize, image, (1280, 720)
-        )
+async def _work_frame(auth_header, models, camera_id, camera, frame_id, frame_buffer):
+    camera_name = await asyncio.get_running_loop().run_in_executor(
+        None, _in_camera, camera_id, frame_id, _capture, camera
+    )
 
-        full_list = await asyncio.get_running_loop().run_in_executor(
-            None, process_image, new_image, models, camera_id
-        )
+    if not camera_name:
+        raise HTTPException(status_code=500, detail="Camera is not working.")
+
+    image = camera_name["image"]
+    if image is None:
+        raise HTTPException(status_code=500, detail="didn't get image")
+
+    new_image = await asyncio.get_running_loop().run_in_executor(
+        None, _in_camera, camera_id, frame_id, _timed_fit_frame, image, FRAME_SIZE, frame_buffer
+    )
+
+    stored = await asyncio.get_running_loop().run_in_executor(
+        None, _in_camera, camera_id, frame_id, fetch_stored_vehicles, auth_header, camera_id
+    )
 
-        await asyncio.get_running_loop().run_in_executor(
-            None,
+    # inference takes a slot of the admission gate, shared with the HTTP requests, jobs and ingest
+    full_list = await inference_gate.run_scheduled(
+        _in_camera, camera_id, frame_id, process_image, new_image, models, camera_id, stored
+    )
+
+    output = None
+    sightings = []
+    if stored is not None:
+        output = await inference_gate.run_scheduled(
+            _in_camera,
+            camera_id,
+            frame_id,
             compare_all_vehicles_from_db,
             auth_header,
             full_list.get("vehicles", []),
             models,
             new_image,
+            camera_id,
+            stored,
+            sightings,
         )
-
-        await asyncio.sleep(1)
-
-    print("Stopped")
+    stream_hub.publish(camera_id, full_list.get("vehicles", []), output, sightings)
+    if profiling.active is not None:
+        profiling.active.frame_done(camera_id)
 
 
 def compare_vehicles_from_files(db_vehicle_data, image_vehicle_data):
@@ -237,15 +501,7 @@ def compare_vehicles_from_files(db_vehicle_data, image_vehicle_data):
     try:
         db_vehicle = json.loads(db_vehicle_data)["vehicles"]
         image_vehicle = json.loads(image_vehicle_data)["vehicles"]
-        results = []
-        for db_v in db_vehicle:
-            for img_v in image_vehicle:
-                score = compare_vehicles(db_v, img_v)
-                if score > 70:
-                    results.append(
-                        {"db_vehicle": db_v, "image_vehicle": img_v, "score": score}
-                    )
-        return {"results": results}
+        return {"results": matching_pairs(db_vehicle, image_vehicle)}
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error comparing vehicles from files: {str(e)}"
@@ -255,7 +511,8 @@ def compare_vehicles_from_files(db_vehicle_data, image_vehicle_data):
 def compare_vehicles(db_vehicle, image_vehicle, weights=None):
     """
     Compare two vehicles and return a similarity score (0-100%).
-    Includes type, manufacturer, color, bbox, and optional damage.
+    Includes type, manufacturer, color, bbox and optional damage; appearance
+    embeddings do not change the score, they only break ties (assign_matches).
 
     :param db_vehicle: dict from database
     :param image_vehicle: dict from image detection
@@ -345,7 +602,7 @@ def compare_vehicles(db_vehicle, image_vehicle, weights=None):
 
         total_raw = sum(raw_weights.values())
         weights = {k: v / total_raw for k, v in raw_weights.items()}
-        print(f"Raw weights: {raw_weights}, Normalized weights: {weights}")
+        pair_log.debug("Raw weights: %s, Normalized weights: %s", raw_weights, weights)
         return weights
 
     def compute_damage_weight(db_vehicle, image_vehicle, base_weight=0.05):
@@ -411,7 +668,303 @@ def compare_vehicles(db_vehicle, image_vehicle, weights=None):
     return round(total_score * 100, 2)
 
 
-def compare_all_vehicles_from_db(auth_header, detected_vehicles, models, image, camera_id="6884dd8be79f33241d1688ab"):
+_label_codes = {}
+_label_codes_lock = threading.Lock()
+
+
+def label_code(value):
+    """Interned integer code of a case-insensitive categorical label."""
+    key = str(value).lower()
+    code = _label_codes.get(key)
+    if code is None:
+        with _label_codes_lock:
+            code = _label_codes.setdefault(key, len(_label_codes))
+    return code
+
+
+def _vehicle_row(v):
+    if isinstance(v, VehicleRecord):
+        return (
+            v.type, v.manufacturer, v.color,
+            v.type_prob, v.manufacturer_prob, v.color_prob,
+            v.left, v.top, v.width, v.height, v.details or {},
+        )
+    return (
+        v["type"], v["manufacturer"], v["color"],
+        v.get("typeProb") or 0.0, v.get("manufacturerProb") or 0.0, v.get("colorProb") or 0.0,
+        v.get("left", 0), v.get("top", 0), v.get("width", 0), v.get("height", 0),
+        v.get("details", {}),
+    )
+
+
+def vehicle_columns(vehicles):
+    """
+    Columnar view of a list of vehicle dicts or VehicleRecords, as used by compare_many.
+
+    :return: dict of NumPy arrays: codes (n, 3) for type/manufacturer/color,
+             probs (n, 3), boxes (n, 4) as left/top/right/bottom, plus the raw
+             damage classes and mean damage confidence per vehicle
+    """
+    n = len(vehicles)
+    codes = np.empty((n, 3), dtype=np.int64)
+    probs = np.empty((n, 3), dtype=np.float64)
+    boxes = np.empty((n, 4), dtype=np.float64)
+    damage_classes = []
+    damage_conf = np.zeros(n, dtype=np.float64)
+    for i, v in enumerate(vehicles):
+        vehicle_type, manufacturer, color, *row_probs, left, top, width, height, details = _vehicle_row(v)
+        codes[i, 0] = label_code(vehicle_type)
+        codes[i, 1] = label_code(manufacturer)
+        codes[i, 2] = label_code(color)
+        probs[i] = row_probs
+        boxes[i] = (left, top, left + width, top + height)
+        classes = details.get("classes", "")
+        damage_classes.append(list(classes) if classes else [])
+        confs = details.get("confidences", [])
+        if confs:
+            damage_conf[i] = sum(confs) / len(confs)
+    return {
+        "codes": codes,
+        "probs": probs,
+        "boxes": boxes,
+        "damage_classes": damage_classes,
+        "damage_conf": damage_conf,
+    }
+
+
+def _damage_matrices(db_classes, img_classes):
+    vocab = {}
+    for classes in db_classes + img_classes:
+        for key in classes:
+            vocab.setdefault(key, len(vocab))
+    db_counts = np.zeros((len(db_classes), max(len(vocab), 1)), dtype=np.float64)
+    img_present = np.zeros((len(img_classes), max(len(vocab), 1)), dtype=np.float64)
+    for i, classes in enumerate(db_classes):
+        for key in classes:
+            db_counts[i, vocab[key]] += 1
+    for j, classes in enumerate(img_classes):
+        for key in classes:
+            img_present[j, vocab[key]] = 1
+    db_len = np.array([len(c) for c in db_classes], dtype=np.float64)
+    img_len = np.array([len(c) for c in img_classes], dtype=np.float64)
+    return db_counts, img_present, db_len, img_len
+
+
+def compare_many(db_vehicles, detected_vehicles):
+    """
+    Similarity matrix between stored and detected vehicles (0-100%).
+
+    Vectorized equivalent of calling compare_vehicles(db, detected) for every
+    pair: both sides are turned into columns once and all scores are computed
+    with array operations.
+
+    :param db_vehicles: list of vehicle dicts from the database
+    :param detected_vehicles: list of VehicleRecords (or vehicle dicts) from image detection
+    :return: float array of shape (len(db_vehicles), len(detected_vehicles))
+    """
+    if not db_vehicles or not detected_vehicles:
+        return np.zeros((len(db_vehicles), len(detected_vehicles)))
+    db = vehicle_columns(db_vehicles)
+    img = vehicle_columns(detected_vehicles)
+
+    # per-field average confidences, shape (n, m, 3)
+    conf = (db["probs"][:, None, :] + img["probs"][None, :, :]) / 2.0
+    same = db["codes"][:, None, :] == img["codes"][None, :, :]
+    field_scores = np.where(same, np.maximum(conf, 0.0), 0.0)
+
+    # dynamic weights, as in compute_dynamic_weights(base_total_weight=0.95)
+    type_conf, manu_conf, color_conf = conf[..., 0], conf[..., 1], conf[..., 2]
+    total_conf = type_conf + manu_conf + color_conf
+    bbox_raw = np.clip(1.0 - (total_conf / 3.0), 0.0, 1.0)
+    total_raw = type_conf + manu_conf + color_conf + bbox_raw
+    no_conf = total_conf == 0
+    safe_total = np.where(no_conf, 1.0, total_raw)
+    flat = 0.95 / 4
+    w_type = np.where(no_conf, flat, type_conf / safe_total)
+    w_manu = np.where(no_conf, flat, manu_conf / safe_total)
+    w_color = np.where(no_conf, flat, color_conf / safe_total)
+    w_bbox = np.where(no_conf, flat, bbox_raw / safe_total)
+
+    # bbox IoU with the same soft boost as compare_vehicles
+    b1 = db["boxes"][:, None, :]
+    b2 = img["boxes"][None, :, :]
+    inter_w = np.maximum(0, np.minimum(b1[..., 2], b2[..., 2]) - np.maximum(b1[..., 0], b2[..., 0]))
+    inter_h = np.maximum(0, np.minimum(b1[..., 3], b2[..., 3]) - np.maximum(b1[..., 1], b2[..., 1]))
+    inter_area = inter_w * inter_h
+    area1 = (b1[..., 2] - b1[..., 0]) * (b1[..., 3] - b1[..., 1])
+    area2 = (b2[..., 2] - b2[..., 0]) * (b2[..., 3] - b2[..., 1])
+    iou = np.clip(inter_area / (area1 + area2 - inter_area + 1e-6), 0.0, 1.0)
+    bbox_score = np.where(iou > 0.5, np.maximum(iou, 0.95), iou)
+
+    # damage overlap and weight
+    db_counts, img_present, db_len, img_len = _damage_matrices(
+        db["damage_classes"], img["damage_classes"]
+    )
+    shared = db_counts @ img_present.T
+    max_len = np.maximum(db_len[:, None], img_len[None, :])
+    damage_score = np.where(max_len > 0, shared / np.where(max_len > 0, max_len, 1.0), 1.0)
+    db_has = (db_len > 0)[:, None]
+    img_has = (img_len > 0)[None, :]
+    base_weight = 0.05
+    both_conf = np.minimum((db["damage_conf"][:, None] + img["damage_conf"][None, :]) / 2, 1.0)
+    w_damage = np.where(
+        ~db_has & ~img_has,
+        base_weight,
+        np.where(db_has != img_has, base_weight * 0.2, base_weight * both_conf),
+    )
+
+    total = (
+        w_type * field_scores[..., 0]
+        + w_manu * field_scores[..., 1]
+        + w_color * field_scores[..., 2]
+        + w_bbox * bbox_score
+        + w_damage * damage_score
+    )
+    return np.round(total * 100, 2)
+
+
+def assign_matches(scores, appearance=None, both=None, threshold=70):
+    """
+    Greedy assignment in detection order: each detection takes a still-unmatched
+    stored vehicle scoring above threshold.
+
+    Appearance only breaks ties: when several stored vehicles pass the threshold
+    (e.g. cars with the same labels), the one whose embedding is most similar
+    is taken; without embeddings, the first. It never lets a pair below the
+    threshold match nor keeps one above it from matching.
+
+    :param scores: compare_many matrix, (stored, detected)
+    :param appearance: embedding.similarity_matrix cosines, same shape, or None
+    :param both: mask of pairs where both vehicles have an embedding
+    :return: per detection, the index of its stored vehicle or None
+    """
+    available = np.ones(scores.shape[0], dtype=bool)
+    assigned = []
+    for j in range(scores.shape[1]):
+        candidates = np.flatnonzero(available & (scores[:, j] > threshold))
+        if not candidates.size:
+            assigned.append(None)
+            continue
+        i = int(candidates[0])
+        if appearance is not None and candidates.size > 1:
+            known = candidates[both[candidates, j]]
+            if known.size:
+                i = int(known[np.argmax(appearance[known, j])])
+        available[i] = False
+        assigned.append(i)
+    return assigned
+
+
+def matching_pairs(db_vehicles, image_vehicles, threshold=70):
+    """All (db, image) pairs scoring above threshold, in db-major order."""
+    scores = compare_many(db_vehicles, image_vehicles)
+    return [
+        {
+            "db_vehicle": db_vehicles[i],
+            "image_vehicle": image_vehicles[j],
+            "score": float(scores[i, j]),
+        }
+        for i, j in np.argwhere(scores > threshold)
+    ]
+
+
+# minimum cosine similarity for a sighting on another camera to be reported
+CROSS_CAMERA_THRESHOLD = 0.85
+
+
+def use_vehicle_index(index):
+    """Make the cross-camera lookups use another index, e.g. the RemoteVehicleIndex of a pre-fork worker."""
+    global vehicle_index
+    vehicle_index = index
+
+
+def _provisional_key(image_url):
+    return f"provisional:{image_url}"
+
+
+def record_sightings(vehicles, camera_id):
+    """
+    Add the latest appearance of a frame's vehicles to the cross-camera index,
+    in one index call.
+
+    A new vehicle has no id until the data service assigns one; it is indexed
+    under a provisional key made from its image URL, which is replaced by its
+    id the first time it is matched as a stored vehicle.
+    """
+    entries, removed = [], []
+    for vehicle in vehicles:
+        vector = embedding.decode(vehicle.get("embedding"))
+        if vector is None:
+            continue
+        image_url = vehicle.get("imageUrl")
+        key = vehicle.get("id")
+        if key:
+            if image_url:
+                removed.append(_provisional_key(image_url))
+        elif image_url and image_url != "none":
+            key = _provisional_key(image_url)
+        else:
+            continue
+        meta = {
+            "type": vehicle.get("type"),
+            "manufacturer": vehicle.get("manufacturer"),
+            "color": vehicle.get("color"),
+            "imageUrl": image_url,
+        }
+        entries.append((key, vector, camera_id, meta))
+    if entries or removed:
+        vehicle_index.update(entries, removed)
+
+
+def record_sighting(vehicle, camera_id):
+    """Add one vehicle's latest appearance to the cross-camera index (see record_sightings)."""
+    record_sightings([vehicle], camera_id)
+
+
+def seen_elsewhere(vehicle, camera_id, top_k=3, threshold=CROSS_CAMERA_THRESHOLD):
+    """
+    Recent sightings of a similar vehicle on other cameras.
+
+    :param vehicle: VehicleRecord or vehicle dict with an "embedding"
+    :param camera_id: camera the vehicle is on, excluded from the results
+    :return: list of index hits, best first (empty without an embedding)
+    """
+    vector = embedding.decode(vehicle_field(vehicle, "embedding"))
+    if vector is None:
+        return []
+    return vehicle_index.query(vector, top_k=top_k, threshold=threshold, exclude_camera=camera_id)
+
+
+def fetch_stored_vehicles(auth_header, camera_id):
+    """
+    Stored vehicles of a camera from the data management service.
+
+    :return: list of vehicle dicts (empty when there are none), or None on error
+    """
+    url = f"http://data-management-service:8080/vehicles/getVehiclesByCameraId/{camera_id}"
+
+    try:
+        headers = {"Authorization": auth_header}
+        with timed("db_fetch", camera_id):
+            response = httpx.get(url, headers=headers)
+
+        if response.status_code == 404:
+            logger.debug("No stored vehicles for camera %s", camera_id)
+            return []
+        if response.status_code != 200:
+            logger.error("Failed to fetch vehicles: %s", response.text)
+            raise HTTPException(
+                status_code=500, detail="Failed to fetch vehicles from database."
+            )
+        return response.json()
+    except Exception as e:
+        logger.warning("Error fetching vehicles for camera %s: %s", camera_id, e)
+        metrics.errors_total.inc(camera_id, "db_fetch")
+        return None
+
+
+def compare_all_vehicles_from_db(auth_header, detected_vehicles, models, image, camera_id="6884dd8be79f33241d1688ab",
+                                 stored_vehicles=None, sightings=None, created=None):
     """
     Connect to MongoDB, fetch all stored vehicles, and compare with the detected ones.
 
@@ -422,8 +975,16 @@ def compare_all_vehicles_from_db(auth_header, detected_vehicles, models, image,
     :param db_uri: MongoDB connection string
     :param db_name: Name of the database
     :param collection_name: Collection containing vehicle entries
-    :param detected_vehicles: List of vehicle dicts from image
-    :return: List of match results (dict with db_vehicle, detected_vehicle, score)
+    :param detected_vehicles: List of VehicleRecords from image
+    :param stored_vehicles: the camera's stored vehicles if already fetched (fetch_stored_vehicles)
+    :param sightings: list receiving {detected_vehicle, seen_on} for new vehicles
+                      recently seen on other cameras
+    :param created: list receiving the dicts of the vehicles queued for creation;
+                    passed back among stored_vehicles (without an id) they are
+                    matched but not updated, their creation is still on its way
+    :return: List of match results (dict with db_vehicle, detected_vehicle, score),
+             or {"DB empty": detected vehicles, "seen_on": sightings} when the camera
+             has no stored vehicles
     """
 
     try:
@@ -433,74 +994,101 @@ def compare_all_vehicles_from_db(auth_header, detected_vehicles, models, image,
             status_code=500, detail=f"Image blur model not initialized: {str(e)}"
         )
 
-    url = f"http://data-management-service:8080/vehicles/getVehiclesByCameraId/{camera_id}"
-
-    try:
-        headers = {"Authorization": auth_header}
-        response = httpx.get(url, headers=headers)
-
-        if response.status_code == 404:
-            print("No vehicles found in the database.")
-            vehicles = []
-
-        elif response.status_code != 200:
-            print(f"Failed to fetch vehicles: {response.text}")
-            raise HTTPException(
-                status_code=500, detail="Failed to fetch vehicles from database."
-            )
-        else:
-            vehicles = response.json()
-    except Exception as e:
-        print(f"Error fetching vehicles: {e}")
-        return None
+    vehicles = stored_vehicles
+    if vehicles is None:
+        vehicles = fetch_stored_vehicles(auth_header, camera_id)
+        if vehicles is None:
+            return None
+    if sightings is None:
+        sightings = []
     output = []
+    # matched and new vehicles, added to the cross-camera index in one call at the end
+    indexed = []
     if vehicles is not None and len(vehicles) > 0:
-        for detected in detected_vehicles:
-            match_found = False
-            for stored in vehicles:
-                score = compare_vehicles(stored, detected)
-                print(f"Comparing {stored} with {detected}, score: {score}")
-                if score > 70:
-                    # Update the stored vehicle with the detected one
-                    output.append(
-                        {
-                            "db_vehicle": stored,
-                            "detected_vehicle": detected,
-                            "score": score,
-                        }
-                    )
+        with timed("matching", camera_id):
+            scores = compare_many(vehicles, detected_vehicles)
+            appearance, both = embedding.similarity_matrix(vehicles, detected_vehicles)
+            assigned = assign_matches(scores, appearance, both)
+        for j, (detected, i) in enumerate(zip(detected_vehicles, assigned)):
+            if i is not None:
+                stored = vehicles[i]
+                score = float(scores[i, j])
+                logger.debug("Matched stored vehicle %s with score %.2f", stored.get("id"), score)
+                # Update the stored vehicle with the detected one
+                output.append(
+                    {
+                        "db_vehicle": stored,
+                        "detected_vehicle": detected,
+                        "score": score,
+                    }
+                )
+                if detected.embedding:
+                    # keep the latest appearance, lighting changes over a stay
+                    stored["embedding"] = detected.embedding
+                if detected.damage_checked:
+                    stored["description"] = detected.description
+                    planner.enriched(stored.get("id"))
+                # current box; the update is only sent once it moved or resized beyond the tolerances
+                stored["top"], stored["left"] = detected.top, detected.left
+                stored["width"], stored["height"] = detected.width, detected.height
+                stored["latitude"] = detected.latitude
+                stored["longitude"] = detected.longitude
+                if stored.get("id"):
                     update_vehicle(stored)
-                    match_found = True
-                    vehicles.remove(stored)
-                    break
-
-            if not match_found:
-                car_img = image[
-                    detected["top"] : detected["top"] + detected["height"],
-                    detected["left"] : detected["left"] + detected["width"],
-                ]
-                output_path = crop_image(car_img, Image_blur_model)
-                filename = os.path.basename(output_path)
-                image_url = upload_to_azure(output_path, filename)
-                detected["imageUrl"] = output_path
-                remove_an_image(output_path)
-                create_vehicle(detected)
+                indexed.append(stored)
+                metrics.matches_total.inc(camera_id)
+            else:
+                _report_seen_elsewhere(detected, camera_id, sightings)
+                vehicle = store_new_vehicle(detected, image, Image_blur_model, camera_id)
+                indexed.append(vehicle)
+                if created is not None:
+                    created.append(vehicle)
     else:
         output = {"DB empty": detected_vehicles}
         for detected in detected_vehicles:
-            car_img = image[
-                detected["top"] : detected["top"] + detected["height"],
-                detected["left"] : detected["left"] + detected["width"],
-            ]
-            output_path = crop_image(car_img, Image_blur_model)
-            filename = os.path.basename(output_path)
-            image_url = upload_to_azure(output_path, filename)
-            detected["imageUrl"] = image_url
-            remove_an_image(output_path)
-            create_vehicle(detected)
+            _report_seen_elsewhere(detected, camera_id, sightings)
+            vehicle = store_new_vehicle(detected, image, Image_blur_model, camera_id)
+            indexed.append(vehicle)
+            if created is not None:
+                created.append(vehicle)
+        if sightings:
+            output["seen_on"] = sightings
+    record_sightings(indexed, camera_id)
     return output
 
 
+def _report_seen_elsewhere(detected, camera_id, sightings):
+    with timed("cross_camera_lookup", camera_id):
+        hits = seen_elsewhere(detected, camera_id)
+    if hits:
+        logger.info(
+            "New vehicle on camera %s was seen on camera %s (score %.3f)",
+            camera_id, hits[0]["cameraId"], hits[0]["score"],
+        )
+        sightings.append({"detected_vehicle": detected, "seen_on": hits})
+
+
+def store_new_vehicle(detected, image, blur_model, camera_id):
+    """
+    Blur the crop of a newly seen vehicle and queue its upload and creation.
+
+    Both go through the outbox (utils.outbox) as one row, the blob URL is known
+    before the upload, so the frame never waits on blob storage or Kafka.
+
+    The caller adds the vehicle to the cross-camera index (record_sightings),
+    so it is findable from other cameras before the data service assigned its id.
+
+    :return: the vehicle dict queued for creation
+    """
+    with timed("encode_upload", camera_id):
+        filename, data = encode_crop(detected.crop(image), blur_model)
+        detected.image_url = blob_url(filename)
+    vehicle = detected.to_dict()
+    create_vehicle(vehicle, data, {"blob_name": filename, "container_name": "images"})
+    metrics.new_vehicles_total.inc(camera_id)
+    return vehicle
+
+
 def remove_images():
     base_path = os.path.dirname(os.path.abspath(__file__))
     folderPath = os.path.join(base_path, "image_output")
@@ -522,24 +1110,82 @@ def remove_an_image(image_path):
         return {"status": f"{image_path} does not exist in image_output"}
 
 
+_blob_service = None
+
+
 def get_blob_service():
-    connect_str = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-    return BlobServiceClient.from_connection_string(connect_str)
+    global _blob_service
+    if _blob_service is None:
+        connect_str = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+        _blob_service = BlobServiceClient.from_connection_string(connect_str)
+    return _blob_service
 
 
-def upload_to_azure(
-    image_path: str, blob_name: str, container_name: str = "images"
-) -> str:
+def blob_url(blob_name: str, container_name: str = "images") -> str:
+    """URL a blob will have once uploaded; computed locally from the connection string."""
+    return f"https://{get_blob_service().account_name}.blob.core.windows.net/{container_name}/{blob_name}"
+
+
+_containers_created = set()
+
+
+def upload_bytes_to_azure(data: bytes, blob_name: str, container_name: str = "images") -> str:
     blob_service = get_blob_service()
     container_client = blob_service.get_container_client(container_name)
 
-    try:
-        container_client.create_container()
-    except Exception:
-        pass
+    if container_name not in _containers_created:
+        try:
+            container_client.create_container()
+        except Exception:
+            pass
+        _containers_created.add(container_name)
 
+    container_client.upload_blob(name=blob_name, data=data, overwrite=True)
+    return blob_url(blob_name, container_name)
+
+
+def upload_to_azure(
+    image_path: str, blob_name: str, container_name: str = "images"
+) -> str:
     with open(image_path, "rb") as data:
-        container_client.upload_blob(name=blob_name, data=data, overwrite=True)
+        # return the URL of the uploaded blob
+        return upload_bytes_to_azure(data.read(), blob_name, container_name)
+
+
+def _create_vehicles(items):
+    """
+    Outbox sink for new vehicles: each image is uploaded before the create
+    event pointing at it is sent. Stops at the first failed upload; the events
+    of the vehicles before it are sent as one batch.
+    """
+    events = []
+    for meta, data in items:
+        blob = meta.get("blob")
+        if blob and data is not None:
+            try:
+                upload_bytes_to_azure(data, blob["blob_name"], blob["container_name"])
+            except Exception as e:
+                logger.warning("Blob upload of %s failed: %s", blob["blob_name"], e)
+                break
+        elif blob:
+            # the image was discarded while the outbox was full
+            meta["value"]["imageUrl"] = "none"
+        events.append((meta, None))
+    return send_batch(events) if events else 0
+
+
+def _upload_blobs(items):
+    """Outbox sink for vehicle images queued on their own by earlier versions; stops at the first failed upload."""
+    uploaded = 0
+    for meta, data in items:
+        try:
+            upload_bytes_to_azure(data, meta["blob_name"], meta["container_name"])
+        except Exception as e:
+            logger.warning("Blob upload of %s failed: %s", meta["blob_name"], e)
+            break
+        uploaded += 1
+    return uploaded
+
 
-    # return the URL of the uploaded blob
-    return f"https://{blob_service.account_name}.blob.core.windows.net/{container_name}/{blob_name}"
+outbox.register("vehicle-create", _create_vehicles)
+outbox.register("blob", _upload_blobs)
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from utils.admission import AdmissionGate
+
+
+def test_full_queue_is_refused_with_retry_after():
+    async def scenario():
+        gate = AdmissionGate(limit=1, queue=1, max_wait=5)
+        first = asyncio.ensure_future(gate.run(time.sleep, 0.2))
+        second = asyncio.ensure_future(gate.run(time.sleep, 0.2))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as refused:
+            await gate.run(time.sleep, 0.2)
+        await asyncio.gather(first, second)
+        return gate, refused.value
+
+    gate, refused = asyncio.run(scenario())
+    assert refused.status_code == 429
+    assert int(refused.headers["Retry-After"]) >= 1
+    assert gate.stats()["admitted"] == 2 and gate.stats()["queue_full"] == 1
+
+
+def test_waiting_too_long_is_refused_with_503():
+    async def scenario():
+        gate = AdmissionGate(limit=1, queue=4, max_wait=0.05)
+        first = asyncio.ensure_future(gate.run(time.sleep, 0.3))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as refused:
+            await gate.run(time.sleep, 0.01)
+        await first
+        return refused.value
+
+    assert asyncio.run(scenario()).status_code == 503
+
+
+def test_identical_requests_share_one_call():
+    calls = []
+    lock = threading.Lock()
+
+    def capture(camera_id):
+        with lock:
+            calls.append(camera_id)
+        time.sleep(0.1)
+        return {"camera": camera_id, "call": len(calls)}
+
+    async def scenario():
+        gate = AdmissionGate(limit=2, queue=0)
+        results = await asyncio.gather(*(gate.run(capture, "cam", key=("capture", "cam")) for _ in range(5)))
+        return gate, results
+
+    gate, results = asyncio.run(scenario())
+    assert calls == ["cam"]
+    assert all(result == {"camera": "cam", "call": 1} for result in results)
+    assert gate.stats()["coalesced"] == 4
+
+
+def test_cancelling_the_first_caller_leaves_the_shared_call_running():
+    calls = []
+
+    def capture(camera_id):
+        calls.append(camera_id)
+        time.sleep(0.1)
+        return camera_id
+
+    async def scenario():
+        gate = AdmissionGate(limit=1, queue=0)
+        first = asyncio.ensure_future(gate.run(capture, "cam", key=("capture", "cam")))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(gate.run(capture, "cam", key=("capture", "cam")))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return first, await second
+
+    first, result = asyncio.run(scenario())
+    assert first.cancelled() and result == "cam" and calls == ["cam"]
+
+
+def test_slot_is_held_until_the_thread_of_a_cancelled_call_returns():
+    async def scenario():
+        gate = AdmissionGate(limit=1, queue=1, max_wait=5)
+        first = asyncio.ensure_future(gate.run(time.sleep, 0.2))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        await asyncio.sleep(0)
+        running = gate.stats()["running"]
+        started = time.monotonic()
+        await gate.run(time.sleep, 0)
+        return running, time.monotonic() - started, gate.stats()["running"]
+
+    running, waited, after = asyncio.run(scenario())
+    assert running == 1 and waited >= 0.1 and after == 0
+
+
+def test_camera_frames_and_requests_share_the_slots():
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def infer():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    async def scenario():
+        gate = AdmissionGate(limit=2, queue=8, max_wait=5)
+        await asyncio.gather(*(gate.run_scheduled(infer) for _ in range(3)), *(gate.run(infer) for _ in range(3)))
+        return gate.stats()
+
+    stats = asyncio.run(scenario())
+    assert peak[0] == 2 and stats["scheduled"] == 3 and stats["admitted"] == 3 and stats["running"] == 0
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+from starlette.requests import Request
+
+from config import auth_middleware
+from config.auth_middleware import JWTBearer, VerifiedTokenCache
+
+SECRET = "s" * 48
+
+
+def test_entry_expires_at_exp_and_within_max_ttl():
+    now = [1000.0]
+    cache = VerifiedTokenCache(max_ttl=300, clock=lambda: now[0])
+    cache.put("short", SECRET, {"sub": "a", "exp": 1010})
+    cache.put("long", SECRET, {"sub": "b", "exp": 5000})
+    cache.put("no-exp", SECRET, {"sub": "c"})
+
+    now[0] = 1009.9
+    assert cache.get("short", SECRET)["sub"] == "a"
+    now[0] = 1010.0
+    assert cache.get("short", SECRET) is None
+    now[0] = 1299.9
+    assert cache.get("long", SECRET) is not None and cache.get("no-exp", SECRET) is not None
+    now[0] = 1300.0
+    assert cache.get("long", SECRET) is None and cache.get("no-exp", SECRET) is None
+
+
+def test_least_recently_used_is_evicted():
+    cache = VerifiedTokenCache(max_size=2)
+    cache.put("a", SECRET, {"sub": "a"})
+    cache.put("b", SECRET, {"sub": "b"})
+    assert cache.get("a", SECRET) is not None
+    cache.put("c", SECRET, {"sub": "c"})
+    assert cache.get("b", SECRET) is None
+    assert cache.get("a", SECRET) is not None and cache.get("c", SECRET) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_secret_change_invalidates_entries():
+    cache = VerifiedTokenCache()
+    cache.put("token", SECRET, {"sub": "a"})
+    assert cache.get("token", "t" * 48) is None
+    assert cache.get("token", SECRET) is not None
+
+
+def test_callers_get_their_own_payload():
+    cache = VerifiedTokenCache()
+    payload = {"sub": "a", "roles": ["USER"]}
+    cache.put("token", SECRET, payload)
+    payload["roles"].append("ADMIN")
+    first = cache.get("token", SECRET)
+    first["roles"].append("ADMIN")
+    assert cache.get("token", SECRET)["roles"] == ["USER"]
+
+
+def _authenticate(token):
+    request = Request({"type": "http", "headers": [(b"authorization", f"Bearer {token}".encode())]})
+    return asyncio.run(JWTBearer()(request))
+
+
+def test_bad_or_expired_token_is_never_cached(monkeypatch):
+    cache = VerifiedTokenCache()
+    monkeypatch.setattr(auth_middleware, "token_cache", cache)
+    monkeypatch.setattr(auth_middleware, "get_jwt_secret", lambda: SECRET)
+
+    expired = jwt.encode({"sub": "a", "exp": 1}, SECRET, algorithm="HS384")
+    forged = jwt.encode({"sub": "a"}, "x" * 48, algorithm="HS384")
+    for token in (expired, forged, "not-a-jwt"):
+        with pytest.raises(HTTPException) as error:
+            _authenticate(token)
+        assert error.value.status_code == 403
+    assert cache.stats()["size"] == 0
+
+    valid = jwt.encode({"sub": "a", "roles": ["USER"]}, SECRET, algorithm="HS384")
+    assert _authenticate(valid)["sub"] == "a"
+    assert cache.stats()["size"] == 1
+    assert _authenticate(valid)["roles"] == ["USER"] and cache.stats()["hits"] == 1
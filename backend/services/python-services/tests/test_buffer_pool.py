@@ -0,0 +1,48 @@
+import threading
+
+import numpy as np
+
+from benchmarks import fakes
+
+fakes.install_fake_kafka()
+
+# the service puts the vendored model folders on sys.path
+from services import vehicle_processing_service  # noqa: F401
+from car_parts import Detection
+from utils.buffer_pool import BufferPool
+
+
+def test_buffers_are_reused_per_thread_and_key():
+    pool = BufferPool()
+    first = pool.get("classifier_input", (224, 224, 3))
+
+    assert pool.get("classifier_input", (224, 224, 3)) is first
+    assert pool.get("classifier_input", (112, 112, 3)) is not first
+    assert pool.get("classifier_input", (224, 224, 3), np.float32).dtype == np.float32
+    assert pool.get("other_input", (224, 224, 3)) is not first
+
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(pool.get("classifier_input", (224, 224, 3))))
+    thread.start()
+    thread.join()
+    assert seen[0] is not first
+    assert pool.stats()["allocations"] == 5 and pool.stats()["reuses"] == 1
+
+
+def _blob(buffers, image):
+    detection = object.__new__(Detection)
+    detection.buffers = buffers
+    return detection._Detection__blob(image, 640, 640)
+
+
+def test_pooled_blob_equals_blob_from_image():
+    pool = BufferPool()
+    for seed, (width, height) in enumerate([(420, 300), (97, 61), (640, 640)]):
+        crop = fakes.synthetic_frame(width=width, height=height, boxes=1, seed=seed)
+        expected = _blob(None, crop)
+        pooled = _blob(pool, crop)
+
+        assert pooled.shape == expected.shape == (1, 3, 640, 640) and pooled.dtype == expected.dtype
+        np.testing.assert_allclose(pooled, expected, rtol=0, atol=1e-6)
+    # one set of buffers served every crop
+    assert pool.stats()["allocations"] == 3
@@ -0,0 +1,82 @@
+import numpy as np
+
+from benchmarks import fakes
+
+fakes.install_fake_kafka()
+
+from services.vehicle_processing_service import assign_matches, compare_many, compare_vehicles
+from utils import embedding
+
+
+def _pairs(seed, with_damage, with_embedding=False):
+    db = fakes.synthetic_vehicles(12, seed=seed, with_damage=with_damage, with_embedding=with_embedding)
+    detected = fakes.synthetic_vehicles(9, seed=seed + 1, with_damage=with_damage, with_embedding=with_embedding)
+    # every other detection is a copy of a stored vehicle, so matches exist
+    for k in range(0, len(detected), 2):
+        detected[k].update(
+            {f: db[k][f] for f in ("type", "manufacturer", "color", "top", "left", "width", "height")}
+        )
+        if with_embedding:
+            detected[k]["embedding"] = db[k]["embedding"]
+    if with_embedding:
+        # vehicles stored before embeddings existed
+        del db[1]["embedding"], detected[3]["embedding"]
+    return db, detected
+
+
+def test_compare_many_equals_compare_vehicles():
+    for seed, with_damage, with_embedding in ((1, False, False), (2, True, False), (4, True, True)):
+        db, detected = _pairs(seed, with_damage, with_embedding)
+        scores = compare_many(db, detected)
+        assert scores.shape == (len(db), len(detected))
+        for i, db_v in enumerate(db):
+            for j, det_v in enumerate(detected):
+                assert abs(scores[i, j] - compare_vehicles(db_v, det_v)) <= 0.01
+
+
+def test_compare_many_zero_confidence_and_empty():
+    db, detected = _pairs(3, False)
+    for v in db + detected:
+        v["typeProb"] = v["manufacturerProb"] = v["colorProb"] = 0.0
+    scores = compare_many(db, detected)
+    assert np.allclose(scores[0, 0], compare_vehicles(db[0], detected[0]), atol=0.01)
+    assert compare_many([], detected).shape == (0, len(detected))
+
+
+def _confident(vehicles):
+    for v in vehicles:
+        v["typeProb"] = v["manufacturerProb"] = v["colorProb"] = 0.95
+    return vehicles
+
+
+def test_appearance_does_not_change_scores():
+    db, detected = _pairs(5, False, with_embedding=True)
+    _confident(db)
+    # a perfect label and bbox match whose appearance is opposite still passes the threshold
+    unlike = dict(db[0], embedding=embedding.encode(-embedding.decode(db[0]["embedding"])))
+    scores = compare_many(db, detected + [unlike])
+    plain = compare_many(
+        [dict(v, embedding=None) for v in db], [dict(v, embedding=None) for v in detected + [unlike]]
+    )
+    assert np.array_equal(scores, plain)
+    assert scores[0, -1] > 70
+
+
+def test_appearance_breaks_ties_between_candidates_only():
+    db, detected = _pairs(5, False, with_embedding=True)
+    _confident(db)
+    twin = dict(db[0], id="twin", embedding=db[2]["embedding"])
+    stored = [db[0], twin]
+    # the detection looks like the twin; both stored vehicles pass on labels and bbox
+    seen = dict(db[0], embedding=db[2]["embedding"])
+    scores = compare_many(stored, [seen])
+    assert (scores[:, 0] > 70).all()
+    appearance, both = embedding.similarity_matrix(stored, [seen])
+    assert assign_matches(scores, appearance, both) == [1]
+    assert assign_matches(scores) == [0]
+
+    # a lookalike below the threshold is not matched
+    scores[1, 0] = 60.0
+    assert assign_matches(scores, appearance, both) == [0]
+    scores[0, 0] = 60.0
+    assert assign_matches(scores, appearance, both) == [None]
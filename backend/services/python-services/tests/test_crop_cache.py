@@ -0,0 +1,31 @@
+import numpy as np
+
+from benchmarks import fakes
+from utils.crop_cache import CropCache, dhash
+
+
+def test_similar_crop_at_same_place_hits():
+    now = [0.0]
+    cache = CropCache(max_entries=2, ttl=10, clock=lambda: now[0])
+    crop = fakes.synthetic_frame(width=200, height=120, boxes=3, seed=1)
+    noisy = np.clip(crop.astype(np.int16) + 2, 0, 255).astype(np.uint8)
+    cache.store("cam", (100, 100, 200, 120), dhash(crop), "classify", "result")
+
+    assert cache.lookup("cam", (104, 97, 200, 120), dhash(noisy), "classify") == "result"
+    assert cache.lookup("cam", (104, 97, 200, 120), dhash(noisy), "damage") is None
+    assert cache.lookup("other", (100, 100, 200, 120), dhash(crop), "classify") is None
+    assert cache.lookup("cam", (600, 100, 200, 120), dhash(crop), "classify") is None
+    other = fakes.synthetic_frame(width=200, height=120, boxes=3, seed=2)
+    assert cache.lookup("cam", (100, 100, 200, 120), dhash(other), "classify") is None
+
+    now[0] = 11.0
+    assert cache.lookup("cam", (100, 100, 200, 120), dhash(crop), "classify") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_lru_bound():
+    cache = CropCache(max_entries=2)
+    for i in range(3):
+        cache.store("cam", (i * 500, 0, 100, 100), i, "classify", i)
+    assert cache.stats()["size"] == 2 and cache.stats()["evictions"] == 1
+    assert cache.lookup("cam", (0, 0, 100, 100), 0, "classify") is None
@@ -0,0 +1,21 @@
+import multiprocessing
+
+import pytest
+
+from config import resources
+from utils import evaluate
+
+
+def test_worker_processes_take_their_share_of_the_cpu_plan(monkeypatch):
+    applied, pinned = [], []
+    monkeypatch.setattr(resources, "apply_libraries", applied.append)
+    monkeypatch.setattr(resources, "pin_current_thread", pinned.append)
+    plan = resources.make_plan(workers=2, cores=(0, 1, 2, 3, 4), pin=True)
+    started = multiprocessing.Value("i", 0)
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            evaluate._init_worker("unknown", plan, started)
+
+    assert applied == [2, 2]
+    assert pinned == [(0, 1, 2), (3, 4)]
@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+import pytest
+
+from benchmarks import fakes
+
+fakes.install_fake_kafka()
+
+from controllers import vehicle_processing_controller as controller
+from services import vehicle_processing_service as service
+
+
+def _no_camera(variants):
+    raise RuntimeError("no camera on port 0")
+
+
+@pytest.fixture
+def loaders(monkeypatch):
+    status = {}
+    monkeypatch.setattr(service, "model_status", status)
+    monkeypatch.setattr(controller, "model_status", status)
+    monkeypatch.setattr(service.resources, "apply", lambda loop=None: None)
+    monkeypatch.setattr(
+        service,
+        "MODEL_LOADERS",
+        {
+            "car_damage": (lambda variants: fakes.FakeDamageModel(), "car_damage", "initialized"),
+            "camera": (_no_camera, "capture_image", "ready"),
+        },
+    )
+    return status
+
+
+def _ready():
+    response = asyncio.run(controller.health_ready())
+    if isinstance(response, dict):
+        return 200, response
+    return response.status_code, json.loads(response.body)
+
+
+def test_build_reports_a_model_that_failed_to_load(loaders):
+    answers = service.build()
+
+    assert answers["status"]["car_damage"] == "initialized"
+    assert answers["status"]["capture_image"] == "error: no camera on port 0"
+    assert answers["models"]["car_damage"] is not None and answers["models"]["camera"] is None
+    assert loaders["camera"]["state"] == "error" and loaders["car_damage"]["state"] == "ready"
+
+
+def test_ready_only_once_the_required_models_loaded(loaders, monkeypatch):
+    monkeypatch.setattr(controller, "READY_MODELS", ["car_damage"])
+    monkeypatch.setattr(controller, "models_loaded", False)
+    assert _ready()[0] == 503
+
+    service.build()
+    assert _ready()[0] == 503  # loaded, but the startup load has not finished yet
+
+    monkeypatch.setattr(controller, "models_loaded", True)
+    code, body = _ready()
+    assert code == 200 and body["ready"] and body["models"]["camera"]["state"] == "error"
+
+    monkeypatch.setattr(controller, "READY_MODELS", ["car_damage", "camera"])
+    code, body = _ready()
+    assert code == 503 and not body["ready"]
@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks import fakes
+from utils import image_ingest
+from utils.image_ingest import FRAME_SIZE, decode_frame, fit_frame, new_frame_buffer
+
+
+def _encoded(width, height, ext=".jpg"):
+    ok, encoded = cv2.imencode(ext, fakes.synthetic_frame(width=width, height=height, seed=width))
+    assert ok
+    return encoded.tobytes()
+
+
+@pytest.mark.parametrize(
+    "width, height, flag",
+    [
+        (5120, 2880, cv2.IMREAD_REDUCED_COLOR_4),
+        (5121, 2883, cv2.IMREAD_REDUCED_COLOR_4),
+        (2600, 1500, cv2.IMREAD_REDUCED_COLOR_2),
+        (2559, 1441, cv2.IMREAD_COLOR),  # half of it would no longer cover the frame
+        (1281, 721, cv2.IMREAD_COLOR),
+        (1280, 720, cv2.IMREAD_COLOR),
+        (641, 359, cv2.IMREAD_COLOR),
+        (37, 23, cv2.IMREAD_COLOR),
+    ],
+)
+def test_reduced_decode_matches_full_decode_and_resize(width, height, flag):
+    data = _encoded(width, height)
+    full = fit_frame(cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR))
+    dst = new_frame_buffer()
+    frame = decode_frame(data, dst=dst)
+
+    assert image_ingest._reduced_flag(data, FRAME_SIZE) == flag
+    assert frame is dst and frame.shape == full.shape == (FRAME_SIZE[1], FRAME_SIZE[0], 3)
+    # libjpeg's scaled decode averages like INTER_AREA does, up to rounding and block edges
+    assert np.abs(frame.astype(np.int16) - full).mean() < 2
+
+
+def test_png_and_unreadable_input():
+    frame = decode_frame(_encoded(2600, 1500, ".png"))
+    assert frame.shape == (FRAME_SIZE[1], FRAME_SIZE[0], 3)
+    with pytest.raises(ValueError):
+        decode_frame(b"not an image")
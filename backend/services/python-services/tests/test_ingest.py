@@ -0,0 +1,85 @@
+import asyncio
+import json
+import zipfile
+
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks import fakes
+
+fakes.install_fake_kafka()
+
+from services import vehicle_processing_service as service
+from services.ingest_service import iter_frames, process_chunk
+from utils.admission import AdmissionGate
+
+
+def _png():
+    ok, encoded = cv2.imencode(".png", np.zeros((8, 8, 3), dtype=np.uint8))
+    return encoded.tobytes()
+
+
+def test_spooled_zip_and_image_are_read_from_disk(tmp_path):
+    archive = tmp_path / "frames.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("b.png", _png())
+        z.writestr("a.png", _png())
+        z.writestr("notes.txt", "skipped")
+    image = tmp_path / "single.png"
+    image.write_bytes(_png())
+
+    sources = [{"name": "frames.zip", "path": str(archive)}, {"name": "single.png", "path": str(image)}]
+    names = [name for name, _, frame in iter_frames(sources)]
+    assert names == ["frames.zip/a.png", "frames.zip/b.png", "single.png"]
+    assert len(list(iter_frames(sources, max_frames=2))) == 2
+
+
+def test_max_frames_must_be_positive():
+    with pytest.raises(ValueError):
+        next(iter_frames([{"name": "a.png", "data": _png()}], max_frames=0))
+
+
+def test_chunks_go_through_the_inference_gate(monkeypatch):
+    from services import ingest_service
+
+    gate = AdmissionGate(limit=1, queue=0)
+    monkeypatch.setattr(ingest_service, "inference_gate", gate)
+    calls = []
+
+    def process_chunk(auth_header, chunk, models, camera_id, persist, created):
+        calls.append(len(chunk))
+        return [{"frame": name, "vehicles": []} for name, *_ in chunk]
+
+    monkeypatch.setattr(ingest_service, "process_chunk", process_chunk)
+    sources = [{"name": f"{i}.png", "data": _png()} for i in range(5)]
+
+    async def collect():
+        return [json.loads(line) async for line in ingest_service.ingest_stream(None, sources, {}, "cam", chunk_size=2)]
+
+    lines = asyncio.run(collect())
+    assert [line["frame"] for line in lines[:-1]] == [f"{i}.png" for i in range(5)]
+    assert lines[-1]["summary"]["frames"] == 5
+    assert max(calls) <= 2 and gate.stats()["admitted"] == len(calls)
+
+
+def test_same_car_on_consecutive_frames_is_created_once(monkeypatch):
+    def record():
+        car = fakes.synthetic_records(1, seed=5, with_embedding=True)[0]
+        car.type_prob = car.manufacturer_prob = car.color_prob = 0.95
+        return car
+
+    from services import ingest_service
+
+    monkeypatch.setattr(ingest_service, "process_image", lambda *args: {"vehicles": [record()]})
+    frame = fakes.synthetic_frame(boxes=1)
+    stack, patched = fakes.patch_service(service, [])
+    with stack:
+        created = []
+        chunk = [("video.mp4", 0, frame), ("video.mp4", 1, frame)]
+        first, second = process_chunk("Bearer t", chunk, {"image_blur": fakes.FakeImageBlur()}, "cam", created=created)
+        assert "DB empty" in first["matches"]
+        # not yet returned by the data service, matched from the run's own creations
+        assert [match["db_vehicle"] for match in second["matches"]] == created
+        assert len(created) == 1
+        assert patched["outbox"].stats()["pending"] == {"vehicle-create": 1}
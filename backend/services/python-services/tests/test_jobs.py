@@ -0,0 +1,103 @@
+import asyncio
+import io
+import time
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from utils.admission import AdmissionGate
+from utils.jobs import DONE, FAILED, RUNNING, JobQueue
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+def test_jobs_run_in_order_and_keep_results():
+    async def scenario():
+        queue = JobQueue(AdmissionGate(limit=1), workers=1)
+        queue.start()
+        batch = queue.submit("demo", "cam", [(time.sleep, (0.05,), None), (str.upper, ("ok",), None)])
+        broken = queue.submit("demo", "cam", [(fail, ("bad image",), None)])
+        assert queue.get(batch.id).state in ("queued", RUNNING)
+        await queue.wait(broken, 5)
+        await queue.stop()
+        return queue, batch, broken
+
+    queue, batch, broken = asyncio.run(scenario())
+    assert batch.state == DONE and batch.as_dict(0)["result"] == [None, "OK"]
+    assert broken.state == FAILED and broken.as_dict(0)["error"] == "bad image"
+    assert queue.stats()["done"] == 1 and queue.stats()["failed"] == 1
+
+
+def test_full_queue_and_expiry():
+    now = [0.0]
+
+    async def scenario():
+        queue = JobQueue(AdmissionGate(limit=1), workers=1, max_queued=1, ttl=60, clock=lambda: now[0])
+        first = queue.submit("demo", "cam", [(str.upper, ("a",), None)])
+        with pytest.raises(HTTPException) as refused:
+            queue.submit("demo", "cam", [(str.upper, ("b",), None)])
+        queue.start()
+        await queue.wait(first, 5)
+        await queue.stop()
+        return queue, first, refused.value
+
+    queue, first, refused = asyncio.run(scenario())
+    assert refused.status_code == 429 and "Retry-After" in refused.headers
+    assert queue.get(first.id) is first
+    now[0] = 61.0
+    assert queue.get(first.id) is None
+
+
+def test_upload_bytes_are_bounded_until_jobs_end():
+    async def scenario():
+        queue = JobQueue(AdmissionGate(limit=1), workers=1, max_queued=10, max_bytes=100)
+        first = queue.submit("demo", "cam", [(len, (b"x" * 60,), None)], size=60)
+        with pytest.raises(HTTPException) as full:
+            queue.submit("demo", "cam", [(len, (b"y" * 50,), None)], size=50)
+        with pytest.raises(HTTPException) as too_large:
+            queue.submit("demo", "cam", [(len, (b"z" * 101,), None)], size=101)
+        held = queue.stats()["held_bytes"]
+        queue.start()
+        await queue.wait(first, 5)
+        second = queue.submit("demo", "cam", [(len, (b"y" * 50,), None)], size=50)
+        await queue.wait(second, 5)
+        await queue.stop()
+        return queue, full.value, too_large.value, held, second
+
+    queue, full, too_large, held, second = asyncio.run(scenario())
+    assert full.status_code == 429 and too_large.status_code == 413 and held == 60
+    assert second.state == DONE and second.results == [50]
+    assert queue.stats()["held_bytes"] == 0 and queue.stats()["refused"] == 2
+
+
+class CountingFile(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def test_uploads_are_refused_before_they_are_read():
+    async def scenario():
+        queue = JobQueue(AdmissionGate(limit=1), workers=1, max_bytes=100)
+        queue.submit("demo", "cam", [(len, (b"x" * 60,), None)], size=60)
+        declared = CountingFile(b"y" * 50)
+        with pytest.raises(HTTPException) as full:
+            await queue.read_uploads([UploadFile(declared, size=50)])
+        # no declared size: reading stops at the chunk that crosses the limit
+        undeclared = CountingFile(b"z" * 500)
+        with pytest.raises(HTTPException) as too_large:
+            await queue.read_uploads([UploadFile(undeclared)], chunk_size=30)
+        contents, size = await queue.read_uploads([UploadFile(io.BytesIO(b"ab")), UploadFile(io.BytesIO(b"c"))])
+        return full.value, declared, too_large.value, undeclared, contents, size
+
+    full, declared, too_large, undeclared, contents, size = asyncio.run(scenario())
+    assert full.status_code == 429 and declared.bytes_read == 0
+    assert too_large.status_code == 429 and undeclared.bytes_read == 60
+    assert contents == [b"ab", b"c"] and size == 3
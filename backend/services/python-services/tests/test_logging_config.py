@@ -0,0 +1,88 @@
+import io
+import json
+import logging
+import logging.handlers
+import types
+
+import pytest
+
+from utils import logging_config
+from utils.logging_config import SampledLogger, parse_levels, setup_logging, stop_logging
+
+
+@pytest.fixture
+def fresh_logging():
+    # the controller sets logging up at import; each test starts from no listener
+    root = logging.getLogger()
+    level = root.level
+    stop_logging()
+    yield
+    stop_logging()
+    root.setLevel(level)
+
+
+def test_records_written_before_shutdown_are_flushed(fresh_logging):
+    stream = io.StringIO()
+    listener = setup_logging(level="info", levels="tests.quiet=ERROR,tests.bad=NOPE", fmt="json", stream=stream)
+    assert setup_logging() is listener
+
+    for i in range(200):
+        logging.getLogger("tests.loud").info("record %d", i)
+    logging.getLogger("tests.quiet").warning("filtered by its level")
+    stop_logging()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["message"] for line in lines] == [f"record {i}" for i in range(200)]
+    assert lines[0]["logger"] == "tests.loud" and lines[0]["level"] == "INFO"
+    assert not any(
+        isinstance(handler, logging.handlers.QueueHandler) for handler in logging.getLogger().handlers
+    )
+    assert parse_levels("tests.quiet=ERROR,tests.bad=NOPE") == {"tests.quiet": logging.ERROR}
+
+
+class Recorder(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture
+def recorded():
+    logger = logging.getLogger("tests.sampled")
+    handler = Recorder()
+    logger.addHandler(handler)
+    logger.propagate = False
+    yield logger, handler.messages
+    logger.removeHandler(handler)
+    logger.setLevel(logging.NOTSET)
+
+
+def test_sampled_logger_keeps_one_in_every_and_limits_the_rate(recorded, monkeypatch):
+    logger, messages = recorded
+    now = [0.0]
+    monkeypatch.setattr(logging_config, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    logger.setLevel(logging.DEBUG)
+    sampled = SampledLogger(logger, every=10, per_second=2)
+
+    for i in range(100):
+        sampled.debug("pair %d", i)
+    # 10 sampled, of which the 2 tokens of the first second are written; the rest are counted
+    assert messages == ["pair 9 (+9 suppressed)", "pair 19 (+9 suppressed)"]
+
+    now[0] = 1.0
+    for i in range(100, 110):
+        sampled.debug("pair %d", i)
+    assert messages[-1] == "pair 109 (+89 suppressed)"
+
+
+def test_sampled_logger_does_nothing_without_debug(recorded):
+    logger, messages = recorded
+    logger.setLevel(logging.INFO)
+    sampled = SampledLogger(logger, every=1, per_second=100)
+
+    for i in range(10):
+        sampled.debug("pair %d", i)
+    assert messages == [] and sampled._seen == 0
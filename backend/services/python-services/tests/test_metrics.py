@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+
+from benchmarks import fakes
+
+fakes.install_fake_kafka()
+
+from services import vehicle_processing_service as service
+from utils import metrics
+
+
+def _exposition(frames, seconds):
+    registry = metrics.Registry()
+    registry.register(metrics.Counter("frames_total", "Frames.", ("camera_id",))).inc("cam a", amount=frames)
+    registry.register(metrics.Histogram("stage_seconds", "Stages.", ("stage",), buckets=(1.0,))).observe(
+        seconds, "capture"
+    )
+    registry.add_collector(lambda: ["# TYPE running gauge", "running 1"])
+    return registry.render()
+
+
+def test_workers_are_merged_with_a_worker_label():
+    merged = metrics.merge_expositions({0: _exposition(3, 0.5), 1: _exposition(4, 2.0)}).splitlines()
+
+    assert merged == [
+        "# HELP frames_total Frames.",
+        "# TYPE frames_total counter",
+        'frames_total{worker="0",camera_id="cam a"} 3',
+        'frames_total{worker="1",camera_id="cam a"} 4',
+        "# HELP stage_seconds Stages.",
+        "# TYPE stage_seconds histogram",
+        'stage_seconds_bucket{worker="0",stage="capture",le="1.0"} 1',
+        'stage_seconds_bucket{worker="0",stage="capture",le="+Inf"} 1',
+        'stage_seconds_sum{worker="0",stage="capture"} 0.5',
+        'stage_seconds_count{worker="0",stage="capture"} 1',
+        'stage_seconds_bucket{worker="1",stage="capture",le="1.0"} 0',
+        'stage_seconds_bucket{worker="1",stage="capture",le="+Inf"} 1',
+        'stage_seconds_sum{worker="1",stage="capture"} 2.0',
+        'stage_seconds_count{worker="1",stage="capture"} 1',
+        "# TYPE running gauge",
+        'running{worker="0"} 1',
+        'running{worker="1"} 1',
+    ]
+
+
+def test_camera_labels_do_not_leak_to_the_next_task_of_an_executor_thread():
+    labels = lambda: (metrics.current_camera.get(), metrics.current_frame.get())
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(service._in_camera, "cam-1", 7, labels).result() == ("cam-1", 7)
+        assert executor.submit(labels).result() == ("unknown", None)
+
+        with pytest.raises(HTTPException):
+            executor.submit(service.process_image, None, {}, "cam-2").result()
+        assert executor.submit(labels).result() == ("unknown", None)
@@ -0,0 +1,29 @@
+from config import model_variants
+from utils.quantize import box_f1
+
+
+def test_variant_needs_gate_approval_of_the_same_artifact(tmp_path):
+    original = tmp_path / "colors.mnn"
+    original.write_bytes(b"fp32")
+    artifact = tmp_path / "colors-int8.mnn"
+    artifact.write_bytes(b"int8")
+    manifest = {}
+
+    def resolve():
+        return model_variants.resolve("color_classifier", str(original), "int8", manifest)
+
+    assert resolve().name == "fp32"
+    manifest["color_classifier:int8"] = {"approved": False, "score": 0.9, "threshold": 0.98}
+    assert resolve().name == "fp32"
+    manifest["color_classifier:int8"] = {"approved": True, "sha256": model_variants.file_hash(str(artifact))}
+    variant = resolve()
+    assert variant.name == "int8" and variant.path == str(artifact) and variant.precision == "low"
+    artifact.write_bytes(b"int8, rebuilt")
+    assert resolve().name == "fp32"
+
+
+def test_box_f1():
+    reference = [(2, (0, 0, 100, 100)), (7, (200, 0, 50, 50))]
+    assert box_f1(reference, [(2, (2, 1, 100, 98)), (7, (200, 0, 50, 50))]) == 1.0
+    assert box_f1(reference, [(2, (2, 1, 100, 98)), (5, (200, 0, 50, 50))]) == 0.5
+    assert box_f1([], []) == 1.0
@@ -0,0 +1,170 @@
+import multiprocessing
+import threading
+
+import pytest
+
+from benchmarks import fakes
+
+fakes.install_fake_kafka()
+
+from utils.outbox import Outbox, OutboxFull
+
+
+def test_rows_survive_restart_and_drain_in_order(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    first = Outbox(path)
+    for i in range(3):
+        first.enqueue("kafka", {"n": i})
+    first.enqueue("blob", {"name": "a.png"}, b"\x89PNG")
+
+    delivered = []
+    second = Outbox(path)
+    second.register("kafka", lambda items: delivered.extend(meta["n"] for meta, _ in items) or len(items))
+    second.register("blob", lambda items: len(items))
+    assert second.drain_once() == 4
+    assert delivered == [0, 1, 2]
+    assert second.stats()["pending"] == {} and second.stats()["bytes"] == 0
+
+
+def test_failing_sink_backs_off_without_blocking_others():
+    now = [0.0]
+    box = Outbox(":memory:", clock=lambda: now[0])
+    calls = []
+
+    def flaky(items):
+        calls.append(len(items))
+        return 1  # only the first item goes through
+
+    box.register("kafka", flaky)
+    box.register("blob", lambda items: len(items))
+    box.enqueue("kafka", {"n": 0})
+    box.enqueue("kafka", {"n": 1})
+    box.enqueue("blob", {"name": "a.png"}, b"x")
+    assert box.drain_once() == 2
+    assert box.drain_once() == 0 and calls == [2]  # backing off
+    now[0] = 1.0
+    assert box.drain_once() == 1 and calls == [2, 1]
+
+
+def test_trim_drops_droppable_rows_first():
+    box = Outbox(":memory:", max_bytes=200)
+    box.enqueue("kafka", {"keep": "x" * 50})
+    for i in range(5):
+        box.enqueue("kafka", {"update": "y" * 50}, droppable=True)
+    stats = box.stats()
+    assert stats["bytes"] <= 200 and stats["dropped"] >= 2
+    rows = box._db().execute("SELECT meta FROM outbox ORDER BY id").fetchall()
+    assert '"keep"' in rows[0][0]
+
+
+def test_full_outbox_never_drops_creates():
+    box = Outbox(":memory:", max_bytes=600)
+    box.enqueue("kafka", {"update": "u" * 40}, droppable=True)
+    box.enqueue("vehicle-create", {"create": 0}, b"i" * 200, optional_data=True)
+    box.enqueue("vehicle-create", {"create": 1}, b"i" * 200, optional_data=True)
+    # the update goes first, then the oldest image; both create rows stay
+    box.enqueue("vehicle-create", {"create": 2}, b"i" * 200, optional_data=True)
+    rows = box._db().execute("SELECT kind, meta, data IS NULL FROM outbox ORDER BY id").fetchall()
+    assert [(kind, stripped) for kind, _, stripped in rows] == [
+        ("vehicle-create", 1), ("vehicle-create", 0), ("vehicle-create", 0)
+    ]
+    stats = box.stats()
+    assert stats["dropped"] == 1 and stats["stripped"] == 1 and stats["bytes"] <= 600
+
+    # nothing droppable left: an update is skipped and does not cost the creates their images
+    assert box.enqueue("kafka", {"update": "u" * 400}, droppable=True) is False
+    assert box.stats()["stripped"] == 1
+    # a create strips the older images; one larger than the whole outbox is refused untouched
+    assert box.enqueue("vehicle-create", {"create": 3}, b"i" * 400, optional_data=True) is True
+    assert box.stats()["stripped"] == 3
+    with pytest.raises(OutboxFull):
+        box.enqueue("vehicle-create", {"create": 4}, b"i" * 600, optional_data=True)
+    stats = box.stats()
+    assert stats["stripped"] == 3
+    assert stats["refused"] == {"vehicle-create": 1}
+    assert stats["pending"] == {"vehicle-create": 4}
+
+
+def test_create_event_waits_for_its_image(monkeypatch):
+    from services import vehicle_processing_service as service
+
+    uploads, events = [], []
+    monkeypatch.setattr(service, "send_batch", lambda items: events.extend(m["value"] for m, _ in items) or len(items))
+
+    def upload(data, name, container):
+        if name == "b.png":
+            raise OSError("blob storage down")
+        uploads.append(name)
+
+    monkeypatch.setattr(service, "upload_bytes_to_azure", upload)
+    box = Outbox(":memory:")
+    box.register("vehicle-create", service._create_vehicles)
+    for name in ("a.png", "b.png"):
+        box.enqueue(
+            "vehicle-create",
+            {"topic": "vehicle-create", "value": {"imageUrl": name}, "blob": {"blob_name": name, "container_name": "images"}},
+            b"png",
+            optional_data=True,
+        )
+    assert box.drain_once() == 1
+    assert uploads == ["a.png"] and events == [{"imageUrl": "a.png"}]
+    assert box.stats()["pending"] == {"vehicle-create": 1}
+
+
+def _enqueue_rounds(path, conn):
+    # a worker that only enqueues, like every pre-fork worker but the first
+    box = Outbox(path, max_bytes=2000)
+    while conn.recv():
+        for i in range(10):
+            box.enqueue("kafka", {"update": "u" * 90}, droppable=True)
+        conn.send(box.stats()["dropped"])
+
+
+def test_workers_share_the_byte_total(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    drainer = Outbox(path, max_bytes=2000)
+    delivered = []
+    drainer.register("kafka", lambda items: delivered.extend(items) or len(items))
+    drainer.stats()
+
+    context = multiprocessing.get_context("fork")
+    parent, child = context.Pipe()
+    process = context.Process(target=_enqueue_rounds, args=(path, child), daemon=True)
+    process.start()
+    try:
+        # 50 rows of about 100 bytes go through a 2000 byte outbox, never more than 10 at once
+        for _ in range(5):
+            parent.send(True)
+            assert parent.poll(10) and parent.recv() == 0
+            while drainer.drain_once():
+                pass
+            assert drainer.stats()["bytes"] == 0
+        parent.send(False)
+        process.join(10)
+    finally:
+        if process.is_alive():
+            process.kill()
+    assert len(delivered) == 50 and drainer.stats()["dropped"] == 0
+
+
+def test_stop_does_not_drain_beside_a_busy_drainer():
+    box = Outbox(":memory:", poll_interval=0.01)
+    entered, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow(items):
+        calls.append([meta["n"] for meta, _ in items])
+        entered.set()
+        release.wait(5)
+        return len(items)
+
+    box.register("kafka", slow)
+    box.enqueue("kafka", {"n": 0})
+    box.start()
+    assert entered.wait(5)
+    box.stop(timeout=0.05)
+    assert calls == [[0]] and box.stats()["running"]
+
+    release.set()
+    box.stop(timeout=5)
+    assert calls == [[0]] and box.stats()["pending"] == {} and not box.stats()["running"]
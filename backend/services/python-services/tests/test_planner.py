@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+from benchmarks import fakes
+
+fakes.install_fake_kafka()
+
+from services import vehicle_processing_service as service
+from utils.planner import KNOWN_FRESH, TOO_SMALL, TOO_SMALL_FOR_DAMAGE, Planner
+
+
+def box(left, top, width, height):
+    return SimpleNamespace(left=left, top=top, width=width, height=height)
+
+
+def test_plan_by_size_and_known_vehicle():
+    now = [0.0]
+    planner = Planner(min_classify_side=32, min_damage_side=96, match_iou=0.8,
+                      damage_refresh=300, clock=lambda: now[0])
+    stored = [{"id": "a", "left": 100, "top": 100, "width": 200, "height": 150, "description": "dents"}]
+    detections = [box(0, 0, 20, 40), box(400, 0, 60, 60), box(102, 101, 200, 150), box(600, 300, 200, 200)]
+
+    plans = planner.plan(detections, stored, "cam")
+    assert [(p.classify, p.damage, p.reason) for p in plans] == [
+        (False, False, TOO_SMALL),
+        (True, False, TOO_SMALL_FOR_DAMAGE),
+        (True, True, None),  # known, but its damage result was never refreshed here
+        (True, True, None),
+    ]
+    assert plans[2].known is stored[0] and plans[3].known is None
+
+    planner.enriched("a")
+    assert planner.plan(detections[2:3], stored, "cam")[0].reason == KNOWN_FRESH
+    now[0] = 301.0
+    assert planner.plan(detections[2:3], stored, "cam")[0].damage
+
+    stats = planner.stats()
+    assert stats["planned"] == 6
+    assert stats["skipped"] == {TOO_SMALL: 1, TOO_SMALL_FOR_DAMAGE: 1, KNOWN_FRESH: 1}
+
+
+def test_small_box_is_kept_as_label_only_record():
+    class Detector:
+        def detect(self, image):
+            return [
+                SimpleNamespace(object="car", object_prob=0.9, left=10, top=10, width=20, height=18,
+                                make="", make_prob=0.0, color="", color_prob=0.0, features=(), crop_hash=None),
+                SimpleNamespace(object="truck", object_prob=0.8, left=100, top=100, width=200, height=150,
+                                make="", make_prob=0.0, color="", color_prob=0.0, features=(), crop_hash=None),
+            ]
+
+        def classify(self, image, detection, scope=None):
+            detection.make, detection.make_prob = "Volvo", 0.7
+            detection.color, detection.color_prob = "red", 0.6
+
+    models = {"vehicle": Detector(), "car_damage": fakes.FakeDamageModel()}
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    for side, small_make in ((0, "Volvo"), (32, service.UNCLASSIFIED)):
+        with mock.patch.object(service, "planner", Planner(min_classify_side=side)):
+            vehicles = service.process_image(frame, models, "cam")["vehicles"]
+        assert [(v.type, v.manufacturer) for v in vehicles] == [("car", small_make), ("truck", "Volvo")]
+    assert vehicles[0].embedding is None and TOO_SMALL in vehicles[0].description
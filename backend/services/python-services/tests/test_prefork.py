@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from utils import prefork
+
+
+def test_cameras_have_one_stable_owner_spread_over_workers():
+    cameras = [f"camera-{i}" for i in range(200)]
+    owners = [prefork.owner(camera, 4) for camera in cameras]
+
+    assert owners == [prefork.owner(camera, 4) for camera in cameras]
+    assert set(owners) == {0, 1, 2, 3}
+    assert max(owners.count(index) for index in range(4)) < 80
+
+
+def test_camera_scoped_paths():
+    assert prefork.CAMERA_PATH.match("/start/abc").group(1) == "abc"
+    assert prefork.CAMERA_PATH.match("/admin/profile/abc").group(1) == "abc"
+    assert prefork.JOB_PATH.match("/jobs/3-0f2a/events").group(1) == "3"
+
+
+def test_every_camera_scoped_request_goes_to_the_owner(monkeypatch):
+    monkeypatch.setattr(prefork, "worker", prefork.Worker(1, 4, (6001, 6002, 6003, 6004)))
+    owner = prefork.owner("abc", 4)
+    for path in ("/demo", "/demo_work", "/ingest", "/lookup", "/jobs/demo", "/jobs/demo_work", "/stream"):
+        assert prefork._destination(f"{path}/abc") == owner, path
+    assert prefork._destination("/jobs/2-0f2a") == 2
+    assert prefork._destination("/vehicle_index_stats") == prefork.INDEX_WORKER
+    assert prefork._destination("/compare_vehicles") is None
+    assert not prefork.holds_vehicle_index()
+    assert prefork.vehicle_index_url() == "http://127.0.0.1:6001/internal/vehicle_index"
+
+
+def test_internal_calls_only_on_the_loopback_port(monkeypatch):
+    monkeypatch.setattr(prefork, "worker", prefork.Worker(0, 2, (6001, 6002)))
+    prefork.internal_only(SimpleNamespace(scope={"server": ("127.0.0.1", 6001)}))
+    with pytest.raises(HTTPException):
+        prefork.internal_only(SimpleNamespace(scope={"server": ("0.0.0.0", 5000)}))
@@ -0,0 +1,49 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from utils import profiling
+from utils.profiling import ProfileSession
+
+
+def test_trace_uses_the_real_pid_and_names_the_camera():
+    session = ProfileSession("cam-1", trace=True)
+    session.record_span("detect", "cam-1", 1.0, 0.25)
+    session.record_span("detect", "cam-2", 1.0, 0.25)
+
+    events = session.trace_events()["traceEvents"]
+    spans = [e for e in events if e["ph"] == "X"]
+    assert len(spans) == 1
+    assert spans[0]["pid"] == os.getpid() and spans[0]["args"]["camera_id"] == "cam-1"
+    metadata = {e["name"]: e for e in events if e["ph"] == "M"}
+    assert metadata["process_name"]["args"]["name"] == "camera cam-1"
+    assert metadata["thread_name"]["tid"] == threading.get_ident()
+
+
+def test_cprofile_falls_back_to_sampling_without_per_thread_profilers(monkeypatch):
+    monkeypatch.setattr(profiling, "CPROFILE_PER_THREAD", False)
+    session = ProfileSession("cam-1", mode="cprofile")
+    assert session.mode == "sample" and session.requested_mode == "cprofile"
+    token = session.enter_thread("cam-1")
+    assert token[1] is None
+    session.leave_thread(token)
+
+
+def test_session_is_awaited_on_the_loop_and_frames_are_bounded():
+    with pytest.raises(ValueError):
+        ProfileSession("cam-1", frames=0)
+    with pytest.raises(ValueError):
+        ProfileSession("cam-1", frames=profiling.MAX_FRAMES + 1)
+
+    session = ProfileSession("cam-1", frames=2)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, session.frame_done, "cam-1")
+        loop.call_later(0.1, session.frame_done, "cam-1")
+        return await session.wait(5, poll=0.01)
+
+    assert asyncio.run(scenario()) is True and session.frames_seen == 2
+    assert asyncio.run(ProfileSession("cam-2").wait(0.05, poll=0.01)) is False
@@ -0,0 +1,49 @@
+import json
+
+import numpy as np
+
+from benchmarks import fakes
+from utils.records import VehicleRecord, json_default, plain, vehicle_field
+
+
+def _stored(seed=3):
+    """A vehicle dict as the data service returns it, with the record built from the same values."""
+    vehicle = fakes.synthetic_vehicles(1, seed=seed, with_damage=True, with_embedding=True)[0]
+    vehicle.update(id=0, description=str({"boxes": [], "confidences": [], "classes": []}))
+    (record,) = fakes.synthetic_records(1, seed=seed, with_damage=True, with_embedding=True)
+    record.description = vehicle["description"]
+    return vehicle, record
+
+
+def test_record_dict_has_the_data_service_shape():
+    vehicle, record = _stored()
+
+    assert record.to_dict() == vehicle
+    # the fields, in order, of the dicts process_image built before records
+    assert list(record.to_dict()) == [
+        "id", "cameraId", "type", "manufacturer", "color", "typeProb", "manufacturerProb", "colorProb",
+        "imageUrl", "description", "stayDuration", "top", "left", "width", "height", "latitude", "longitude",
+        "embedding", "details",
+    ]
+    for key in ("cameraId", "typeProb", "imageUrl", "latitude", "width", "details"):
+        assert vehicle_field(record, key) == vehicle_field(vehicle, key) == vehicle[key]
+
+
+def test_records_round_trip_through_json_like_dicts():
+    vehicle, record = _stored()
+    nested = {"vehicles": [record], "pair": (record, vehicle), "count": 1}
+
+    assert plain(nested) == {"vehicles": [vehicle], "pair": [vehicle, vehicle], "count": 1}
+    assert json.loads(json.dumps(nested, default=json_default)) == plain(nested)
+    # anything else json cannot encode becomes its string
+    assert json.loads(json.dumps({"score": np.float32(0.5)}, default=json_default)) == {"score": "0.5"}
+
+
+def test_optional_fields_are_left_out_or_defaulted():
+    record = VehicleRecord("cam-1", "car", "Kia", "red", 0.9, 0.8, 0.7, left=10, top=20, width=31, height=41)
+    vehicle = record.to_dict()
+
+    assert "details" not in vehicle and vehicle["embedding"] is None
+    assert vehicle["imageUrl"] == "none" and vehicle["description"] == "" and vehicle["stayDuration"] == 0
+    assert (vehicle["latitude"], vehicle["longitude"]) == (40.5, 25.5)
+    assert record.crop(np.zeros((100, 100, 3), dtype=np.uint8)).shape == (41, 31, 3)
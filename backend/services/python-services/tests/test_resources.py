@@ -0,0 +1,12 @@
+from config.resources import make_plan, parse_cores
+
+
+def test_partitions_split_the_budget():
+    plan = make_plan(cores=parse_cores("0-6"), workers=3)
+    assert plan.threads_per_worker == 2 and plan.executor_workers == 8
+    assert [plan.partition(i) for i in range(3)] == [(0, 1, 2), (3, 4), (5, 6)]
+    assert plan.partition(3) == plan.partition(0)
+
+    crowded = make_plan(cores=(4, 5), workers=3)
+    assert crowded.threads_per_worker == 1
+    assert [crowded.partition(i) for i in range(3)] == [(4,), (5,), (4,)]
@@ -0,0 +1,37 @@
+import asyncio
+
+from utils.scheduler import FrameScheduler
+
+
+async def _camera(scheduler, camera_id, stop, work_seconds):
+    while not stop.is_set():
+        if not await scheduler.acquire(camera_id, stop):
+            continue
+        try:
+            await asyncio.sleep(work_seconds)
+        finally:
+            scheduler.release(camera_id)
+
+
+async def _overload(seconds):
+    # three cameras want 0.03s of work every 0.04s from a single slot
+    scheduler = FrameScheduler(slots=1, protected_priority=2)
+    scheduler.register("entrance", period=0.04, priority=2)
+    scheduler.register("back_row_1", period=0.04, priority=0)
+    scheduler.register("back_row_2", period=0.04, priority=0)
+    stop = asyncio.Event()
+    loops = [asyncio.create_task(_camera(scheduler, c, stop, 0.03)) for c in list(scheduler.cameras)]
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(*loops)
+    return scheduler.stats()
+
+
+def test_overload_sheds_low_priority_frames_first():
+    stats = asyncio.run(_overload(1.0))
+    cameras = stats["cameras"]
+
+    assert stats["busy"] == 0
+    assert cameras["entrance"]["shed"] == 0
+    assert cameras["back_row_1"]["shed"] + cameras["back_row_2"]["shed"] > 0
+    assert cameras["entrance"]["frames"] > 2 * max(cameras["back_row_1"]["frames"], cameras["back_row_2"]["frames"])
@@ -0,0 +1,74 @@
+import asyncio
+import json
+import threading
+
+from utils import stream_hub as stream_hub_module
+from utils.stream_hub import StreamHub, sse_events
+
+
+def test_slow_subscriber_gets_only_the_latest_frame():
+    async def scenario():
+        hub = StreamHub()
+        slow, fast = hub.subscribe("cam-1"), hub.subscribe("cam-1")
+        hub.publish("cam-1", [{"n": 1}])
+        first = await fast.next(timeout=1)
+        hub.publish("cam-1", [{"n": 2}])
+        hub.publish("cam-1", [{"n": 3}])
+        return hub, slow, fast, first, await slow.next(timeout=1), await fast.next(timeout=1)
+
+    hub, slow, fast, first, slow_message, fast_message = asyncio.run(scenario())
+    assert json.loads(first)["frame"] == 1
+    assert json.loads(slow_message)["vehicles"] == [{"n": 3}] and slow.coalesced == 2
+    assert json.loads(fast_message)["frame"] == 3 and fast.coalesced == 1 and fast.delivered == 2
+    assert hub.stats()["cam-1"]["delivered"] == 3 and hub.stats()["cam-1"]["coalesced"] == 3
+
+
+def test_subscribers_are_removed_when_the_stream_ends(monkeypatch):
+    class Disconnecting:
+        def __init__(self):
+            self.checks = 0
+
+        async def is_disconnected(self):
+            self.checks += 1
+            return self.checks > 1
+
+    async def scenario():
+        hub = StreamHub()
+        subscriber = hub.subscribe("cam-1")
+        other = hub.subscribe("cam-2")
+        hub.publish("cam-1", [])
+        monkeypatch.setattr(stream_hub_module, "stream_hub", hub)
+        events = [event async for event in sse_events(Disconnecting(), subscriber, keep_alive=0.01)]
+        hub.unsubscribe(other)
+        hub.unsubscribe(other)  # a second unsubscribe is a no-op
+        return hub, events
+
+    hub, events = asyncio.run(scenario())
+    assert len(events) == 1 and events[0].startswith("data: ")
+    assert hub.stats() == {}
+    # frames are still numbered without subscribers
+    assert hub.publish("cam-1", []) == 2
+
+
+def test_publish_from_another_thread_is_delivered_on_the_loop():
+    async def scenario():
+        hub = StreamHub()
+        subscriber = hub.subscribe("cam-1")
+        loop_thread = threading.get_ident()
+        delivered_on = []
+        deliver = hub._deliver
+
+        def recording(*args):
+            delivered_on.append(threading.get_ident())
+            deliver(*args)
+
+        hub._deliver = recording
+        publisher = threading.Thread(target=hub.publish, args=("cam-1", [{"n": 1}]))
+        publisher.start()
+        publisher.join()
+        message = await subscriber.next(timeout=1)
+        return message, delivered_on, loop_thread
+
+    message, delivered_on, loop_thread = asyncio.run(scenario())
+    assert json.loads(message)["vehicles"] == [{"n": 1}]
+    assert delivered_on == [loop_thread]
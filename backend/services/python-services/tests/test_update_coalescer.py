@@ -0,0 +1,66 @@
+from unittest import mock
+
+from benchmarks import fakes
+
+fakes.install_fake_kafka()
+
+from utils import kafka_queue
+from utils.outbox import Outbox
+from utils.update_coalescer import UpdateCoalescer
+
+
+def _send(coalescer, vehicle):
+    reason = coalescer.check(vehicle)
+    if reason is not None:
+        coalescer.commit(vehicle, reason)
+    return reason
+
+
+def test_unchanged_vehicle_is_sent_on_heartbeat_only():
+    now = [0.0]
+    coalescer = UpdateCoalescer(position_tolerance=8, heartbeat=30, clock=lambda: now[0])
+    vehicle = {"id": "v1", "latitude": 100.0, "longitude": 200.0, "color": "white", "description": "{}"}
+
+    assert _send(coalescer, vehicle) == "new"
+    now[0] = 1.0
+    assert _send(coalescer, dict(vehicle, latitude=105.0)) is None
+    now[0] = 2.0
+    assert _send(coalescer, dict(vehicle, latitude=109.0)) == "moved"
+    now[0] = 3.0
+    assert _send(coalescer, dict(vehicle, latitude=109.0, description="dent")) == "changed"
+    now[0] = 20.0
+    assert _send(coalescer, dict(vehicle, latitude=109.0, description="dent")) is None
+    now[0] = 33.0
+    assert _send(coalescer, dict(vehicle, latitude=109.0, description="dent")) == "heartbeat"
+
+    stats = coalescer.stats()
+    assert stats["suppressed"] == 2 and stats["suppression_ratio"] == round(2 / 6, 4)
+
+
+def test_resized_box_is_sent():
+    coalescer = UpdateCoalescer(position_tolerance=8, size_tolerance=8, heartbeat=30, clock=lambda: 0.0)
+    vehicle = {"id": "v1", "latitude": 100.0, "longitude": 200.0, "width": 80, "height": 40}
+
+    assert _send(coalescer, vehicle) == "new"
+    assert _send(coalescer, dict(vehicle, width=86)) is None
+    # same center, the box grew: e.g. the vehicle is no longer partly hidden
+    assert _send(coalescer, dict(vehicle, width=120, height=60)) == "moved"
+    assert _send(coalescer, dict(vehicle, width=120, height=60)) is None
+
+
+def test_dropped_update_is_not_recorded_as_sent():
+    coalescer = UpdateCoalescer(heartbeat=30, clock=lambda: 0.0)
+    vehicle = {"id": "v1", "cameraId": "cam", "latitude": 100.0, "longitude": 200.0, "color": "white"}
+    # room for nothing: the droppable update does not fit
+    full = Outbox(":memory:", max_bytes=10)
+    with mock.patch.object(kafka_queue, "update_coalescer", coalescer), mock.patch.object(
+        kafka_queue, "outbox", full
+    ):
+        assert kafka_queue.update_vehicle(vehicle) is False
+        assert coalescer.check(vehicle) == "new"
+    with mock.patch.object(kafka_queue, "update_coalescer", coalescer), mock.patch.object(
+        kafka_queue, "outbox", Outbox(":memory:")
+    ):
+        assert kafka_queue.update_vehicle(vehicle) is True
+        assert kafka_queue.update_vehicle(vehicle) is False
+    assert coalescer.stats()["sent"]["new"] == 1
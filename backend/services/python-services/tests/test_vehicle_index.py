@@ -0,0 +1,125 @@
+import json
+from unittest import mock
+
+import httpx
+import numpy as np
+
+from benchmarks import fakes
+
+fakes.install_fake_kafka()
+
+from services import vehicle_processing_service as service
+from utils.vehicle_index import RemoteVehicleIndex, VehicleIndex, serve_call
+
+
+def _unit(rng, n, dim=128):
+    x = rng.standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def test_query_finds_neighbour_after_training():
+    rng = np.random.default_rng(0)
+    vectors = _unit(rng, 3000)
+    index = VehicleIndex(nlist=16, nprobe=4, train_size=1000)
+    for i, v in enumerate(vectors):
+        index.insert(f"v{i}", v, f"cam{i % 3}")
+    assert index.stats()["trained"]
+    hits = index.query(vectors[42], top_k=3, threshold=0.5)
+    assert hits[0]["key"] == "v42" and hits[0]["cameraId"] == "cam0"
+    assert index.query(vectors[42], exclude_camera="cam0", threshold=0.9) == []
+
+
+def test_entries_expire_and_reinsert_refreshes():
+    now = [0.0]
+    rng = np.random.default_rng(1)
+    vectors = _unit(rng, 10)
+    index = VehicleIndex(ttl=5, evict_interval=0, clock=lambda: now[0])
+    for i, v in enumerate(vectors):
+        index.insert(i, v, "cam")
+    now[0] = 4.0
+    index.insert(3, vectors[3], "cam")
+    now[0] = 6.0
+    assert index.evict() == 9
+    assert len(index) == 1
+    assert index.query(vectors[3], top_k=1)[0]["key"] == 3
+
+
+def test_new_vehicle_is_found_from_another_camera():
+    index = VehicleIndex()
+    stored = fakes.synthetic_vehicles(1, seed=7)
+    frame = fakes.synthetic_frame(boxes=1)
+    models = {"image_blur": fakes.FakeImageBlur()}
+    stack, _ = fakes.patch_service(service, stored)
+    with stack, mock.patch.object(service, "vehicle_index", index):
+        car = fakes.synthetic_records(1, seed=8, with_embedding=True)[0]
+        car.type = "bus-not-stored"
+        first = service.compare_all_vehicles_from_db("Bearer t", [car], models, frame, "camA", stored)
+        assert first == []
+        hit = index.query(service.embedding.decode(car.embedding), top_k=1)[0]
+        assert hit["key"] == f"provisional:{car.image_url}" and hit["cameraId"] == "camA"
+
+        # the same car on another camera: reported next to the matches, not among them
+        again = fakes.synthetic_records(1, seed=8, with_embedding=True)[0]
+        again.type = "bus-not-stored"
+        sightings = []
+        output = service.compare_all_vehicles_from_db(
+            "Bearer t", [again], models, frame, "camB", stored, sightings=sightings
+        )
+        assert output == []
+        assert sightings[0]["seen_on"][0]["cameraId"] == "camA"
+
+        # once stored with its id, the provisional entry is replaced
+        created = dict(car.to_dict(), id="v-new")
+        service.record_sighting(created, "camA")
+        keys = [h["key"] for h in index.query(service.embedding.decode(car.embedding), top_k=5)]
+        assert "v-new" in keys and f"provisional:{car.image_url}" not in keys
+
+
+def test_remote_index_calls_the_held_index():
+    index = VehicleIndex()
+    served = []
+
+    def handler(request):
+        op = request.url.path.rsplit("/", 1)[1]
+        served.append(op)
+        return httpx.Response(200, json=serve_call(index, op, json.loads(request.content)))
+
+    remote = RemoteVehicleIndex(
+        "http://worker-0/internal/vehicle_index", client=httpx.Client(transport=httpx.MockTransport(handler))
+    )
+    vectors = _unit(np.random.default_rng(3), 2)
+    remote.insert(7, vectors[0], "cam1", meta={"color": "red"})
+    remote.insert("provisional:a.png", vectors[1], "cam1")
+    remote.update([("provisional:b.png", vectors[1], "cam1", None)], removed=["provisional:a.png"])
+    remote.remove("provisional:b.png")
+
+    hits = remote.query(vectors[0], top_k=2, threshold=0.9, exclude_camera="cam2")
+    assert [(hit["key"], hit["cameraId"], hit["meta"]) for hit in hits] == [(7, "cam1", {"color": "red"})]
+    assert remote.stats()["size"] == 1 and len(index) == 1
+    assert served == ["insert", "insert", "update", "remove", "query", "stats"]
+
+
+def test_remote_index_failures_find_nothing():
+    remote = RemoteVehicleIndex(
+        "http://worker-0/internal/vehicle_index",
+        client=httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(503))),
+    )
+    remote.insert(1, _unit(np.random.default_rng(4), 1)[0], "cam1")
+    assert remote.query(_unit(np.random.default_rng(4), 1)[0]) == []
+
+
+def test_frame_sightings_are_indexed_in_one_call():
+    index = VehicleIndex()
+    stored = fakes.synthetic_vehicles(1, seed=7)
+    frame = fakes.synthetic_frame(boxes=1)
+    cars = fakes.synthetic_records(3, seed=9, with_embedding=True)
+    for car in cars:
+        car.type = "bus-not-stored"
+    stack, _ = fakes.patch_service(service, stored)
+    with stack, mock.patch.object(service, "vehicle_index", index), mock.patch.object(
+        index, "update", wraps=index.update
+    ) as update:
+        service.compare_all_vehicles_from_db(
+            "Bearer t", cars, {"image_blur": fakes.FakeImageBlur()}, frame, "camA", stored
+        )
+    assert update.call_count == 1 and len(index) == 3
@@ -0,0 +1,183 @@
+"""
+Admission control for the inference HTTP endpoints.
+
+Handlers hand their blocking work to the gate instead of running it on the
+event loop. At most `limit` calls run at once, on executor threads; up to
+`queue` more wait for a slot. A request arriving with the queue full is
+refused with 429, and one that waited `max_wait` seconds without a slot with
+503. Both carry a Retry-After estimated from the recent call times, so the
+loop stays free for control endpoints (/stop, /health, /metrics) however
+many uploads arrive.
+
+The camera loops take their inference calls from the same slots
+(run_scheduled), so HTTP requests, jobs, ingest and cameras together never
+run more than `limit` inferences, the inference workers of the CPU plan.
+
+Calls given the same `key` while one is in flight are coalesced: the later
+callers wait for the running call and get its result (or its error) instead
+of starting another, e.g. several clients asking for a camera capture at the
+same time. The shared call runs in its own task, so a cancelled caller (the
+first one included) only stops waiting. An executor thread cannot be
+interrupted: a call keeps its slot until the thread returned, whoever still
+waits for it.
+
+All methods run on the event loop; there is no locking.
+"""
+import asyncio
+import hashlib
+import math
+import os
+import time
+from functools import partial
+
+from fastapi import HTTPException
+
+from config import resources
+
+
+def content_key(*parts):
+    """Coalescing key of a request from its payloads (bytes or str)."""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class AdmissionGate:
+    def __init__(self, limit=None, queue=8, max_wait=30.0, smoothing=0.2, clock=time.monotonic):
+        """
+        :param limit: calls running at the same time, the inference workers of the
+                      CPU plan (config.resources) when None
+        :param queue: calls waiting for a slot before new ones are refused (429)
+        :param max_wait: seconds a call may wait for a slot before it is refused (503)
+        :param smoothing: weight of the last call in the moving average of call times
+        :param clock: time source, seconds
+        """
+        self.limit = limit
+        self.queue = queue
+        self.max_wait = max_wait
+        self.smoothing = smoothing
+        self.clock = clock
+        self.running = 0
+        self.waiting = 0
+        self.call_seconds = 0.0
+        self._slots = None
+        self._inflight = {}  # key -> future of the running call
+        self.counts = {"admitted": 0, "scheduled": 0, "coalesced": 0, "queue_full": 0, "timed_out": 0}
+
+    def retry_after(self):
+        """Seconds after which a refused request may find a slot."""
+        backlog = (self.waiting + self.running + 1) / max(self.limit or 1, 1)
+        return max(1, math.ceil(backlog * self.call_seconds))
+
+    def _refuse(self, status_code, reason, detail):
+        self.counts[reason] += 1
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+    async def run(self, fn, *args, key=None):
+        """
+        Run fn(*args) on an executor thread once admitted.
+
+        :param key: requests with equal keys share one call while it runs
+        :return: fn's result
+        :raises HTTPException: 429 when the queue is full, 503 after max_wait
+        """
+        if key is None:
+            return await self._admit(fn, args)
+        task = self._inflight.get(key)
+        if task is None:
+            # the shared call belongs to no caller: cancelling one of them leaves it running for the others
+            task = asyncio.ensure_future(self._admit(fn, args))
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._call_done, key))
+        else:
+            self.counts["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def _call_done(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # retrieved here in case every caller was cancelled
+            task.exception()
+
+    async def run_waiting(self, fn, *args, key=None):
+        """
+        Like run, for bulk work (jobs, ingest): a call refused because inference
+        is saturated waits its Retry-After and tries again instead of failing.
+        """
+        while True:
+            try:
+                return await self.run(fn, *args, key=key)
+            except HTTPException as e:
+                if e.status_code not in (429, 503):
+                    raise
+                await asyncio.sleep(int((e.headers or {}).get("Retry-After", "1")))
+
+    def _semaphore(self):
+        if self._slots is None:
+            # resolved on first use, after the plan of a pre-fork worker is set
+            self.limit = self.limit or resources.plan.workers
+            self._slots = asyncio.Semaphore(self.limit)
+        return self._slots
+
+    async def _admit(self, fn, args):
+        slots = self._semaphore()
+        if slots.locked() and self.waiting >= self.queue:
+            self._refuse(429, "queue_full", "Too many requests are waiting for inference.")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(slots.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            self._refuse(503, "timed_out", "Inference is overloaded, no slot became free in time.")
+        finally:
+            self.waiting -= 1
+        self.counts["admitted"] += 1
+        return await self._call(fn, args)
+
+    async def run_scheduled(self, fn, *args):
+        """
+        Run fn(*args) in one of the same slots, for work already scheduled
+        elsewhere (the camera loops, utils.scheduler): it waits as long as it
+        takes, is never refused and does not count against the queue.
+        """
+        await self._semaphore().acquire()
+        self.counts["scheduled"] += 1
+        return await self._call(fn, args)
+
+    async def _call(self, fn, args):
+        self.running += 1
+        call = asyncio.get_running_loop().run_in_executor(None, partial(fn, *args))
+        # the slot is held until the thread finished, even when the caller is cancelled before
+        call.add_done_callback(partial(self._release, self.clock()))
+        return await asyncio.shield(call)
+
+    def _release(self, started, call):
+        seconds = self.clock() - started
+        self.call_seconds = seconds if not self.call_seconds else (
+            self.smoothing * seconds + (1 - self.smoothing) * self.call_seconds
+        )
+        self.running -= 1
+        self._slots.release()
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "running": self.running,
+            "waiting": self.waiting,
+            "mean_call_seconds": round(self.call_seconds, 4),
+            **self.counts,
+        }
+
+
+inference_gate = AdmissionGate(
+    limit=int(os.getenv("INFERENCE_CONCURRENCY", "0")) or None,
+    queue=int(os.getenv("INFERENCE_QUEUE", "8")),
+    max_wait=float(os.getenv("INFERENCE_MAX_WAIT", "30")),
+)
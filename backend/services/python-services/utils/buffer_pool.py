@@ -0,0 +1,51 @@
+"""
+Reusable preprocessing buffers for the detectors and classifiers.
+
+Model inputs have a fixed shape (224x224 crops for the classifiers, 640x640
+blobs for damage detection), so instead of allocating them on every
+inference the preprocessing writes into buffers taken from this pool
+(`dst=`/`out=` arguments). Buffers are per thread, because the work loops
+and ingest run inference on executor threads, and keyed by a name plus shape
+and dtype; a caller must be done with a buffer before asking for the same
+key again on the same thread.
+"""
+import threading
+
+import numpy as np
+
+
+class BufferPool:
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.reuses = 0
+        self.bytes = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        """
+        Buffer for `name` of the given shape and dtype, uninitialized on first use.
+
+        :param name: purpose of the buffer, e.g. "classifier_input"
+        :return: numpy array owned by the pool, valid until the next get() of the same key
+        """
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        key = (name, tuple(shape), np.dtype(dtype).str)
+        buffer = buffers.get(key)
+        if buffer is None:
+            buffer = buffers[key] = np.empty(shape, dtype=dtype)
+            with self._lock:
+                self.allocations += 1
+                self.bytes += buffer.nbytes
+        else:
+            # counted without the lock, an approximate figure is enough here
+            self.reuses += 1
+        return buffer
+
+    def stats(self):
+        return {"allocations": self.allocations, "reuses": self.reuses, "bytes": self.bytes}
+
+
+buffer_pool = BufferPool()
@@ -0,0 +1,141 @@
+"""
+Result cache for vehicle crops that do not change between frames.
+
+Parked vehicles give nearly identical crops on every frame. Entries are keyed
+by a coarse grid cell of the bounding box (scope, e.g. camera, plus quantized
+center and size) and matched on a 64-bit difference hash (dHash) of the crop:
+a lookup hits when an entry in the same or a neighbouring cell has a hash
+within `max_distance` bits. Each entry holds a dict of results per
+namespace ("classify", "damage"), so different stages can reuse the same crop.
+
+Bounded LRU with a TTL; a stale entry is never returned.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def dhash(crop, size=8):
+    """64-bit difference hash of a BGR or grayscale crop."""
+    gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class CropCache:
+    def __init__(self, max_entries=4096, ttl=30.0, max_distance=4, grid=32, clock=time.monotonic):
+        """
+        :param max_entries: entries kept before the least recently used is evicted
+        :param ttl: seconds an entry can be reused after it was stored
+        :param max_distance: maximum Hamming distance between crop hashes for a hit
+        :param grid: bounding box quantization in pixels
+        :param clock: time source, seconds
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.grid = grid
+        self.clock = clock
+        self._entries = OrderedDict()  # id -> (cell, hash, stored_at, results)
+        self._cells = {}  # cell -> set of entry ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hash_crop(self, crop):
+        """dhash() of a crop, or None for an empty crop."""
+        return dhash(crop) if crop.size else None
+
+    def _cell(self, scope, box):
+        left, top, width, height = (int(v) for v in box)
+        g = self.grid
+        return (scope, (left + width // 2) // g, (top + height // 2) // g, width // g, height // g)
+
+    def _neighbours(self, cell):
+        scope, cx, cy, w, h = cell
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                yield (scope, cx + dx, cy + dy, w, h)
+
+    def _drop(self, entry_id):
+        cell = self._entries.pop(entry_id)[0]
+        ids = self._cells.get(cell)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._cells[cell]
+
+    def lookup(self, scope, box, crop_hash, namespace):
+        """
+        Cached results of a similar crop at about the same place.
+
+        :param scope: key isolating unrelated crops, e.g. the camera id
+        :param box: (left, top, width, height) of the crop in the frame
+        :param crop_hash: dhash() of the crop
+        :param namespace: results namespace, e.g. "classify"
+        :return: the stored results, or None
+        """
+        now = self.clock()
+        with self._lock:
+            for cell in self._neighbours(self._cell(scope, box)):
+                for entry_id in list(self._cells.get(cell, ())):
+                    _, stored_hash, stored_at, results = self._entries[entry_id]
+                    if now - stored_at > self.ttl:
+                        self._drop(entry_id)
+                        continue
+                    if namespace in results and bin(stored_hash ^ crop_hash).count("1") <= self.max_distance:
+                        self._entries.move_to_end(entry_id)
+                        self.hits += 1
+                        return results[namespace]
+            self.misses += 1
+            return None
+
+    def store(self, scope, box, crop_hash, namespace, value):
+        """Store results for a crop, merging with an entry for the same crop if there is one."""
+        now = self.clock()
+        cell = self._cell(scope, box)
+        with self._lock:
+            for entry_id in self._cells.get(cell, ()):
+                entry_cell, stored_hash, stored_at, results = self._entries[entry_id]
+                if stored_hash == crop_hash and now - stored_at <= self.ttl:
+                    results[namespace] = value
+                    self._entries.move_to_end(entry_id)
+                    return
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (cell, crop_hash, now, {namespace: value})
+            self._cells.setdefault(cell, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._cells.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+crop_cache = CropCache(
+    max_entries=int(os.getenv("CROP_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("CROP_CACHE_TTL", "30")),
+    max_distance=int(os.getenv("CROP_CACHE_MAX_DISTANCE", "4")),
+)
@@ -0,0 +1,129 @@
+"""
+Appearance embeddings used to re-identify vehicles between frames.
+
+The make and color classifiers expose their penultimate-layer features
+(classifier.Classifier.predict(..., with_embedding=True)). Those features are
+reduced here to a compact vector: a fixed, seeded random projection to
+EMBEDDING_DIM dimensions, L2-normalized and stored as base64 float16 in the
+vehicle's "embedding" field (256 bytes for 128 dimensions).
+
+The projection seed and dimension are part of the stored format; changing
+them makes previously stored embeddings incomparable (they are then ignored).
+"""
+import base64
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+from utils.records import vehicle_field
+
+EMBEDDING_DIM = 128
+PROJECTION_SEED = 1729
+
+_projections = {}
+_projections_lock = threading.Lock()
+
+
+def _projection(input_dim):
+    matrix = _projections.get(input_dim)
+    if matrix is None:
+        with _projections_lock:
+            matrix = _projections.get(input_dim)
+            if matrix is None:
+                rng = np.random.default_rng(PROJECTION_SEED + input_dim)
+                matrix = rng.standard_normal((input_dim, EMBEDDING_DIM)).astype(np.float32)
+                matrix /= np.sqrt(EMBEDDING_DIM)
+                _projections[input_dim] = matrix
+    return matrix
+
+
+def _normalize(vector):
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else None
+
+
+def compact(*features):
+    """
+    Combine classifier features into one compact float16 unit vector.
+
+    :param features: 1-d feature arrays (None entries are skipped)
+    :return: float16 array of EMBEDDING_DIM values, or None without features
+    """
+    parts = []
+    for feature in features:
+        if feature is None:
+            continue
+        # each classifier contributes equally whatever its activation scale
+        normalized = _normalize(np.asarray(feature, dtype=np.float32).ravel())
+        if normalized is not None:
+            parts.append(normalized)
+    if not parts:
+        return None
+    joined = np.concatenate(parts)
+    projected = _normalize(joined @ _projection(joined.shape[0]))
+    return None if projected is None else projected.astype(np.float16)
+
+
+def encode(vector):
+    """Base64 text of a float16 embedding, as stored with the vehicle."""
+    if vector is None:
+        return None
+    return base64.b64encode(np.asarray(vector, dtype="<f2").tobytes()).decode("ascii")
+
+
+@lru_cache(maxsize=8192)
+def decode(text):
+    """
+    Float32 unit vector from the stored text, or None when missing or invalid.
+    Results are cached, stored vehicles are decoded again on every frame.
+    """
+    if not text or not isinstance(text, str):
+        return None
+    try:
+        vector = np.frombuffer(base64.b64decode(text, validate=True), dtype="<f2")
+    except (ValueError, TypeError):
+        return None
+    if vector.shape[0] != EMBEDDING_DIM:
+        return None
+    vector = _normalize(vector.astype(np.float32))
+    if vector is not None:
+        vector.setflags(write=False)
+    return vector
+
+
+def similarity(text1, text2):
+    """Cosine similarity of two stored embeddings, None unless both are present."""
+    v1, v2 = decode(text1), decode(text2)
+    if v1 is None or v2 is None:
+        return None
+    return float(v1 @ v2)
+
+
+def matrix(vehicles):
+    """
+    Stacked embeddings of a list of vehicle dicts or records.
+
+    :return: (float32 array (n, EMBEDDING_DIM) with zero rows for vehicles
+              without an embedding, bool array (n,) marking the present ones)
+    """
+    rows = np.zeros((len(vehicles), EMBEDDING_DIM), dtype=np.float32)
+    present = np.zeros(len(vehicles), dtype=bool)
+    for i, vehicle in enumerate(vehicles):
+        vector = decode(vehicle_field(vehicle, "embedding"))
+        if vector is not None:
+            rows[i] = vector
+            present[i] = True
+    return rows, present
+
+
+def similarity_matrix(db_vehicles, detected_vehicles):
+    """
+    Cosine similarity of every stored x detected pair with one matrix product.
+
+    :return: (similarities (n, m), 0 where either has no embedding,
+              bool mask (n, m) of pairs where both have embeddings)
+    """
+    db_rows, db_present = matrix(db_vehicles)
+    img_rows, img_present = matrix(detected_vehicles)
+    return db_rows @ img_rows.T, db_present[:, None] & img_present[None, :]
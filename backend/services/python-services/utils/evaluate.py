@@ -0,0 +1,359 @@
+"""
+Offline evaluation of the recognition and damage models on labelled datasets.
+
+Images are fanned out over a process pool with one preloaded model per worker.
+Each result is appended to a JSONL file as soon as it is ready, statistics are
+updated incrementally, and re-running with the same output file resumes where
+the previous run stopped.
+
+Run from services/python-services:
+    python -m utils.evaluate vehicle <dataset_dir> --out vehicle.jsonl --workers 8
+    python -m utils.evaluate damage <damaged_dir> <whole_dir> --count 500 --out damage.jsonl
+    python -m utils.evaluate summary vehicle.jsonl [--plot]
+    python -m utils.evaluate faces face_answers.txt
+
+Vehicle images are labelled through their file name:
+    <manufacturer>$$<...>$$<...>$$<color>$$....jpg
+"""
+import argparse
+import ast
+import json
+import multiprocessing
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from config import resources
+
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tiff", ".webp")
+
+# Preloaded in each worker process by _init_worker
+_model = None
+
+
+def _init_worker(task, plan, started):
+    """
+    Load the model of a worker process, its libraries limited to the process's
+    share of the CPU plan (config.resources) instead of a thread per core each.
+
+    :param plan: ResourcePlan with one inference worker per process
+    :param started: shared counter numbering the processes, for pinning
+    """
+    global _model
+    resources.apply_libraries(plan.threads_per_worker)
+    if plan.pin:
+        with started.get_lock():
+            index = started.value
+            started.value += 1
+        resources.pin_current_thread(plan.partition(index))
+    if task == "vehicle":
+        sys.path.append(os.path.join(BASE_PATH, "vehicle-recognition-api-yolov4-python-master"))
+        from vehicle_detection import VehicleRecognitionModel, get_items
+
+        _model = VehicleRecognitionModel(*get_items(), num_threads=plan.threads_per_worker)
+    elif task == "damage":
+        sys.path.append(os.path.join(BASE_PATH, "Damaged-Car-parts-prediction-Model"))
+        from car_parts import set_detection
+
+        _model = set_detection()
+    else:
+        raise ValueError(f"Unknown task {task}")
+
+
+def _eval_vehicle(item):
+    path = item["path"]
+    record = {"task": "vehicle", "path": path, "expected": item["expected"]}
+    try:
+        vehicles = _model.objectDetect(path).get("vehicles")
+        if not vehicles:
+            record["error"] = "no vehicle detected"
+            return record
+        output = vehicles[0]
+        record["make"] = {
+            "predicted": output.make,
+            "prob": output.make_prob,
+            "correct": output.make.lower() == item["expected"]["make"].lower(),
+        }
+        record["color"] = {
+            "predicted": output.color,
+            "prob": output.color_prob,
+            "correct": output.color.lower() == item["expected"]["color"].lower(),
+        }
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+
+def _eval_damage(item):
+    import cv2
+
+    path = item["path"]
+    record = {"task": "damage", "path": path, "expected": item["expected"]}
+    try:
+        image = cv2.imread(path)
+        if image is None:
+            raise ValueError("unreadable image")
+        output = _model(image)
+        classes = output.get("classes", [])
+        confidences = [float(c) for c in output.get("confidences", [])]
+        found = len(classes) > 0
+        record["damage"] = {
+            "predicted": found,
+            "classes": classes,
+            "confidences": confidences,
+            # detection confidences are 0-100, probabilities in the summary are 0-1
+            "prob": max(confidences) / 100.0 if confidences else 0.0,
+            "correct": found == item["expected"]["damaged"],
+        }
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+
+TASKS = {"vehicle": _eval_vehicle, "damage": _eval_damage}
+
+
+class RunningStats:
+    """Counts and mean confidences per evaluated field, updated one record at a time."""
+
+    def __init__(self):
+        self.fields = {}
+        self.errors = 0
+        self.total = 0
+
+    def add(self, record):
+        self.total += 1
+        if "error" in record:
+            self.errors += 1
+            return
+        for field in ("make", "color", "damage"):
+            result = record.get(field)
+            if result is None:
+                continue
+            stats = self.fields.setdefault(
+                field,
+                {"correct": 0, "incorrect": 0, "mean_prob": 0.0,
+                 "mean_correct_prob": 0.0, "mean_incorrect_prob": 0.0},
+            )
+            key = "correct" if result["correct"] else "incorrect"
+            stats[key] += 1
+            n = stats["correct"] + stats["incorrect"]
+            prob = result["prob"]
+            stats["mean_prob"] += (prob - stats["mean_prob"]) / n
+            mean_key = f"mean_{key}_prob"
+            stats[mean_key] += (prob - stats[mean_key]) / stats[key]
+
+    def summary(self):
+        fields = {}
+        for field, stats in self.fields.items():
+            n = stats["correct"] + stats["incorrect"]
+            fields[field] = dict(stats, accuracy=round(stats["correct"] / n, 4) if n else 0.0)
+        return {"total": self.total, "errors": self.errors, "fields": fields}
+
+
+def vehicle_items(location):
+    for subdir, _, files in os.walk(location):
+        for file in sorted(files):
+            if os.path.splitext(file)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            name = os.path.basename(file).split("$$")
+            if len(name) < 4:
+                continue
+            yield {
+                "path": os.path.join(subdir, file),
+                "expected": {"make": name[0], "color": name[3]},
+            }
+
+
+def damage_items(damaged_folder, whole_folder, count=100, seed=0):
+    def image_files(folder):
+        return sorted(
+            os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+
+    # a fixed seed keeps the sample identical between a run and its resume
+    rng = random.Random(seed)
+    damaged = image_files(damaged_folder)
+    whole = image_files(whole_folder)
+    for path in rng.sample(damaged, min(count, len(damaged))):
+        yield {"path": path, "expected": {"damaged": True}}
+    for path in rng.sample(whole, min(count, len(whole))):
+        yield {"path": path, "expected": {"damaged": False}}
+
+
+def read_results(path):
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # a line cut short by an interrupted run; the image is simply redone
+                continue
+
+
+def evaluate(task, items, out_path, workers=None, progress_every=500):
+    """
+    Evaluate items with a pool of workers, appending JSONL records to out_path.
+
+    :param task: "vehicle" or "damage"
+    :param items: iterable of dicts with "path" and "expected"
+    :param out_path: JSONL results file; records already present are skipped
+    :param workers: number of processes (defaults to the cores of the CPU budget)
+    :return: summary dict
+    """
+    stats = RunningStats()
+    done = set()
+    for record in read_results(out_path):
+        if record.get("task") == task:
+            done.add(record["path"])
+            stats.add(record)
+    pending = (item for item in items if item["path"] not in done)
+    if done:
+        print(f"Resuming: {len(done)} results already in {out_path}")
+    if os.path.exists(out_path) and os.path.getsize(out_path):
+        with open(out_path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                # terminate a line cut short by an interrupted run
+                f.write(b"\n")
+
+    workers = workers or len(resources.plan.cores)
+    # the processes split the cores of the service's CPU budget between them
+    plan = resources.make_plan(workers=workers, cores=resources.plan.cores, pin=resources.plan.pin)
+    window = workers * 4
+    started = time.perf_counter()
+    processed = 0
+    # line buffered, so an interrupted run loses at most the line being written
+    with open(out_path, "a", encoding="utf-8", buffering=1) as out, ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(task, plan, multiprocessing.Value("i", 0))
+    ) as pool:
+        in_flight = set()
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < window:
+                item = next(pending, None)
+                if item is None:
+                    exhausted = True
+                    break
+                in_flight.add(pool.submit(TASKS[task], item))
+            if not in_flight:
+                break
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                out.write(json.dumps(record) + "\n")
+                stats.add(record)
+                processed += 1
+                if processed % progress_every == 0:
+                    rate = processed / (time.perf_counter() - started)
+                    print(f"{stats.total} evaluated ({rate:.1f} images/s)")
+    summary = stats.summary()
+    with open(out_path + ".summary.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def summarize(out_path):
+    stats = RunningStats()
+    for record in read_results(out_path):
+        stats.add(record)
+    return stats.summary()
+
+
+def plot_summary(summary, field):
+    import matplotlib.pyplot as plt
+
+    stats = summary["fields"][field]
+    _, axs = plt.subplots(2, 1, figsize=(8, 10))
+
+    axs[0].bar(["Correct", "Incorrect"], [stats["correct"], stats["incorrect"]], color=["green", "red"])
+    axs[0].set_title(f"{field}: Correct vs Incorrect Predictions")
+    axs[0].set_ylabel("Count")
+
+    axs[1].bar(
+        ["Average", "Correct Avg", "Incorrect Avg"],
+        [stats["mean_prob"], stats["mean_correct_prob"], stats["mean_incorrect_prob"]],
+        color=["blue", "green", "red"],
+    )
+    axs[1].set_title("Average Probabilities")
+    axs[1].set_ylabel("Probability")
+
+    plt.tight_layout()
+    plt.show()
+
+
+def face_summary(file_path):
+    """Totals of 'got only X/Y' entries in a face detection answers file: (total, found)."""
+    total = 0
+    found = 0
+    pattern = re.compile(r"got only (\d+)/(\d+)")
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip().rstrip(",")
+            if not line:
+                continue
+            try:
+                entry = ast.literal_eval(line)
+            except Exception as e:
+                print(f"Skipping line due to error: {e}")
+                continue
+            if isinstance(entry, dict) and entry:
+                match = pattern.search(str(list(entry.values())[0]))
+                if match:
+                    x, y = map(int, match.groups())
+                    total += y
+                    found += x
+    return total, found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline model evaluation.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    vehicle = sub.add_parser("vehicle", help="make/color recognition on a labelled folder")
+    vehicle.add_argument("location")
+    vehicle.add_argument("--out", default="vehicle_results.jsonl")
+    vehicle.add_argument("--workers", type=int)
+
+    damage = sub.add_parser("damage", help="damage detection on damaged/whole folders")
+    damage.add_argument("damaged")
+    damage.add_argument("whole")
+    damage.add_argument("--count", type=int, default=100)
+    damage.add_argument("--seed", type=int, default=0)
+    damage.add_argument("--out", default="damage_results.jsonl")
+    damage.add_argument("--workers", type=int)
+
+    summary = sub.add_parser("summary", help="statistics of an existing results file")
+    summary.add_argument("results")
+    summary.add_argument("--plot", choices=["make", "color", "damage"])
+
+    faces = sub.add_parser("faces", help="face detection totals from an answers file")
+    faces.add_argument("answers")
+
+    args = parser.parse_args(argv)
+    if args.command == "vehicle":
+        result = evaluate("vehicle", vehicle_items(args.location), args.out, args.workers)
+    elif args.command == "damage":
+        items = damage_items(args.damaged, args.whole, args.count, args.seed)
+        result = evaluate("damage", items, args.out, args.workers)
+    elif args.command == "summary":
+        result = summarize(args.results)
+        if args.plot:
+            plot_summary(result, args.plot)
+    else:
+        total, found = face_summary(args.answers)
+        result = {"total": total, "found": found, "rate": round(found / total, 4) if total else 0.0}
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
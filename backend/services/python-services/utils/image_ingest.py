@@ -0,0 +1,77 @@
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+FRAME_SIZE = (1280, 720)
+
+# (scale, flag) from most to least reduced; libjpeg decodes these directly at
+# 1/8, 1/4 or 1/2 of the resolution, which is much cheaper than a full decode.
+_REDUCED_MODES = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def new_frame_buffer(size=FRAME_SIZE):
+    """Allocate a BGR frame buffer that can be passed as `dst` to fit_frame/decode_frame."""
+    width, height = size
+    return np.empty((height, width, 3), dtype=np.uint8)
+
+
+def _reduced_flag(data, size):
+    try:
+        # PIL only parses the header here, no pixel data is decoded
+        width, height = Image.open(io.BytesIO(data)).size
+    except Exception:
+        return cv2.IMREAD_COLOR
+    target_width, target_height = size
+    for scale, flag in _REDUCED_MODES:
+        if width // scale >= target_width and height // scale >= target_height:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def fit_frame(frame, size=FRAME_SIZE, dst=None):
+    """
+    Resize a BGR frame to `size` in one pass.
+
+    :param frame: BGR numpy array
+    :param size: (width, height) of the output
+    :param dst: optional preallocated buffer of the output shape to write into
+    :return: the resized frame (dst when given)
+    """
+    width, height = size
+    if frame.shape[1] == width and frame.shape[0] == height:
+        if dst is None:
+            return frame
+        np.copyto(dst, frame)
+        return dst
+    shrinking = frame.shape[1] > width or frame.shape[0] > height
+    return cv2.resize(
+        frame,
+        size,
+        dst=dst,
+        interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR,
+    )
+
+
+def decode_frame(data, size=FRAME_SIZE, dst=None):
+    """
+    Decode encoded image bytes straight to a BGR frame of `size`.
+
+    Large sources are decoded at reduced resolution (IMREAD_REDUCED_*) when
+    that still covers the target size, then resized once.
+
+    :param data: encoded image bytes (jpg, png, ...)
+    :param size: (width, height) of the output
+    :param dst: optional preallocated buffer of the output shape to write into
+    :return: BGR numpy array
+    """
+    flag = _reduced_flag(data, size)
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+    if frame is None:
+        raise ValueError("Invalid or unreadable image")
+    return fit_frame(frame, size, dst)
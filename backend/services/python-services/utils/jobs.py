@@ -0,0 +1,319 @@
+"""
+Asynchronous jobs for long-running processing requests.
+
+Instead of holding the HTTP connection for the whole inference, a client
+submits a job and gets its id at once (202). Job workers take jobs from a
+bounded queue in order and run their steps, one call per image, through the
+inference admission gate (utils.admission), so queued jobs share the
+inference slots with interactive requests instead of competing for extra
+ones: a step refused by the gate waits for its Retry-After and tries again.
+
+A job holds its uploads in memory until it ended, so the queue is bounded by
+the upload bytes of its queued and running jobs (`max_bytes`) as well as by
+their number. Uploads are read through read_uploads, which refuses a job as
+soon as its declared or read bytes exceed what is left, instead of reading
+every file first.
+
+Clients poll GET /jobs/{id} (optionally long-polling with ?wait=) or follow
+/jobs/{id}/events, a Server-Sent-Events stream of the job's state changes
+ending with the result. Jobs and their results stay in memory, bounded to
+`max_jobs`; a finished job is dropped `ttl` seconds after it ended, or
+earlier, oldest first, when the store is full.
+
+All methods run on the event loop; there is no locking.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from fastapi import HTTPException
+
+from utils.admission import inference_gate
+from utils.records import json_default
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+UPLOAD_CHUNK = 1024 * 1024
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    camera_id: str
+    steps: list  # [(fn, args, coalescing key)], emptied once the job ended
+    submitted: float
+    total: int = 0
+    size: int = 0  # upload bytes held until the job ended
+    state: str = QUEUED
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    results: list = field(default_factory=list)
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def is_finished(self):
+        return self.state in (DONE, FAILED)
+
+    def notify(self, state=None):
+        if state is not None:
+            self.state = state
+        # wake everyone waiting for a change, later waiters get a fresh event
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def as_dict(self, now):
+        body = {
+            "id": self.id,
+            "kind": self.kind,
+            "camera_id": self.camera_id,
+            "state": self.state,
+            "progress": {"done": len(self.results), "total": self.total},
+            "queued_seconds": round((self.started or now) - self.submitted, 3),
+        }
+        if self.started is not None:
+            body["run_seconds"] = round((self.finished or now) - self.started, 3)
+        if self.state == DONE:
+            body["result"] = self.results
+        if self.state == FAILED:
+            body["error"] = self.error
+            body["status_code"] = self.status_code
+        return body
+
+
+class JobQueue:
+    def __init__(
+        self, gate, workers=1, max_queued=100, max_bytes=256 * 1024 * 1024, max_jobs=1000, ttl=600.0,
+        clock=time.monotonic,
+    ):
+        """
+        :param gate: AdmissionGate the steps run through
+        :param workers: jobs run at the same time
+        :param max_queued: jobs waiting to run before submissions are refused (429)
+        :param max_bytes: upload bytes of the queued and running jobs before submissions are refused (429)
+        :param max_jobs: jobs kept, queued, running and finished together
+        :param ttl: seconds a finished job is kept
+        :param clock: time source, seconds
+        """
+        self.gate = gate
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_bytes = max_bytes
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.clock = clock
+        self.jobs = OrderedDict()
+        self.queued = 0
+        self.held_bytes = 0
+        self.counts = {"submitted": 0, "done": 0, "failed": 0, "refused": 0, "expired": 0}
+        self._queue = None
+        self._tasks = []
+
+    def _purge(self):
+        now = self.clock()
+        for job_id in [
+            job_id
+            for job_id, job in self.jobs.items()
+            if job.is_finished and now - job.finished >= self.ttl
+        ]:
+            del self.jobs[job_id]
+            self.counts["expired"] += 1
+        if len(self.jobs) >= self.max_jobs:
+            for job_id in [job_id for job_id, job in self.jobs.items() if job.is_finished]:
+                del self.jobs[job_id]
+                self.counts["expired"] += 1
+                if len(self.jobs) < self.max_jobs:
+                    break
+
+    def admit(self, size, stored=False):
+        """
+        Refuse a job holding `size` upload bytes that could not be queued now.
+
+        :param stored: also refuse when the job store is full
+        :raises HTTPException: 413 when the uploads alone exceed max_bytes,
+                               429 when the queue, its bytes or the store are full
+        """
+        if size > self.max_bytes:
+            self.counts["refused"] += 1
+            raise HTTPException(
+                status_code=413, detail=f"The uploads of a job may not exceed {self.max_bytes} bytes."
+            )
+        if (
+            self.queued >= self.max_queued
+            or self.held_bytes + size > self.max_bytes
+            or (stored and len(self.jobs) >= self.max_jobs)
+        ):
+            self.counts["refused"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many jobs are queued.",
+                headers={"Retry-After": str(self.gate.retry_after())},
+            )
+
+    async def read_uploads(self, files, chunk_size=UPLOAD_CHUNK):
+        """
+        Contents of the uploaded files of a job, read in chunks and refused
+        (admit) as soon as their declared size or the bytes read so far exceed
+        what the queue can take.
+
+        :param files: UploadFiles
+        :return: (list of bytes, total bytes)
+        """
+        size = 0
+        contents = []
+        for f in files:
+            if f.size is not None:
+                self.admit(size + f.size)
+            chunks = []
+            while chunk := await f.read(chunk_size):
+                size += len(chunk)
+                self.admit(size)
+                chunks.append(chunk)
+            contents.append(b"".join(chunks))
+        return contents, size
+
+    def submit(self, kind, camera_id, steps, id_prefix="", size=0):
+        """
+        Queue a job.
+
+        :param steps: list of (fn, args, key); fn(*args) runs on an executor thread
+                      and its result is appended to the job's results
+        :param id_prefix: prefix of the job id, e.g. the pre-fork worker index
+        :param size: bytes of the uploads the steps hold
+        :raises HTTPException: see admit
+        """
+        self._purge()
+        self.admit(size, stored=True)
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        job = Job(
+            f"{id_prefix}{uuid.uuid4().hex}", kind, camera_id, steps, self.clock(), total=len(steps), size=size
+        )
+        self.jobs[job.id] = job
+        self.queued += 1
+        self.held_bytes += size
+        self.counts["submitted"] += 1
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id):
+        self._purge()
+        return self.jobs.get(job_id)
+
+    async def wait(self, job, timeout):
+        """Wait until the job finished or timeout seconds passed."""
+        deadline = self.clock() + timeout
+        while not job.is_finished:
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(job.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    async def _run(self, job):
+        self.queued -= 1
+        job.started = self.clock()
+        job.notify(RUNNING)
+        try:
+            for fn, args, key in job.steps:
+                # inference is saturated: the job waits its turn
+                job.results.append(await self.gate.run_waiting(fn, *args, key=key))
+                job.notify()
+        except asyncio.CancelledError:
+            job.error, job.status_code = "Cancelled at shutdown.", 503
+            self._release(job)
+            job.finished = self.clock()
+            job.notify(FAILED)
+            raise
+        except HTTPException as e:
+            job.error, job.status_code = str(e.detail), e.status_code
+        except Exception as e:
+            logger.exception("Job %s failed: %s", job.id, e)
+            job.error, job.status_code = str(e), 500
+        self._release(job)
+        job.finished = self.clock()
+        state = FAILED if job.error is not None else DONE
+        self.counts[state] += 1
+        job.notify(state)
+
+    def _release(self, job):
+        # the uploads are no longer needed
+        job.steps = []
+        self.held_bytes -= job.size
+        job.size = 0
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            await self._run(job)
+
+    def start(self):
+        """Start the job workers on the running loop."""
+        if self._tasks:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self):
+        states = {}
+        for job in self.jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {
+            "workers": self.workers,
+            "queued": self.queued,
+            "held_bytes": self.held_bytes,
+            "max_bytes": self.max_bytes,
+            "jobs": states,
+            **self.counts,
+        }
+
+
+async def job_events(request, jobs, job, keep_alive=15.0):
+    """
+    Server-Sent-Events generator of a job: one message per state change or
+    finished step, the last one with the result or error.
+    """
+    while True:
+        changed = job.changed
+        yield f"data: {json.dumps(job.as_dict(jobs.clock()), default=json_default)}\n\n"
+        if job.is_finished:
+            return
+        while not changed.is_set():
+            if await request.is_disconnected():
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), keep_alive)
+            except asyncio.TimeoutError:
+                yield f": keep-alive {int(time.time())}\n\n"
+
+
+jobs = JobQueue(
+    inference_gate,
+    workers=int(os.getenv("JOB_WORKERS", "1")),
+    max_queued=int(os.getenv("JOB_QUEUE", "100")),
+    max_bytes=int(os.getenv("JOB_QUEUE_BYTES", str(256 * 1024 * 1024))),
+    max_jobs=int(os.getenv("JOB_MAX", "1000")),
+    ttl=float(os.getenv("JOB_TTL", "600")),
+)
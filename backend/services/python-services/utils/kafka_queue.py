@@ -1,22 +1,111 @@
 from kafka import KafkaProducer
 import json
+import logging
+import os
+import threading
+from utils import metrics
+from utils.metrics import timed
+from utils.outbox import OutboxFull, outbox
+from utils.update_coalescer import update_coalescer
 
-producer = KafkaProducer(
-    bootstrap_servers='kafka:9092',
-    value_serializer=lambda v: json.dumps(v).encode('utf-8')
-)
+logger = logging.getLogger(__name__)
 
+KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
+KAFKA_SEND_TIMEOUT = float(os.getenv("KAFKA_SEND_TIMEOUT", "10"))
+VEHICLE_HEADERS = [("__TypeId__", b"app.dataservice.boundaries.VehicleBoundary")]
 
-def create_vehicle(vehicle):
-    print("Sending new vehicle:", vehicle)
+_producer = None
+_producer_lock = threading.Lock()
 
-    producer.send("vehicle-create", value=vehicle,
-                  headers=[("__TypeId__", b"app.dataservice.boundaries.VehicleBoundary")])
-    producer.flush()
+
+def get_producer():
+    """The shared producer, connected on first use (only the outbox drainer sends)."""
+    global _producer
+    if _producer is None:
+        with _producer_lock:
+            if _producer is None:
+                _producer = KafkaProducer(
+                    bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
+                    value_serializer=lambda v: json.dumps(v).encode('utf-8')
+                )
+    return _producer
+
+
+def send_batch(items):
+    """
+    Outbox sink: send queued vehicle events and wait for the broker.
+
+    :param items: list of ({"topic", "value"}, None) from the outbox
+    :return: number of leading items acknowledged
+    """
+    producer = get_producer()
+    with timed("kafka_send"):
+        futures = [
+            producer.send(meta["topic"], value=meta["value"], headers=VEHICLE_HEADERS)
+            for meta, _ in items
+        ]
+        producer.flush(timeout=KAFKA_SEND_TIMEOUT)
+    sent = 0
+    for future in futures:
+        if not (future.is_done and future.succeeded()):
+            logger.warning("Kafka send failed: %s", future.exception if future.is_done else "timed out")
+            break
+        sent += 1
+    return sent
+
+
+outbox.register("kafka", send_batch)
+
+
+def create_vehicle(vehicle, image=None, blob=None):
+    """
+    Queue the creation of a new vehicle.
+
+    The image upload and the event are one outbox row: the "vehicle-create"
+    sink (vehicle_processing_service) uploads the image before it sends the
+    event, so the event never points at a missing blob. When the outbox is
+    full the image may be discarded first; the vehicle is then created with
+    imageUrl "none".
+
+    :param image: encoded image of the vehicle, or None
+    :param blob: {"blob_name", "container_name"} the image is uploaded to
+    :return: True when queued, False when the outbox is full and the vehicle is lost
+    """
+    logger.info("Sending new vehicle for camera %s", vehicle.get("cameraId"))
+    logger.debug("New vehicle payload: %s", vehicle)
+
+    try:
+        outbox.enqueue(
+            "vehicle-create",
+            {"topic": "vehicle-create", "value": vehicle, "blob": blob},
+            image,
+            optional_data=True,
+        )
+    except OutboxFull as e:
+        logger.error("New vehicle for camera %s lost: %s", vehicle.get("cameraId"), e)
+        metrics.vehicles_lost_total.inc(vehicle.get("cameraId"))
+        return False
+    return True
 
 def update_vehicle(vehicle):
-    print("Sending updated vehicle:", vehicle)
+    """
+    Queue an update of a stored vehicle unless it only repeats the last one
+    sent (utils.update_coalescer).
+
+    :return: True when the update was queued
+    """
+    reason = update_coalescer.check(vehicle)
+    if reason is None:
+        metrics.updates_total.inc(vehicle.get("cameraId"), "suppressed")
+        return False
+    logger.info("Sending updated vehicle %s (%s)", vehicle.get("id"), reason)
+    logger.debug("Updated vehicle payload: %s", vehicle)
 
-    producer.send("vehicle-update", value=vehicle,
-                  headers=[("__TypeId__", b"app.dataservice.boundaries.VehicleBoundary")])
-    producer.flush()
+    # a later update of the same vehicle supersedes this one, so it may be dropped when the outbox is full
+    if not outbox.enqueue("kafka", {"topic": "vehicle-update", "value": vehicle}, droppable=True):
+        # not recorded as sent: the next frame tries again
+        metrics.updates_total.inc(vehicle.get("cameraId"), "dropped")
+        return False
+    update_coalescer.commit(vehicle, reason)
+    metrics.updates_total.inc(vehicle.get("cameraId"), reason)
+    return True
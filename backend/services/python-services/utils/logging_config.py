@@ -0,0 +1,154 @@
+"""
+Logging setup for the processing service.
+
+Records are handed to a QueueHandler and written to stdout by a background
+QueueListener, so the work loop never blocks on the terminal or container log
+driver. Levels are configured from the environment:
+
+    LOG_LEVEL=INFO                                   root level (default INFO)
+    LOG_LEVELS=services.vehicle_processing_service=DEBUG,utils.kafka_queue=WARNING
+    LOG_FORMAT=text|json                             output format (default text)
+    LOG_SAMPLE_EVERY=100                             keep 1 in N per-pair debug records
+    LOG_MAX_PER_SECOND=20                            and at most this many per second
+
+Per-pair output (one record per stored x detected vehicle) goes through
+SampledLogger, which returns before any formatting when DEBUG is disabled.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+_listener = None
+_setup_lock = threading.Lock()
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def parse_levels(spec):
+    """
+    Parse "name=LEVEL,name=LEVEL" into {name: level}; unknown levels are ignored.
+    """
+    levels = {}
+    for part in (spec or "").split(","):
+        name, _, level = part.strip().partition("=")
+        level = logging.getLevelName(level.strip().upper())
+        if name and isinstance(level, int):
+            levels[name.strip()] = level
+    return levels
+
+
+def setup_logging(level=None, levels=None, fmt=None, stream=None):
+    """
+    Install the queue handler on the root logger and start the writer thread.
+    Safe to call more than once; only the first call has an effect.
+
+    :param level: root level name, defaults to LOG_LEVEL or INFO
+    :param levels: per-logger levels spec, defaults to LOG_LEVELS
+    :param fmt: "text" or "json", defaults to LOG_FORMAT or text
+    :param stream: output stream, defaults to stdout
+    :return: the QueueListener
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        if (fmt or os.getenv("LOG_FORMAT", "text")).lower() == "json":
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+        records = queue.SimpleQueue()
+        root = logging.getLogger()
+        root.addHandler(logging.handlers.QueueHandler(records))
+        root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+        for name, logger_level in parse_levels(
+            levels if levels is not None else os.getenv("LOG_LEVELS")
+        ).items():
+            logging.getLogger(name).setLevel(logger_level)
+
+        _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        return _listener
+
+
+def stop_logging():
+    """Flush the queue and stop the writer thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in list(logging.getLogger().handlers):
+            if isinstance(handler, logging.handlers.QueueHandler):
+                logging.getLogger().removeHandler(handler)
+        _listener = None
+
+
+class SampledLogger:
+    """
+    Debug logging for per-pair hot paths: keeps one record in `every` and at
+    most `per_second` records per second. Records dropped by the limits are
+    counted and reported with the next record that is written.
+    """
+
+    def __init__(self, logger, every=None, per_second=None):
+        self.logger = logger
+        self.every = max(1, int(every or os.getenv("LOG_SAMPLE_EVERY", "100")))
+        self.per_second = float(per_second or os.getenv("LOG_MAX_PER_SECOND", "20"))
+        self.suppressed = 0
+        self._seen = 0
+        self._tokens = self.per_second
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _allow(self):
+        with self._lock:
+            self._seen += 1
+            if self._seen % self.every:
+                self.suppressed += 1
+                return 0
+            now = time.monotonic()
+            self._tokens = min(self.per_second, self._tokens + (now - self._last) * self.per_second)
+            self._last = now
+            if self._tokens < 1.0:
+                self.suppressed += 1
+                return 0
+            self._tokens -= 1.0
+            dropped, self.suppressed = self.suppressed, 0
+            return dropped + 1
+
+    def debug(self, msg, *args):
+        # checked first so disabled debug costs one level lookup, no formatting
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        allowed = self._allow()
+        if not allowed:
+            return
+        if allowed > 1:
+            msg = f"{msg} (+{allowed - 1} suppressed)"
+        self.logger.debug(msg, *args)
@@ -0,0 +1,346 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Stage latencies are recorded as histograms labelled by stage and camera_id,
+per-camera activity as counters. Instrumentation is done with thin wrappers
+around the existing model objects (see instrument_models) and the `timed`
+context manager at call sites, so the wrapped code stays unchanged.
+
+The metrics live in each process. With pre-fork workers (utils.prefork) the
+expositions of all workers are merged on scrape (merge_expositions), every
+sample labelled with its worker, so Prometheus sees one series per worker
+instead of counters jumping between processes.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGES = (
+    "capture",
+    "resize",
+    "yolo_detect",
+    "classify_make",
+    "classify_color",
+    "damage_detect",
+    "db_fetch",
+    "matching",
+    "cross_camera_lookup",
+    "blur",
+    "encode_upload",
+    "kafka_send",
+)
+
+# camera of the frame being processed on this thread/task, for stages that
+# run deep inside model code and do not see the camera_id themselves
+current_camera = ContextVar("current_camera", default="unknown")
+# frame id of the work loop iteration, only used to label trace spans
+current_frame = ContextVar("current_frame", default=None)
+
+# set by utils.profiling while a tracing session runs: hook(stage, camera_id, started, duration)
+span_hook = None
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # per-bucket (non-cumulative) counts, the +Inf bucket last, then sum
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def mean(self, *prefix):
+        """Mean observed value over the series whose label values start with prefix, or None."""
+        count = total = 0
+        with self._lock:
+            for labelvalues, series in self._series.items():
+                if labelvalues[: len(prefix)] == prefix:
+                    count += sum(series[:-1])
+                    total += series[-1]
+        return total / count if count else None
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for labelvalues, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, labelvalues, ("le", le))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """Register a callable returning extra exposition lines (e.g. gauges read on scrape)."""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                lines.extend(collect())
+            except Exception as e:
+                lines.append(f"# collector error: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.register(
+    Histogram(
+        "vehicle_processing_stage_seconds",
+        "Latency of each processing stage in seconds.",
+        ("stage", "camera_id"),
+    )
+)
+frames_total = registry.register(
+    Counter("vehicle_processing_frames_total", "Frames processed.", ("camera_id",))
+)
+vehicles_total = registry.register(
+    Counter("vehicle_processing_vehicles_total", "Vehicles detected.", ("camera_id",))
+)
+matches_total = registry.register(
+    Counter("vehicle_processing_matches_total", "Detections matched to a stored vehicle.", ("camera_id",))
+)
+new_vehicles_total = registry.register(
+    Counter("vehicle_processing_new_vehicles_total", "Detections stored as new vehicles.", ("camera_id",))
+)
+errors_total = registry.register(
+    Counter("vehicle_processing_errors_total", "Errors while processing frames.", ("camera_id", "stage"))
+)
+vehicles_lost_total = registry.register(
+    Counter(
+        "vehicle_processing_vehicles_lost_total",
+        "New vehicles that were never queued for creation because the outbox was full.",
+        ("camera_id",),
+    )
+)
+updates_total = registry.register(
+    Counter(
+        "vehicle_processing_updates_total",
+        "Vehicle updates by outcome (a send reason, or suppressed).",
+        ("camera_id", "outcome"),
+    )
+)
+skipped_total = registry.register(
+    Counter(
+        "vehicle_processing_skipped_total",
+        "Per-vehicle model runs skipped by the planner.",
+        ("camera_id", "stage", "reason"),
+    )
+)
+frames_shed_total = registry.register(
+    Counter(
+        "vehicle_processing_frames_shed_total",
+        "Frames of the work loops skipped by the scheduler because they could not meet their deadline.",
+        ("camera_id",),
+    )
+)
+deadline_misses_total = registry.register(
+    Counter(
+        "vehicle_processing_deadline_misses_total",
+        "Work loop frames that finished after their deadline.",
+        ("camera_id",),
+    )
+)
+
+
+class timed:
+    """
+    Context manager recording the elapsed time of a stage.
+
+        with timed("db_fetch", camera_id):
+            ...
+    """
+
+    __slots__ = ("stage", "camera_id", "started")
+
+    def __init__(self, stage, camera_id=None):
+        self.stage = stage
+        self.camera_id = camera_id
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        camera_id = self.camera_id or current_camera.get()
+        stage_seconds.observe(duration, self.stage, camera_id)
+        if span_hook is not None:
+            span_hook(self.stage, camera_id, self.started, duration)
+        return False
+
+
+def timed_call(fn, stage):
+    """Wrap a callable so every call is recorded under `stage`."""
+
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - started
+            camera_id = current_camera.get()
+            stage_seconds.observe(duration, stage, camera_id)
+            if span_hook is not None:
+                span_hook(stage, camera_id, started, duration)
+
+    wrapper.__wrapped__ = fn
+    return wrapper
+
+
+class TimedProxy:
+    """
+    Delegates to `target`, timing the methods listed in `stages` ({method: stage}).
+    Used for objects whose methods cannot be replaced (OpenCV nets) or that are
+    invoked through __call__.
+    """
+
+    def __init__(self, target, stages, call_stage=None):
+        self._target = target
+        self._call = timed_call(target, call_stage) if call_stage else target
+        for method, stage in stages.items():
+            setattr(self, method, timed_call(getattr(target, method), stage))
+
+    def __call__(self, *args, **kwargs):
+        return self._call(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+def _instrument_method(obj, method, stage):
+    current = getattr(obj, method)
+    if getattr(current, "__wrapped__", None) is not None:
+        return
+    setattr(obj, method, timed_call(current, stage))
+
+
+def instrument_models(models):
+    """
+    Add stage timing to the models returned by build(). Safe to call repeatedly.
+
+    :param models: dict with "vehicle", "image_blur", "car_damage", "camera"
+    :return: the same dict, with the damage model wrapped in a TimedProxy
+    """
+    vehicle = models.get("vehicle")
+    if vehicle is not None:
+        if not isinstance(vehicle.net, TimedProxy):
+            vehicle.net = TimedProxy(vehicle.net, {"detect": "yolo_detect"})
+        _instrument_method(vehicle.car_make_classifier, "predict", "classify_make")
+        _instrument_method(vehicle.car_color_classifier, "predict", "classify_color")
+    blur = models.get("image_blur")
+    if blur is not None:
+        _instrument_method(blur, "image_blur", "blur")
+    damage = models.get("car_damage")
+    if damage is not None and not isinstance(damage, TimedProxy):
+        models["car_damage"] = TimedProxy(damage, {}, call_stage="damage_detect")
+    camera = models.get("camera")
+    if camera is not None:
+        _instrument_method(camera, "capture_image", "capture")
+    return models
+
+
+def render():
+    return registry.render()
+
+
+def _with_label(line, name, value):
+    """Sample line with one more label, put first so label values need no parsing."""
+    label = f'{name}="{value}"'
+    brace, space = line.find("{"), line.find(" ")
+    if brace != -1 and brace < space:
+        return f"{line[: brace + 1]}{label},{line[brace + 1 :]}"
+    return f"{line[:space]}{{{label}}}{line[space:]}"
+
+
+def merge_expositions(texts, label="worker"):
+    """
+    One exposition from those of several processes.
+
+    :param texts: {label value: exposition text}
+    :return: exposition text with every sample labelled, the samples of a metric
+             family kept together under a single HELP/TYPE header
+    """
+    families = {}  # name -> (header lines, sample lines)
+    for value, text in texts.items():
+        family = None
+        for line in text.splitlines():
+            if line.startswith(("# HELP ", "# TYPE ")):
+                family = families.setdefault(line.split()[2], ([], []))
+                if line not in family[0]:
+                    family[0].append(line)
+            elif line and not line.startswith("#") and family is not None:
+                family[1].append(_with_label(line, label, value))
+    lines = []
+    for headers, samples in families.values():
+        lines.extend(headers)
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,338 @@
+"""
+Disk-backed outbox for writes to downstream systems (Kafka, blob storage).
+
+Producers call enqueue(), which only appends a row to a local SQLite database
+in WAL mode and returns; a background thread drains the rows in batches to the
+sink registered for their kind, oldest first. A failing sink is retried with
+exponential backoff (up to `max_backoff` seconds) while the other sinks keep
+draining, so frame processing never waits on a downstream outage. Rows survive
+a restart and are replayed by the next drainer.
+
+Several processes (pre-fork workers, utils.prefork) may enqueue into one
+database file while one of them drains it. The byte total is therefore kept
+in the database, updated by triggers on every insert, delete and payload
+strip, and read inside the write transaction (BEGIN IMMEDIATE) that decides
+whether a new row fits; no process keeps its own count.
+
+Disk usage is bounded by `max_bytes` of payload. When a new row does not fit,
+the oldest droppable rows (superseded-by-design events such as position
+updates) are removed first, then the oldest optional payloads (vehicle images,
+enqueued with optional_data) are discarded while their rows stay, and the sink
+gets None for them. Other rows are never removed: if the new row still does
+not fit it is refused, a droppable one silently (counted as dropped), any
+other with OutboxFull (counted per kind in `refused`) so the caller can record
+the loss.
+
+A sink is a callable taking a list of (meta, data) pairs and returning how many
+leading items were delivered; it may raise, which counts as zero delivered.
+"""
+import atexit
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    meta TEXT NOT NULL,
+    data BLOB,
+    size INTEGER NOT NULL,
+    droppable INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    data_optional INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+# byte total of all rows, shared by every process writing the file
+_ACCOUNTING = (
+    "CREATE TABLE IF NOT EXISTS outbox_bytes (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO outbox_bytes SELECT 0, COALESCE(SUM(size), 0) FROM outbox",
+    "CREATE TRIGGER IF NOT EXISTS outbox_inserted AFTER INSERT ON outbox"
+    " BEGIN UPDATE outbox_bytes SET bytes = bytes + NEW.size; END",
+    "CREATE TRIGGER IF NOT EXISTS outbox_deleted AFTER DELETE ON outbox"
+    " BEGIN UPDATE outbox_bytes SET bytes = bytes - OLD.size; END",
+    "CREATE TRIGGER IF NOT EXISTS outbox_resized AFTER UPDATE OF size ON outbox"
+    " BEGIN UPDATE outbox_bytes SET bytes = bytes - OLD.size + NEW.size; END",
+)
+
+
+class OutboxFull(Exception):
+    """A row that may not be dropped does not fit in max_bytes."""
+
+
+class Outbox:
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, batch_size=100, poll_interval=0.5,
+                 max_backoff=60.0, clock=time.time):
+        """
+        :param path: SQLite database file (":memory:" for a throwaway outbox)
+        :param max_bytes: payload bytes kept before the oldest rows are dropped
+        :param batch_size: rows handed to a sink at once
+        :param poll_interval: seconds the drainer sleeps when there is nothing to send
+        :param max_backoff: longest wait in seconds before retrying a failing sink
+        :param clock: time source, seconds
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.sinks = {}
+        self._conn = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._exit_hook = False
+        self._retry_at = {}  # kind -> time the failing sink is tried again
+        self._failures = {}  # kind -> consecutive failed batches
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.stripped = 0
+        self.refused = {}  # kind -> rows refused because the outbox was full
+
+    # -- storage -----------------------------------------------------------------
+
+    def _db(self):
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # waits this long for the write lock held by another process
+            conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL with synchronous=NORMAL survives process crashes, only an OS crash can lose the tail
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._transaction(conn):
+                conn.execute(_SCHEMA)
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(outbox)")}
+                if "data_optional" not in columns:
+                    # outbox written before optional payloads existed
+                    conn.execute("ALTER TABLE outbox ADD COLUMN data_optional INTEGER NOT NULL DEFAULT 0")
+                conn.execute("CREATE INDEX IF NOT EXISTS outbox_kind ON outbox (kind, id)")
+                for statement in _ACCOUNTING:
+                    conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _transaction(db):
+        """Write transaction, taking the database lock at once so the byte total cannot change under it."""
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    @staticmethod
+    def _size(db):
+        return db.execute("SELECT bytes FROM outbox_bytes").fetchone()[0]
+
+    def register(self, kind, sink):
+        """Set the sink that delivers rows of a kind."""
+        self.sinks[kind] = sink
+
+    def enqueue(self, kind, meta, data=None, droppable=False, optional_data=False):
+        """
+        Record a write for background delivery.
+
+        :param kind: sink name, e.g. "kafka" or "vehicle-create"
+        :param meta: JSON-serializable description of the write
+        :param data: optional binary payload (e.g. an encoded image)
+        :param droppable: may be dropped before other rows when the outbox is full
+        :param optional_data: the payload may be discarded when the outbox is full,
+                              the row is then delivered with None
+        :return: True when queued, False when a droppable row did not fit
+        :raises OutboxFull: when any other row does not fit
+        """
+        meta_text = json.dumps(meta, default=str)
+        size = len(meta_text) + (len(data) if data else 0)
+        with self._lock:
+            db = self._db()
+            with self._transaction(db):
+                if self._size(db) + size > self.max_bytes and size <= self.max_bytes:
+                    # a droppable write may only displace other droppable rows
+                    self._trim(db, self.max_bytes - size, strip=not droppable)
+                fits = self._size(db) + size <= self.max_bytes
+                if fits:
+                    db.execute(
+                        "INSERT INTO outbox (kind, meta, data, size, droppable, data_optional, created)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (kind, meta_text, data, size, int(droppable), int(optional_data), self.clock()),
+                    )
+            if not fits:
+                if droppable:
+                    self.dropped += 1
+                    return False
+                self.refused[kind] = self.refused.get(kind, 0) + 1
+                raise OutboxFull(f"Outbox over {self.max_bytes} bytes, {kind} row refused")
+            self.enqueued += 1
+        self._wake.set()
+        return True
+
+    def _oldest(self, db, select, target):
+        """Oldest (id, bytes freed) rows of a query, just enough to get down to target bytes."""
+        rows = []
+        excess = self._size(db) - target
+        for row in db.execute(f"{select} ORDER BY id LIMIT 64"):
+            rows.append(row)
+            excess -= row[1]
+            if excess <= 0:
+                break
+        return rows
+
+    def _trim(self, db, target, strip=True):
+        """Drop droppable rows, then (strip) optional payloads, oldest first, until at most target bytes remain."""
+        dropped = stripped = 0
+        while self._size(db) > target:
+            rows = self._oldest(db, "SELECT id, size FROM outbox WHERE droppable = 1", target)
+            if not rows:
+                break
+            db.execute(
+                f"DELETE FROM outbox WHERE id IN ({','.join('?' * len(rows))})",
+                [row[0] for row in rows],
+            )
+            dropped += len(rows)
+        while strip and self._size(db) > target:
+            rows = self._oldest(
+                db,
+                "SELECT id, size - length(meta) FROM outbox WHERE data_optional = 1 AND data IS NOT NULL",
+                target,
+            )
+            if not rows:
+                break
+            db.execute(
+                f"UPDATE outbox SET data = NULL, size = length(meta) WHERE id IN ({','.join('?' * len(rows))})",
+                [row[0] for row in rows],
+            )
+            stripped += len(rows)
+        self.dropped += dropped
+        self.stripped += stripped
+        if dropped or stripped:
+            logger.warning(
+                "Outbox over %d bytes: dropped %d rows and %d payloads (%d and %d so far)",
+                self.max_bytes, dropped, stripped, self.dropped, self.stripped,
+            )
+
+    # -- draining ----------------------------------------------------------------
+
+    def drain_once(self):
+        """Hand one batch per ready sink to it; returns the number of rows delivered."""
+        delivered = 0
+        now = self.clock()
+        for kind, sink in list(self.sinks.items()):
+            if self._retry_at.get(kind, 0) > now:
+                continue
+            with self._lock:
+                rows = self._db().execute(
+                    "SELECT id, meta, data, size FROM outbox WHERE kind = ? ORDER BY id LIMIT ?",
+                    (kind, self.batch_size),
+                ).fetchall()
+            if not rows:
+                continue
+            try:
+                done = sink([(json.loads(meta), data) for _, meta, data, _ in rows])
+            except Exception as e:
+                logger.warning("Outbox sink %s failed: %s", kind, e)
+                done = 0
+            done = max(0, min(int(done or 0), len(rows)))
+            if done:
+                with self._lock:
+                    # the byte total follows through the triggers; rows trimmed meanwhile are already gone
+                    self._conn.execute(
+                        f"DELETE FROM outbox WHERE id IN ({','.join('?' * done)})",
+                        [row[0] for row in rows[:done]],
+                    )
+                    self.sent += done
+                delivered += done
+            if done < len(rows):
+                failures = self._failures.get(kind, 0) + 1
+                self._failures[kind] = failures
+                self._retry_at[kind] = now + min(2 ** (failures - 1), self.max_backoff)
+                with self._lock:
+                    self._conn.execute("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", (rows[done][0],))
+            else:
+                self._failures.pop(kind, None)
+                self._retry_at.pop(kind, None)
+        return delivered
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                delivered = self.drain_once()
+            except Exception as e:
+                logger.exception("Outbox drain failed: %s", e)
+                delivered = 0
+            if not delivered:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def start(self):
+        """Start the background drainer (replays rows left from a previous run)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="outbox-drainer", daemon=True)
+            self._thread.start()
+            if not self._exit_hook:
+                atexit.register(self.stop)
+                self._exit_hook = True
+
+    def stop(self, timeout=5.0):
+        """
+        Stop the drainer after a last attempt to deliver what is pending. The
+        attempt is skipped while the drainer thread is still busy after `timeout`.
+        """
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        thread.join(timeout)
+        if thread.is_alive():
+            # still inside a sink call: a drain here would hand the same rows to the sink again
+            logger.warning("Outbox drainer did not stop within %.1fs; skipping the final drain", timeout)
+            return
+        self._thread = None
+        try:
+            self.drain_once()
+        except Exception as e:
+            logger.warning("Outbox final drain failed: %s", e)
+
+    def stats(self):
+        with self._lock:
+            db = self._db()
+            pending = dict(db.execute("SELECT kind, COUNT(*) FROM outbox GROUP BY kind").fetchall())
+            return {
+                "pending": pending,
+                "bytes": self._size(db),
+                "max_bytes": self.max_bytes,
+                "enqueued": self.enqueued,
+                "sent": self.sent,
+                "dropped": self.dropped,
+                "stripped": self.stripped,
+                "refused": dict(self.refused),
+                "failing": {kind: n for kind, n in self._failures.items()},
+                "running": self._thread is not None and self._thread.is_alive(),
+            }
+
+
+_BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+outbox = Outbox(
+    os.getenv("OUTBOX_PATH", os.path.join(_BASE_PATH, "outbox", "outbox.db")),
+    max_bytes=int(os.getenv("OUTBOX_MAX_BYTES", str(512 * 1024 * 1024))),
+    batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", "100")),
+)
@@ -0,0 +1,175 @@
+"""
+Per-vehicle execution plan between detection and enrichment.
+
+After YOLO, each detection is checked before the expensive models run on it:
+
+* boxes smaller than `min_classify_side` are not classified (too small for
+  reliable make and color results); they are still kept, stored and matched
+  as label-only records with the detector's type. Off by default (0);
+* boxes smaller than `min_damage_side` are classified but not checked for
+  damage;
+* boxes overlapping a stored vehicle of the same camera by at least
+  `match_iou` will most likely be matched to it and only update its position,
+  so damage is skipped while that vehicle's damage result is fresher than
+  `damage_refresh` seconds; the stored description is reused.
+
+Freshness is tracked in-process by stored vehicle id (enriched()); after a
+restart every known vehicle is checked once more.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from utils import metrics
+
+# skip reasons, also the "reason" label of metrics.skipped_total
+TOO_SMALL = "too_small"
+TOO_SMALL_FOR_DAMAGE = "too_small_for_damage"
+KNOWN_FRESH = "known_fresh"
+
+# stages each skip reason saves, for the estimate in stats()
+_SAVED_STAGES = {
+    TOO_SMALL: ("classify_make", "classify_color", "damage_detect"),
+    TOO_SMALL_FOR_DAMAGE: ("damage_detect",),
+    KNOWN_FRESH: ("damage_detect",),
+}
+
+
+@dataclass(slots=True)
+class Plan:
+    classify: bool = True
+    damage: bool = True
+    reason: Optional[str] = None
+    # stored vehicle the box most likely belongs to
+    known: Optional[dict] = None
+
+
+def _boxes(vehicles):
+    return np.array(
+        [[v.get("left", 0), v.get("top", 0), v.get("width", 0), v.get("height", 0)] for v in vehicles],
+        dtype=np.float64,
+    ).reshape(-1, 4)
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU of every pair of (left, top, width, height) boxes, shape (len(a), len(b))."""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    w = np.minimum(ax2[:, None], bx2[None, :]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    h = np.minimum(ay2[:, None], by2[None, :]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    inter = np.clip(w, 0, None) * np.clip(h, 0, None)
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+class Planner:
+    def __init__(self, min_classify_side=0, min_damage_side=96, match_iou=0.8,
+                 damage_refresh=300.0, clock=time.monotonic):
+        """
+        :param min_classify_side: boxes with a smaller side are not classified (0 classifies all)
+        :param min_damage_side: boxes with a smaller side skip damage detection
+        :param match_iou: overlap with a stored vehicle's box to treat the detection as that vehicle
+        :param damage_refresh: seconds a stored vehicle's damage result is reused
+        :param clock: time source, seconds
+        """
+        self.min_classify_side = min_classify_side
+        self.min_damage_side = min_damage_side
+        self.match_iou = match_iou
+        self.damage_refresh = damage_refresh
+        self.clock = clock
+        self._enriched_at = {}  # stored vehicle id -> time of its last damage check
+        self._lock = threading.Lock()
+        self.planned = 0
+        self.skipped = {reason: 0 for reason in _SAVED_STAGES}
+
+    def plan(self, detections, stored=None, camera_id="unknown"):
+        """
+        Decide which models run on each detection.
+
+        :param detections: objects with left, top, width, height (VehicleDetection)
+        :param stored: stored vehicle dicts of the camera, or None when unknown
+        :return: list of Plan, one per detection
+        """
+        known = [None] * len(detections)
+        if detections and stored:
+            ious = iou_matrix(
+                [(d.left, d.top, d.width, d.height) for d in detections], _boxes(stored)
+            )
+            best = np.argmax(ious, axis=1)
+            for j, i in enumerate(best):
+                if ious[j, i] >= self.match_iou:
+                    known[j] = stored[int(i)]
+        now = self.clock()
+        plans = []
+        with self._lock:
+            for detection, vehicle in zip(detections, known):
+                side = min(detection.width, detection.height)
+                if side < self.min_classify_side:
+                    plan = Plan(classify=False, damage=False, reason=TOO_SMALL)
+                elif side < self.min_damage_side:
+                    plan = Plan(damage=False, reason=TOO_SMALL_FOR_DAMAGE, known=vehicle)
+                elif vehicle is not None and self._fresh(vehicle.get("id"), now):
+                    plan = Plan(damage=False, reason=KNOWN_FRESH, known=vehicle)
+                else:
+                    plan = Plan(known=vehicle)
+                plans.append(plan)
+                self.planned += 1
+                if plan.reason is not None:
+                    self.skipped[plan.reason] += 1
+        for plan in plans:
+            if plan.reason is not None:
+                if not plan.classify:
+                    metrics.skipped_total.inc(camera_id, "classify", plan.reason)
+                metrics.skipped_total.inc(camera_id, "damage", plan.reason)
+        return plans
+
+    def _fresh(self, vehicle_id, now):
+        enriched_at = self._enriched_at.get(vehicle_id)
+        return enriched_at is not None and now - enriched_at < self.damage_refresh
+
+    def enriched(self, vehicle_id):
+        """Record that a stored vehicle's damage result was just refreshed."""
+        if vehicle_id is None:
+            return
+        now = self.clock()
+        with self._lock:
+            self._enriched_at[vehicle_id] = now
+            if len(self._enriched_at) > 4096:
+                cutoff = now - self.damage_refresh
+                self._enriched_at = {k: t for k, t in self._enriched_at.items() if t >= cutoff}
+
+    def stats(self):
+        """Skip counts per reason and the model time they saved, estimated from stage latency means."""
+        means = {}
+        with self._lock:
+            skipped = dict(self.skipped)
+            planned = self.planned
+            tracked = len(self._enriched_at)
+        saved = 0.0
+        for reason, count in skipped.items():
+            for stage in _SAVED_STAGES[reason]:
+                if stage not in means:
+                    means[stage] = metrics.stage_seconds.mean(stage) or 0.0
+                saved += count * means[stage]
+        return {
+            "planned": planned,
+            "skipped": skipped,
+            "damage_skipped_ratio": round(sum(skipped.values()) / planned, 4) if planned else 0.0,
+            "estimated_seconds_saved": round(saved, 3),
+            "stage_mean_seconds": {stage: round(mean, 6) for stage, mean in means.items()},
+            "tracked_vehicles": tracked,
+        }
+
+
+planner = Planner(
+    min_classify_side=int(os.getenv("PLAN_MIN_CLASSIFY_SIDE", "0")),
+    min_damage_side=int(os.getenv("PLAN_MIN_DAMAGE_SIDE", "96")),
+    match_iou=float(os.getenv("PLAN_MATCH_IOU", "0.8")),
+    damage_refresh=float(os.getenv("PLAN_DAMAGE_REFRESH", "300")),
+)
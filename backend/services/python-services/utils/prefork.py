@@ -0,0 +1,386 @@
+"""
+Pre-fork serving: load the models once, then fork the API workers.
+
+    WEB_WORKERS=4 python -m utils.prefork
+
+The master process loads every model (services.vehicle_processing_service.build),
+runs each once on a blank input so lazily prepared state (OpenCV DNN layer
+setup and packed weights, ultralytics fused layers) exists before the fork,
+moves all objects to the permanent GC generation (gc.freeze) and forks
+WEB_WORKERS workers. Weights live in native buffers that the workers only
+read, so their pages stay shared copy-on-write and N workers use about one
+model footprint; gc.freeze keeps the collector from writing to the headers of
+the inherited Python objects, which would otherwise unshare them page by page.
+
+Workers serve one shared listening socket, so the kernel spreads connections
+between them. Camera work is owned by one worker per camera, chosen by a hash
+of the camera id: every camera-scoped request (/start, /stop, /stream,
+/admin/profile, /demo, /demo_work, /ingest, /lookup and the /jobs/demo and
+/jobs/demo_work submissions) that lands on another worker is forwarded to the
+owner over the owner's loopback port, so a camera's live stream, update
+coalescing, planner state and jobs stay in one process. /stop for all cameras
+is broadcast to all workers. Job ids start with the index of the worker
+holding the job (utils.jobs), so /jobs/{id} is forwarded the same way. Only
+worker 0 drains the outbox.
+
+The cross-camera vehicle index (utils.vehicle_index) is held by worker 0
+(INDEX_WORKER); the other workers send their inserts and queries to it over
+its loopback port (/internal/vehicle_index, refused on the public socket).
+Limitations: each sighting and lookup on another worker costs a loopback
+call; when worker 0 restarts the index starts empty and fills again from new
+sightings, and calls made while it is down are skipped (lookups find
+nothing). /vehicle_index_stats is forwarded to worker 0.
+Responses carry the serving worker in an X-Worker header. /metrics merges the
+metrics of all workers, scraped over their loopback ports, with a worker
+label on every sample; the *_stats endpoints report the worker that answered.
+
+The master restarts a worker that dies (as a new fork of the loaded models,
+no reload) and passes SIGTERM/SIGINT on to the workers.
+
+Threads: no thread may run in the master at fork time, so the outbox drainer
+and the logging writer start in each worker. Models are loaded and warmed up
+with one thread each, because the OpenMP and MNN pools of the master would not
+exist in the workers; MNN sessions keep that single thread, OpenCV and torch
+get the worker's share of the CPU budget (config.resources) after the fork.
+
+Settings:
+    WEB_WORKERS       worker processes (default 1)
+    HOST, PORT        listening address (default 0.0.0.0:5000)
+    WORKER_BASE_PORT  loopback port of worker 0, the others follow (default PORT + 1)
+"""
+import asyncio
+import dataclasses
+import gc
+import logging
+import os
+import re
+import signal
+import socket
+import time
+import zlib
+from dataclasses import dataclass
+
+import httpx
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from config import resources
+from utils import metrics
+from utils.logging_config import setup_logging, stop_logging
+
+logger = logging.getLogger(__name__)
+
+# requests tied to a camera's state, run by the worker owning the camera
+CAMERA_PATH = re.compile(
+    r"^/(?:start|stop|stream|admin/profile|demo|demo_work|ingest|lookup|jobs/demo|jobs/demo_work)/([^/]+)$"
+)
+# worker holding the cross-camera vehicle index, and the requests it serves
+INDEX_WORKER = 0
+INDEX_PATHS = {"/vehicle_index_stats"}
+# job status requests, run by the worker holding the job (its index prefixes the id)
+JOB_PATH = re.compile(r"^/jobs/(\d+)-[0-9a-f]+(?:/events)?$")
+# requests every worker must see
+BROADCAST_PATHS = {"/stop"}
+FORWARDED_HEADER = "x-prefork-forwarded"
+_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length", "host", "upgrade"}
+_FORWARD_TIMEOUT = httpx.Timeout(None, connect=5.0)
+
+
+@dataclass(frozen=True)
+class Worker:
+    index: int
+    count: int
+    ports: tuple  # loopback port of each worker
+
+
+# set in the worker processes; None when the app runs as a single uvicorn process
+worker = None
+
+
+def owner(camera_id, count):
+    """Index of the worker that runs a camera's work."""
+    return zlib.crc32(camera_id.encode()) % count
+
+
+def job_prefix():
+    """Prefix of the job ids of this worker, routing status requests back to it."""
+    return f"{worker.index}-" if worker is not None else ""
+
+
+def _destination(path):
+    """Index of the worker that must serve a path, or None when any worker can."""
+    match = CAMERA_PATH.match(path)
+    if match:
+        return owner(match.group(1), worker.count)
+    match = JOB_PATH.match(path)
+    if match and int(match.group(1)) < worker.count:
+        return int(match.group(1))
+    if path in INDEX_PATHS:
+        return INDEX_WORKER
+    return None
+
+
+def drains_outbox():
+    return worker is None or worker.index == 0
+
+
+def holds_vehicle_index():
+    return worker is None or worker.index == INDEX_WORKER
+
+
+def vehicle_index_url():
+    """Base URL of the vehicle index calls served by INDEX_WORKER."""
+    return f"http://127.0.0.1:{worker.ports[INDEX_WORKER]}/internal/vehicle_index"
+
+
+def internal_only(request):
+    """Dependency of the endpoints only other workers may call: they must arrive on this worker's loopback port."""
+    server = request.scope.get("server") or (None, None)
+    if worker is None or server[1] != worker.ports[worker.index]:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+def _peer_url(index, request):
+    return f"http://127.0.0.1:{worker.ports[index]}{request.url.path}"
+
+
+def _forward_headers(request):
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in _HOP_HEADERS}
+    headers[FORWARDED_HEADER] = str(worker.index)
+    return headers
+
+
+async def forward(request, index):
+    """Proxy a request to another worker, streaming its response back (SSE included)."""
+    client = httpx.AsyncClient(timeout=_FORWARD_TIMEOUT)
+    try:
+        upstream = await client.send(
+            client.build_request(
+                request.method,
+                _peer_url(index, request),
+                params=request.query_params,
+                headers=_forward_headers(request),
+                # uploads (videos for /ingest) are passed on as they arrive, not buffered
+                content=request.stream(),
+            ),
+            stream=True,
+        )
+    except httpx.HTTPError as e:
+        await client.aclose()
+        logger.warning("Forwarding %s to worker %d failed: %s", request.url.path, index, e)
+        return JSONResponse(status_code=503, content={"detail": f"Worker {index} is unavailable."})
+
+    async def body():
+        try:
+            async for chunk in upstream.aiter_raw():
+                yield chunk
+        finally:
+            await upstream.aclose()
+            await client.aclose()
+
+    headers = {k: v for k, v in upstream.headers.items() if k.lower() not in _HOP_HEADERS}
+    return StreamingResponse(body(), status_code=upstream.status_code, headers=headers)
+
+
+async def scrape_metrics(local):
+    """
+    Metrics of all workers, merged with a worker label (utils.metrics.merge_expositions).
+
+    :param local: exposition of this worker
+    """
+    peers = [index for index in range(worker.count) if index != worker.index]
+    async with httpx.AsyncClient(timeout=httpx.Timeout(5.0)) as client:
+        results = await asyncio.gather(
+            *(client.get(f"http://127.0.0.1:{worker.ports[index]}/internal/metrics") for index in peers),
+            return_exceptions=True,
+        )
+    texts = {worker.index: local}
+    for index, result in zip(peers, results):
+        if isinstance(result, Exception) or result.status_code != 200:
+            logger.warning("Scraping the metrics of worker %d failed: %s", index, result)
+            continue
+        texts[index] = result.text
+    return metrics.merge_expositions(dict(sorted(texts.items())))
+
+
+async def broadcast(request):
+    """Send a request to every other worker; failures are logged."""
+    peers = [index for index in range(worker.count) if index != worker.index]
+    async with httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0)) as client:
+        results = await asyncio.gather(
+            *(
+                client.request(
+                    request.method,
+                    _peer_url(index, request),
+                    params=request.query_params,
+                    headers=_forward_headers(request),
+                )
+                for index in peers
+            ),
+            return_exceptions=True,
+        )
+    for index, result in zip(peers, results):
+        if isinstance(result, Exception):
+            logger.warning("Broadcasting %s to worker %d failed: %s", request.url.path, index, result)
+
+
+async def route(request, call_next):
+    """HTTP middleware sending camera-scoped and job requests to the worker that serves them."""
+    if worker is None:
+        return await call_next(request)
+    if FORWARDED_HEADER not in request.headers:
+        path = request.url.path
+        destination = _destination(path)
+        if destination is not None and destination != worker.index:
+            response = await forward(request, destination)
+            response.headers["X-Worker"] = str(worker.index)
+            return response
+        if path in BROADCAST_PATHS:
+            await broadcast(request)
+    response = await call_next(request)
+    response.headers["X-Worker"] = str(worker.index)
+    return response
+
+
+def memory_usage():
+    """Resident, proportional (shared pages divided between processes) and shared bytes of this process."""
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty"):
+                    usage[key] = int(value.split()[0]) * 1024
+    except OSError:
+        return {}
+    return {
+        "rss": usage.get("Rss", 0),
+        "pss": usage.get("Pss", 0),
+        "shared": usage.get("Shared_Clean", 0) + usage.get("Shared_Dirty", 0),
+    }
+
+
+# -- master ---------------------------------------------------------------------
+
+
+def _listen(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(index, shared, private, ports, base_plan, process_plan):
+    """Body of a forked worker; never returns."""
+    global worker
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    setup_logging()
+    code = 0
+    try:
+        import uvicorn
+        from controllers import vehicle_processing_controller as controller
+
+        worker = Worker(index, len(ports), ports)
+        cores = process_plan.partition(index)
+        if base_plan.pin:
+            # inherited by every thread the worker starts
+            resources.pin_current_thread(cores)
+        resources.plan = resources.make_plan(
+            cores=cores,
+            workers=base_plan.workers,
+            executor_workers=base_plan.executor_workers,
+            pin=base_plan.pin,
+        )
+        logger.info("Worker %d started (pid %d, cores %s)", index, os.getpid(), list(cores))
+        config = uvicorn.Config(controller.app, log_config=None)
+        uvicorn.Server(config).run(sockets=[shared, private])
+    except BaseException as e:
+        logger.exception("Worker %d failed: %s", index, e)
+        code = 1
+    finally:
+        stop_logging()
+        os._exit(code)
+
+
+def _fork(index, shared, privates, base_plan, process_plan):
+    ports = tuple(sock.getsockname()[1] for sock in privates)
+    # the logging writer is a thread; it is stopped around the fork and restarted on both sides
+    stop_logging()
+    pid = os.fork()
+    if pid == 0:
+        for i, sock in enumerate(privates):
+            if i != index:
+                sock.close()
+        _run_worker(index, shared, privates[index], ports, base_plan, process_plan)
+    setup_logging()
+    return pid
+
+
+def serve(workers=None, host=None, port=None, base_port=None):
+    """Load the models, fork the workers and restart them until SIGTERM/SIGINT."""
+    workers = max(1, workers or int(os.getenv("WEB_WORKERS", "1")))
+    host = host or os.getenv("HOST", "0.0.0.0")
+    port = port or int(os.getenv("PORT", "5000"))
+    base_port = base_port or int(os.getenv("WORKER_BASE_PORT", str(port + 1)))
+    setup_logging()
+
+    from controllers import vehicle_processing_controller as controller
+    from services.vehicle_processing_service import build, warm_up
+
+    base_plan = resources.plan_from_env()
+    process_plan = resources.make_plan(cores=base_plan.cores, workers=workers, pin=base_plan.pin)
+    # single-threaded loading, see the module docstring
+    resources.plan = dataclasses.replace(base_plan, threads_per_worker=1)
+    started = time.perf_counter()
+    answers = build()
+    controller.models = answers["models"]
+    controller.models_loaded = True
+    warm_up(controller.models)
+    logger.info("Models loaded in %.2fs: %s", time.perf_counter() - started, answers["status"])
+
+    shared = _listen(host, port)
+    privates = [_listen("127.0.0.1", base_port + index) for index in range(workers)]
+    gc.collect()
+    gc.freeze()
+    logger.info("Master %d: %s, forking %d workers", os.getpid(), memory_usage(), workers)
+
+    children = {}
+    for index in range(workers):
+        children[_fork(index, shared, privates, base_plan, process_plan)] = index
+
+    stopping = False
+
+    def terminate(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        logger.warning(
+            "Worker %d (pid %d) exited with %s, restarting", index, pid, os.waitstatus_to_exitcode(status)
+        )
+        # a worker failing at startup would otherwise be restarted in a tight loop
+        time.sleep(1)
+        children[_fork(index, shared, privates, base_plan, process_plan)] = index
+    logger.info("All workers stopped")
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,232 @@
+"""
+On-demand profiling and per-frame tracing of the camera work loop.
+
+Nothing here runs unless a ProfileSession is active: the hot path only reads
+the module global `active` (and metrics.span_hook), both None by default.
+
+Modes:
+  sample   - statistical sampler over the threads working for the camera,
+             returns collapsed stacks ("a;b;c count"), ready for flamegraph.pl
+             or speedscope
+  cprofile - cProfile on those threads, returns pstats text sorted by cumulative time.
+             From Python 3.12 only one profiler can be active in a process, so
+             per-thread profiles are impossible and the session samples instead
+             (ProfileSession.mode tells which mode ran)
+Trace spans (optional) record every metrics stage with its frame id, returned in
+the Chrome trace event format (chrome://tracing, Perfetto): the process is the
+real pid, each thread a track, and the camera is named in the metadata events
+and the span args.
+"""
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from utils import metrics
+
+active = None
+_lock = threading.Lock()
+
+# cProfile uses sys.monitoring from 3.12 on, which allows one profiler per process
+CPROFILE_PER_THREAD = sys.version_info < (3, 12)
+# longest session in frames, like the 300 s bound of its duration
+MAX_FRAMES = 10_000
+
+
+class ProfileSession:
+    def __init__(self, camera_id, seconds=10.0, frames=None, mode="sample",
+                 interval=0.005, trace=False, max_spans=100_000):
+        """
+        :param camera_id: camera whose work loop is profiled
+        :param seconds: maximum duration of the session
+        :param frames: stop after this many frames of the loop (None for time only)
+        :param mode: "sample" or "cprofile"
+        :param interval: sampling interval in seconds (sample mode)
+        :param trace: also record per-frame trace spans
+        :param max_spans: cap on recorded spans
+        """
+        if mode not in ("sample", "cprofile"):
+            raise ValueError(f"Unknown profiling mode {mode}")
+        if frames is not None and not 0 < frames <= MAX_FRAMES:
+            raise ValueError(f"frames must be in (0, {MAX_FRAMES}]")
+        self.camera_id = camera_id
+        self.seconds = seconds
+        self.frames_left = frames
+        self.requested_mode = mode
+        self.mode = mode if mode == "sample" or CPROFILE_PER_THREAD else "sample"
+        self.interval = interval
+        self.trace = trace
+        self.max_spans = max_spans
+        self.frames_seen = 0
+        self.samples = Counter()
+        self.spans = []
+        self.done = threading.Event()
+        self._threads = {}
+        self._threads_lock = threading.Lock()
+        self._profiles = []
+        self._sampler = None
+        self._started = None
+
+    # -- thread scope ------------------------------------------------------------
+
+    def enter_thread(self, camera_id):
+        """Mark the current thread as working for the camera; returns a token for leave_thread."""
+        if camera_id != self.camera_id or self.done.is_set():
+            return None
+        ident = threading.get_ident()
+        with self._threads_lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+        profile = None
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiling tool is active; this thread goes unprofiled
+                profile = None
+        return (ident, profile)
+
+    def leave_thread(self, token):
+        if token is None:
+            return
+        ident, profile = token
+        if profile is not None:
+            profile.disable()
+            with self._threads_lock:
+                self._profiles.append(profile)
+        with self._threads_lock:
+            count = self._threads.get(ident, 1) - 1
+            if count:
+                self._threads[ident] = count
+            else:
+                self._threads.pop(ident, None)
+
+    # -- sampling ----------------------------------------------------------------
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        deadline = self._started + self.seconds
+        while not self.done.wait(self.interval):
+            if time.monotonic() >= deadline:
+                self.finish()
+                break
+            with self._threads_lock:
+                idents = [i for i in self._threads if i != me]
+            if not idents:
+                continue
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples[";".join(stack)] += 1
+
+    # -- spans -------------------------------------------------------------------
+
+    def record_span(self, stage, camera_id, started, duration):
+        if camera_id != self.camera_id or len(self.spans) >= self.max_spans:
+            return
+        self.spans.append(
+            {
+                "name": stage,
+                "ph": "X",
+                "ts": round(started * 1e6, 1),
+                "dur": round(duration * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {"frame": metrics.current_frame.get(), "camera_id": camera_id},
+            }
+        )
+
+    # -- lifecycle ---------------------------------------------------------------
+
+    def start(self):
+        self._started = time.monotonic()
+        if self.trace:
+            metrics.span_hook = self.record_span
+        if self.mode == "sample":
+            self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+            self._sampler.start()
+        else:
+            timer = threading.Timer(self.seconds, self.finish)
+            timer.daemon = True
+            timer.start()
+
+    def frame_done(self, camera_id):
+        if camera_id != self.camera_id:
+            return
+        self.frames_seen += 1
+        if self.frames_left is not None:
+            self.frames_left -= 1
+            if self.frames_left <= 0:
+                self.finish()
+
+    def finish(self):
+        global active
+        if self.done.is_set():
+            return
+        self.done.set()
+        with _lock:
+            if active is self:
+                active = None
+        if metrics.span_hook == self.record_span:
+            metrics.span_hook = None
+
+    async def wait(self, timeout, poll=0.1):
+        """Wait until the session ended or timeout seconds passed, on the event loop (no executor thread)."""
+        deadline = time.monotonic() + timeout
+        while not self.done.is_set() and time.monotonic() < deadline:
+            await asyncio.sleep(poll)
+        return self.done.is_set()
+
+    # -- results -----------------------------------------------------------------
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def pstats_text(self, limit=80):
+        with self._threads_lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return "no frames were profiled\n"
+        out = io.StringIO()
+        stats = pstats.Stats(profiles[0], stream=out)
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def trace_events(self):
+        pid = os.getpid()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        metadata = [
+            {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"camera {self.camera_id}"}}
+        ]
+        for tid in sorted({span["tid"] for span in self.spans}):
+            metadata.append(
+                {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": names.get(tid, str(tid))}}
+            )
+        return {"traceEvents": metadata + list(self.spans), "displayTimeUnit": "ms"}
+
+
+def start_session(**kwargs):
+    """Start a session; raises RuntimeError if one is already running."""
+    global active
+    with _lock:
+        if active is not None:
+            raise RuntimeError("A profiling session is already running.")
+        session = ProfileSession(**kwargs)
+        active = session
+    session.start()
+    return session
@@ -0,0 +1,355 @@
+"""
+Build reduced-precision model variants and gate them against FP32.
+
+`build` writes the artifact of a variant next to the original model
+(config.model_variants.artifact_path); runtime-only variants (FP16 targets in
+OpenCV DNN) need no artifact. `gate` runs FP32 and the variant on a folder of
+sample images, compares their outputs and records the result in the manifest
+read at model loading: a variant scoring below the threshold is refused.
+
+Scores: label agreement with FP32 for the classifiers, mean per-image F1 of
+boxes matched to the FP32 boxes (same class, IoU >= 0.5) for the detectors.
+
+Run from services/python-services:
+    python -m utils.quantize build make_classifier int8
+    python -m utils.quantize build damage int8 --samples <images_dir>
+    python -m utils.quantize gate make_classifier int8 <images_dir>
+    python -m utils.quantize list
+
+Building needs the converter of each format: mnnconvert (shipped with MNN)
+for the classifiers, onnxruntime for ONNX quantization and ultralytics to
+export the blur models to ONNX.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import cv2
+import numpy as np
+
+from config import model_variants
+from config.model_variants import FP32, VARIANTS, Variant
+from utils.evaluate import BASE_PATH, IMAGE_EXTENSIONS
+
+# minimum score of a variant, per kind of model
+THRESHOLDS = {"classifier": 0.98, "detector": 0.90}
+MATCH_IOU = 0.5
+
+_VENDORED = {
+    "vehicle": "vehicle-recognition-api-yolov4-python-master",
+    "damage": "Damaged-Car-parts-prediction-Model",
+    "blur": "face-bluring",
+}
+
+
+def _vendored(name):
+    path = os.path.join(BASE_PATH, _VENDORED[name])
+    if path not in sys.path:
+        sys.path.append(path)
+
+
+def kind(model):
+    return "classifier" if model.endswith("_classifier") else "detector"
+
+
+def fp32_path(model):
+    """Path of the original model file."""
+    if model in ("vehicle_detector", "make_classifier", "color_classifier"):
+        _vendored("vehicle")
+        from vehicle_detection import get_items
+
+        return get_items()[{"vehicle_detector": 1, "make_classifier": 2, "color_classifier": 3}[model]]
+    if model == "damage":
+        _vendored("damage")
+        from car_parts import model_path
+
+        return model_path()
+    if model in ("blur_face", "blur_plate"):
+        _vendored("blur")
+        from blur import load_model
+
+        return load_model()[0 if model == "blur_face" else 1]
+    raise ValueError(f"Unknown model {model}")
+
+
+def sample_images(folder, limit=None):
+    files = sorted(
+        os.path.join(folder, name)
+        for name in os.listdir(folder)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return files[:limit] if limit else files
+
+
+# -- build --------------------------------------------------------------------
+
+
+def _mnnconvert(source, target, variant):
+    tool = shutil.which("mnnconvert")
+    if tool is None:
+        raise RuntimeError("mnnconvert not found; it is installed with the MNN package")
+    args = [tool, "-f", "MNN", "--modelFile", source, "--MNNModel", target, "--bizCode", "MNN"]
+    args += ["--fp16"] if variant == "fp16" else ["--weightQuantBits", "8"]
+    subprocess.run(args, check=True)
+
+
+def _damage_calibration(model_file, samples, count=64):
+    from onnxruntime.quantization import CalibrationDataReader
+
+    import onnx
+
+    input_name = onnx.load(model_file).graph.input[0].name
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._images = iter(samples[:count])
+
+        def get_next(self):
+            path = next(self._images, None)
+            if path is None:
+                return None
+            image = cv2.imread(path)
+            blob = cv2.dnn.blobFromImage(image, 1 / 255.0, (640, 640), swapRB=True, crop=False)
+            return {input_name: blob}
+
+    return Reader()
+
+
+def _quantize_damage(source, target, samples):
+    try:
+        from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+    except ImportError as e:
+        raise RuntimeError("ONNX quantization needs onnxruntime") from e
+    if not samples:
+        raise ValueError("Static INT8 quantization needs --samples for calibration")
+    # QOperator (QLinearConv, ...) is the quantized form OpenCV DNN can run
+    quantize_static(
+        source,
+        target,
+        _damage_calibration(source, samples),
+        quant_format=QuantFormat.QOperator,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+
+
+def _quantize_blur(source, target):
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        from ultralytics import YOLO
+    except ImportError as e:
+        raise RuntimeError("Blur model quantization needs ultralytics and onnxruntime") from e
+    exported = YOLO(source).export(format="onnx", imgsz=640)
+    try:
+        quantize_dynamic(exported, target, weight_type=QuantType.QUInt8)
+    finally:
+        if os.path.exists(exported):
+            os.remove(exported)
+
+
+def build(model, variant, samples=None):
+    """
+    Produce the artifact of a variant from the FP32 model.
+
+    :param samples: sample image paths, used for calibration where needed
+    :return: path of the artifact, or None for runtime-only variants
+    """
+    if variant not in VARIANTS.get(model, {}):
+        raise ValueError(f"{model} has no {variant} variant")
+    source = fp32_path(model)
+    target = model_variants.artifact_path(source, model, variant)
+    if target is None:
+        print(f"{model} {variant} is a runtime setting, nothing to build")
+        return None
+    if kind(model) == "classifier":
+        _mnnconvert(source, target, variant)
+    elif model == "damage":
+        _quantize_damage(source, target, samples)
+    else:
+        _quantize_blur(source, target)
+    return target
+
+
+# -- gate ---------------------------------------------------------------------
+
+
+def _runner(model, variant):
+    """Callable image -> labels (classifiers) or [(class, (x, y, w, h))] (detectors)."""
+    if model == "vehicle_detector":
+        _vendored("vehicle")
+        from vehicle_detection import get_items
+
+        items = get_items()
+        net = cv2.dnn_DetectionModel(items[0], variant.path)
+        if variant.dnn_target is not None:
+            net.setPreferableTarget(variant.dnn_target)
+        net.setInputSize(608, 608)
+        net.setInputScale(1.0 / 255)
+        net.setInputSwapRB(True)
+
+        def detect(image):
+            classes, _, boxes = net.detect(image, confThreshold=0.1, nmsThreshold=0.4)
+            return [(int(c), tuple(int(v) for v in b)) for c, b in zip(np.ravel(classes), boxes)]
+
+        return detect
+    if kind(model) == "classifier":
+        _vendored("vehicle")
+        import classifier
+        from vehicle_detection import get_items
+
+        labels = get_items()[5 if model == "make_classifier" else 4]
+        net = classifier.Classifier(variant.path, labels, embedding_tensor=None, precision=variant.precision)
+        return lambda image: net.predict(image)[0]
+    if model == "damage":
+        _vendored("damage")
+        from car_parts import set_detection
+
+        net = set_detection(variant.path, variant.dnn_target)
+
+        def detect(image):
+            result = net(image)
+            return list(zip(result["classes"], (tuple(b) for b in result["boxes"])))
+
+        return detect
+    _vendored("blur")
+    from ultralytics import YOLO
+
+    net = YOLO(variant.path, task="detect")
+
+    def detect(image):
+        found = []
+        for result in net.predict(source=image, verbose=False):
+            for box in result.boxes:
+                x1, y1, x2, y2 = (float(v) for v in box.xyxy[0])
+                found.append((int(box.cls[0]), (x1, y1, x2 - x1, y2 - y1)))
+        return found
+
+    return detect
+
+
+def _iou(a, b):
+    w = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    h = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    inter = max(w, 0) * max(h, 0)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def box_f1(reference, candidate, iou=MATCH_IOU):
+    """F1 of candidate boxes against reference boxes, greedily matched by class and IoU."""
+    if not reference and not candidate:
+        return 1.0
+    unmatched = list(candidate)
+    hits = 0
+    for label, box in reference:
+        best = max(
+            (c for c in unmatched if c[0] == label),
+            key=lambda c: _iou(box, c[1]),
+            default=None,
+        )
+        if best is not None and _iou(box, best[1]) >= iou:
+            unmatched.remove(best)
+            hits += 1
+    return 2 * hits / (len(reference) + len(candidate))
+
+
+def compare(model, variant, images):
+    """
+    Run FP32 and a variant on the same images.
+
+    :return: dict with "score", "samples" and the mean seconds per image of each
+    """
+    source = fp32_path(model)
+    spec = VARIANTS[model][variant]
+    candidate = Variant(
+        model,
+        variant,
+        model_variants.artifact_path(source, model, variant) or source,
+        {k: v for k, v in spec.items() if k != "artifact"},
+    )
+    runs = {}
+    for name, run in ((FP32, _runner(model, Variant(model, FP32, source))), (variant, _runner(model, candidate))):
+        outputs = []
+        started = time.perf_counter()
+        for path in images:
+            outputs.append(run(cv2.imread(path)))
+        runs[name] = (outputs, (time.perf_counter() - started) / max(len(images), 1))
+    reference, fp32_seconds = runs[FP32]
+    outputs, variant_seconds = runs[variant]
+    if kind(model) == "classifier":
+        scores = [float(a == b) for a, b in zip(reference, outputs)]
+    else:
+        scores = [box_f1(a, b) for a, b in zip(reference, outputs)]
+    return {
+        "score": round(float(np.mean(scores)), 4) if scores else 0.0,
+        "samples": len(images),
+        "fp32_seconds": round(fp32_seconds, 5),
+        "variant_seconds": round(variant_seconds, 5),
+        "speedup": round(fp32_seconds / variant_seconds, 2) if variant_seconds else None,
+    }
+
+
+def gate(model, variant, images, threshold=None, manifest_path=model_variants.MANIFEST_PATH):
+    """
+    Evaluate a variant and record in the manifest whether it may be loaded.
+
+    :return: the manifest entry
+    """
+    threshold = THRESHOLDS[kind(model)] if threshold is None else threshold
+    if not images:
+        raise ValueError("No sample images")
+    entry = compare(model, variant, images)
+    entry["threshold"] = threshold
+    entry["approved"] = entry["score"] >= threshold
+    artifact = model_variants.artifact_path(fp32_path(model), model, variant)
+    entry["sha256"] = model_variants.file_hash(artifact) if artifact else None
+    entry["evaluated_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    manifest = model_variants.load_manifest(manifest_path)
+    manifest[f"{model}:{variant}"] = entry
+    model_variants.save_manifest(manifest, manifest_path)
+    return entry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reduced-precision model variants.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_cmd = sub.add_parser("build", help="produce the artifact of a variant")
+    build_cmd.add_argument("model", choices=sorted(VARIANTS))
+    build_cmd.add_argument("variant")
+    build_cmd.add_argument("--samples", help="image folder for calibration")
+    build_cmd.add_argument("--limit", type=int, default=200)
+
+    gate_cmd = sub.add_parser("gate", help="compare a variant with FP32 and record the verdict")
+    gate_cmd.add_argument("model", choices=sorted(VARIANTS))
+    gate_cmd.add_argument("variant")
+    gate_cmd.add_argument("samples", help="image folder")
+    gate_cmd.add_argument("--limit", type=int, default=200)
+    gate_cmd.add_argument("--threshold", type=float)
+
+    sub.add_parser("list", help="variants and their gate results")
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        samples = sample_images(args.samples, args.limit) if args.samples else None
+        result = {"artifact": build(args.model, args.variant, samples)}
+    elif args.command == "gate":
+        result = gate(args.model, args.variant, sample_images(args.samples, args.limit), args.threshold)
+    else:
+        manifest = model_variants.load_manifest()
+        result = {
+            model: {variant: manifest.get(f"{model}:{variant}") for variant in variants}
+            for model, variants in VARIANTS.items()
+        }
+    print(json.dumps(result, indent=2))
+    if args.command == "gate" and not result["approved"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Typed record of a detected vehicle, passed from process_image through damage
+detection, matching and publishing. It is converted to the VehicleBoundary
+JSON shape (to_dict) only where it leaves the service: Kafka, HTTP responses
+and the SSE stream.
+"""
+from dataclasses import dataclass
+from typing import Any, Optional
+
+
+@dataclass(slots=True)
+class VehicleRecord:
+    camera_id: str
+    type: str
+    manufacturer: str
+    color: str
+    type_prob: float
+    manufacturer_prob: float
+    color_prob: float
+    left: int
+    top: int
+    width: int
+    height: int
+    description: str = ""
+    embedding: Optional[str] = None
+    image_url: str = "none"
+    details: Optional[dict] = None
+    # damage detection ran on this frame's crop (False when the planner skipped it)
+    damage_checked: bool = False
+
+    @property
+    def latitude(self):
+        return round(self.top + self.height / 2, 3)
+
+    @property
+    def longitude(self):
+        return round(self.left + self.width / 2, 3)
+
+    def crop(self, image):
+        """View of the vehicle in the frame (no copy)."""
+        return image[self.top : self.top + self.height, self.left : self.left + self.width]
+
+    def to_dict(self):
+        """VehicleBoundary JSON shape, as sent to the data service."""
+        vehicle = {
+            "id": 0,
+            "cameraId": self.camera_id,
+            "type": self.type,
+            "manufacturer": self.manufacturer,
+            "color": self.color,
+            "typeProb": self.type_prob,
+            "manufacturerProb": self.manufacturer_prob,
+            "colorProb": self.color_prob,
+            "imageUrl": self.image_url,
+            "description": self.description,
+            "stayDuration": 0,
+            "top": self.top,
+            "left": self.left,
+            "width": self.width,
+            "height": self.height,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "embedding": self.embedding,
+        }
+        if self.details is not None:
+            vehicle["details"] = self.details
+        return vehicle
+
+
+def vehicle_field(vehicle, key, default=None):
+    """Read a VehicleBoundary field from either a record or a vehicle dict."""
+    if isinstance(vehicle, dict):
+        return vehicle.get(key, default)
+    return getattr(vehicle, _ATTRIBUTES.get(key, key), default)
+
+
+_ATTRIBUTES = {
+    "cameraId": "camera_id",
+    "typeProb": "type_prob",
+    "manufacturerProb": "manufacturer_prob",
+    "colorProb": "color_prob",
+    "imageUrl": "image_url",
+}
+
+
+def plain(value: Any):
+    """Replace records by their dicts in nested lists/dicts, for HTTP responses."""
+    if isinstance(value, VehicleRecord):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {k: plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    return value
+
+
+def json_default(value):
+    """json.dumps default= hook: records as dicts, anything else as str."""
+    if isinstance(value, VehicleRecord):
+        return value.to_dict()
+    return str(value)
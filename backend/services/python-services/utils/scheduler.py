@@ -0,0 +1,200 @@
+"""
+Earliest-deadline-first scheduling of the camera work loops.
+
+Each camera loop registers a target period (seconds between frames) and a
+priority (higher is more important, e.g. 2 for entrances, 0 for back rows).
+A frame is released at the start of its period and is due one period later.
+Released frames wait for one of `slots` frame slots, granted to the
+earliest deadline first, ties going to the higher priority. The inference
+calls of a frame then take a slot of the admission gate (utils.admission),
+shared with the HTTP requests, jobs and ingest.
+
+Under overload the frames that can no longer meet their deadline are where
+the cameras differ: when a slot frees up, a frame of a camera below
+`protected_priority` that would finish after its deadline (judged from the
+camera's recent frame times) is shed instead of run: it is skipped, counted
+in vehicle_processing_frames_shed_total, and the camera waits for its next
+period. Protected cameras run their late frames, so they keep their rate
+while the others lose frames. Frames finishing after their deadline are
+counted as misses. A camera that overruns its period is not made to catch
+up: its next frame is released when the late one ends, not once per missed
+period.
+
+All methods run on the event loop; there is no locking.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from dataclasses import dataclass
+
+from utils import metrics
+
+@dataclass
+class CameraSchedule:
+    camera_id: str
+    period: float
+    priority: int
+    next_release: float
+    deadline: float = 0.0
+    started: float = 0.0
+    # moving average of the seconds a frame holds a slot
+    service: float = 0.0
+    frames: int = 0
+    shed: int = 0
+    misses: int = 0
+    waited: float = 0.0
+    lateness: float = 0.0
+
+    def as_dict(self):
+        return {
+            "period": self.period,
+            "priority": self.priority,
+            "frames": self.frames,
+            "shed": self.shed,
+            "deadline_misses": self.misses,
+            "mean_frame_seconds": round(self.service, 4),
+            "mean_wait_seconds": round(self.waited / self.frames, 4) if self.frames else 0.0,
+            "mean_lateness_seconds": round(self.lateness / self.misses, 4) if self.misses else 0.0,
+        }
+
+
+class FrameScheduler:
+    def __init__(self, slots=1, protected_priority=2, default_period=1.0, default_priority=1,
+                 smoothing=0.2, clock=time.monotonic):
+        """
+        :param slots: frames processed at the same time
+        :param protected_priority: cameras at or above it never have frames shed
+        :param default_period: seconds between frames of a camera registered without one
+        :param default_priority: priority of a camera registered without one
+        :param smoothing: weight of the last frame in the moving average of frame times
+        :param clock: time source, seconds
+        """
+        self.slots = slots
+        self.protected_priority = protected_priority
+        self.default_period = default_period
+        self.default_priority = default_priority
+        self.smoothing = smoothing
+        self.clock = clock
+        self.cameras = {}
+        self.busy = 0
+        self._waiting = []  # heap of (deadline, -priority, seq, camera_id, future)
+        self._seq = itertools.count()
+
+    def register(self, camera_id, period=None, priority=None):
+        """Add a camera, its first frame released now."""
+        schedule = CameraSchedule(
+            camera_id,
+            period=float(period or self.default_period),
+            priority=self.default_priority if priority is None else int(priority),
+            next_release=self.clock(),
+        )
+        self.cameras[camera_id] = schedule
+        return schedule
+
+    def unregister(self, camera_id):
+        self.cameras.pop(camera_id, None)
+
+    def _dispatch(self):
+        while self._waiting and self.busy < self.slots:
+            deadline, _, _, camera_id, future = heapq.heappop(self._waiting)
+            if future.done():
+                # its loop was cancelled while waiting
+                continue
+            schedule = self.cameras.get(camera_id)
+            if (
+                schedule is not None
+                and schedule.priority < self.protected_priority
+                and self.clock() + schedule.service > deadline
+            ):
+                future.set_result(False)
+                continue
+            self.busy += 1
+            future.set_result(True)
+
+    async def acquire(self, camera_id, stop=None):
+        """
+        Wait for the camera's next release and an inference slot.
+
+        :param stop: asyncio.Event ending the wait early
+        :return: True with a slot held (call release), False when the frame was
+                 shed or stop was set
+        """
+        schedule = self.cameras[camera_id]
+        delay = schedule.next_release - self.clock()
+        if delay > 0:
+            if stop is None:
+                await asyncio.sleep(delay)
+            else:
+                try:
+                    await asyncio.wait_for(stop.wait(), delay)
+                    return False
+                except asyncio.TimeoutError:
+                    pass
+        if stop is not None and stop.is_set():
+            return False
+
+        # a loop back late from an overrun is released now, it does not catch up
+        released = self.clock()
+        schedule.deadline = released + schedule.period
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._waiting, (schedule.deadline, -schedule.priority, next(self._seq), camera_id, future)
+        )
+        self._dispatch()
+        try:
+            granted = await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.result():
+                self._free()
+            raise
+
+        if not granted:
+            schedule.shed += 1
+            metrics.frames_shed_total.inc(camera_id)
+            schedule.next_release = max(schedule.deadline, self.clock())
+            return False
+        now = self.clock()
+        schedule.next_release = max(released + schedule.period, now)
+        schedule.waited += now - released
+        schedule.started = now
+        return True
+
+    def _free(self):
+        self.busy -= 1
+        self._dispatch()
+
+    def release(self, camera_id):
+        """Give the slot back and record whether the frame met its deadline."""
+        self._free()
+        schedule = self.cameras.get(camera_id)
+        if schedule is None:
+            return
+        now = self.clock()
+        seconds = now - schedule.started
+        schedule.service = seconds if not schedule.frames else (
+            self.smoothing * seconds + (1 - self.smoothing) * schedule.service
+        )
+        schedule.frames += 1
+        late = now - schedule.deadline
+        if late > 0:
+            schedule.misses += 1
+            schedule.lateness += late
+            metrics.deadline_misses_total.inc(camera_id)
+
+    def stats(self):
+        return {
+            "slots": self.slots,
+            "busy": self.busy,
+            "waiting": sum(1 for entry in self._waiting if not entry[-1].done()),
+            "protected_priority": self.protected_priority,
+            "cameras": {camera_id: s.as_dict() for camera_id, s in self.cameras.items()},
+        }
+
+
+scheduler = FrameScheduler(
+    protected_priority=int(os.getenv("SCHED_PROTECTED_PRIORITY", "2")),
+    default_period=float(os.getenv("SCHED_DEFAULT_PERIOD", "1.0")),
+    default_priority=int(os.getenv("SCHED_DEFAULT_PRIORITY", "1")),
+)
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from utils.records import json_default
+
+
+class StreamSubscriber:
+    """
+    A single stream client.
+
+    Only the latest undelivered message is kept: when the client is slower than
+    the producer, older frames are overwritten (coalesced) instead of queued, so a
+    slow dashboard can never make the processing loop wait or grow memory.
+    """
+
+    def __init__(self, camera_id):
+        self.camera_id = camera_id
+        self.latest = None
+        self.delivered = 0
+        self.coalesced = 0
+        self._ready = asyncio.Event()
+
+    def offer(self, message):
+        if self.latest is not None:
+            self.coalesced += 1
+        self.latest = message
+        self._ready.set()
+
+    async def next(self, timeout=None):
+        """
+        Wait for the next message.
+
+        :param timeout: seconds to wait before giving up (None waits forever)
+        :return: the latest serialized message, or None on timeout
+        """
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._ready.clear()
+        message, self.latest = self.latest, None
+        if message is not None:
+            self.delivered += 1
+        return message
+
+
+class StreamHub:
+    """
+    In-process fan-out of per-frame detection results to stream subscribers.
+
+    Messages are serialized once per frame and handed to every subscriber of the
+    camera; publishing with no subscribers costs a dict lookup.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._frames = {}
+        self._loop = None
+
+    def subscribe(self, camera_id):
+        self._loop = asyncio.get_running_loop()
+        subscriber = StreamSubscriber(camera_id)
+        self._subscribers.setdefault(camera_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscribers = self._subscribers.get(subscriber.camera_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[subscriber.camera_id]
+
+    def publish(self, camera_id, vehicles, matches=None, sightings=None):
+        """
+        Push one frame's vehicles and match decisions to the camera's subscribers.
+        Safe to call from the event loop or from executor threads.
+
+        :param camera_id: camera the frame belongs to
+        :param vehicles: list of detected vehicle dicts
+        :param matches: match decisions produced for the frame
+        :param sightings: new vehicles of the frame recently seen on other cameras
+        :return: the frame number assigned to this message
+        """
+        frame = self._frames.get(camera_id, 0) + 1
+        self._frames[camera_id] = frame
+        if not self._subscribers.get(camera_id):
+            return frame
+
+        message = json.dumps(
+            {
+                "cameraId": camera_id,
+                "frame": frame,
+                "timestamp": datetime.now().astimezone().isoformat(),
+                "vehicles": vehicles,
+                "matches": matches,
+                "sightings": sightings or [],
+            },
+            default=json_default,
+        )
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._deliver(camera_id, message)
+        elif self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._deliver, camera_id, message)
+        return frame
+
+    def _deliver(self, camera_id, message):
+        for subscriber in list(self._subscribers.get(camera_id, ())):
+            subscriber.offer(message)
+
+    def stats(self):
+        return {
+            camera_id: {
+                "subscribers": len(subscribers),
+                "frames": self._frames.get(camera_id, 0),
+                "delivered": sum(s.delivered for s in subscribers),
+                "coalesced": sum(s.coalesced for s in subscribers),
+            }
+            for camera_id, subscribers in self._subscribers.items()
+        }
+
+
+stream_hub = StreamHub()
+
+
+async def sse_events(request, subscriber, keep_alive=15.0):
+    """
+    Server-Sent-Events generator for a subscriber. Emits a comment line every
+    `keep_alive` seconds of silence so proxies keep the connection open.
+    """
+    try:
+        while not await request.is_disconnected():
+            message = await subscriber.next(timeout=keep_alive)
+            if message is None:
+                yield f": keep-alive {int(time.time())}\n\n"
+            else:
+                yield f"data: {message}\n\n"
+    finally:
+        stream_hub.unsubscribe(subscriber)
@@ -0,0 +1,120 @@
+"""
+Coalescing of vehicle-update events.
+
+A parked vehicle matches on every frame; sending each match as a full update
+only tells the data service what it already knows. An update is sent when, for
+the same vehicle id, the outgoing message differs from the last one sent:
+
+* position (latitude/longitude, the bbox center) moved more than
+  `position_tolerance` pixels;
+* size (bbox width/height) changed more than `size_tolerance` pixels, e.g. a
+  vehicle partly hidden and then uncovered with the same center;
+* labels (type, manufacturer, color), damage (description) or alert changed;
+* `heartbeat` seconds passed, so the data service refreshes the stay duration.
+
+Everything else is suppressed. State is per process and bounded to
+`max_entries` vehicles (least recently updated are forgotten, their next
+update is sent).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+TRACKED_FIELDS = ("type", "manufacturer", "color", "description", "alert")
+# compared with a tolerance: the bbox center, then its size
+BOX_FIELDS = ("latitude", "longitude", "width", "height")
+
+
+class UpdateCoalescer:
+    def __init__(
+        self, position_tolerance=8.0, size_tolerance=8.0, heartbeat=30.0, max_entries=10000, clock=time.monotonic
+    ):
+        """
+        :param position_tolerance: pixels the bbox center may move without an update
+        :param size_tolerance: pixels the bbox width or height may change without an update
+        :param heartbeat: seconds after which an unchanged vehicle is sent again
+        :param max_entries: vehicles whose last sent state is kept
+        :param clock: time source, seconds
+        """
+        self.position_tolerance = position_tolerance
+        self.size_tolerance = size_tolerance
+        self.heartbeat = heartbeat
+        self.max_entries = max_entries
+        self.clock = clock
+        self._sent = OrderedDict()  # vehicle id -> (sent_at, (latitude, longitude, width, height), tracked values)
+        self._lock = threading.Lock()
+        self.sent = {"new": 0, "changed": 0, "moved": 0, "heartbeat": 0}
+        self.suppressed = 0
+
+    def _moved(self, vehicle, last):
+        tolerances = (self.position_tolerance,) * 2 + (self.size_tolerance,) * 2
+        for key, previous, tolerance in zip(BOX_FIELDS, last[1], tolerances):
+            value = vehicle.get(key)
+            if (value is None) != (previous is None):
+                return True
+            if value is not None and abs(value - previous) > tolerance:
+                return True
+        return False
+
+    def check(self, vehicle):
+        """
+        Decide whether an update of this vehicle is sent. Nothing is recorded
+        until commit(), so an update that could not be queued is retried on the
+        next frame instead of being suppressed until the heartbeat.
+
+        :param vehicle: the vehicle dict about to be published
+        :return: the reason it is sent ("new", "changed", "moved", "heartbeat"),
+                 or None when it is suppressed
+        """
+        vehicle_id = vehicle.get("id")
+        if vehicle_id is None:
+            return "new"
+        tracked = tuple(vehicle.get(key) for key in TRACKED_FIELDS)
+        now = self.clock()
+        with self._lock:
+            last = self._sent.get(vehicle_id)
+            if last is None:
+                return "new"
+            if tracked != last[2]:
+                return "changed"
+            if self._moved(vehicle, last):
+                return "moved"
+            if now - last[0] >= self.heartbeat:
+                return "heartbeat"
+            self.suppressed += 1
+            return None
+
+    def commit(self, vehicle, reason):
+        """Record the update of a vehicle as sent, for the reason check() gave."""
+        with self._lock:
+            self.sent[reason] += 1
+            vehicle_id = vehicle.get("id")
+            if vehicle_id is None:
+                return
+            self._sent[vehicle_id] = (
+                self.clock(),
+                tuple(vehicle.get(key) for key in BOX_FIELDS),
+                tuple(vehicle.get(key) for key in TRACKED_FIELDS),
+            )
+            self._sent.move_to_end(vehicle_id)
+            while len(self._sent) > self.max_entries:
+                self._sent.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            sent = dict(self.sent)
+            total = sum(sent.values()) + self.suppressed
+            return {
+                "sent": sent,
+                "suppressed": self.suppressed,
+                "suppression_ratio": round(self.suppressed / total, 4) if total else 0.0,
+                "tracked_vehicles": len(self._sent),
+            }
+
+
+update_coalescer = UpdateCoalescer(
+    position_tolerance=float(os.getenv("UPDATE_POSITION_TOLERANCE", "8")),
+    size_tolerance=float(os.getenv("UPDATE_SIZE_TOLERANCE", "8")),
+    heartbeat=float(os.getenv("UPDATE_HEARTBEAT", "30")),
+)
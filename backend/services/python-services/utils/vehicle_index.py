@@ -0,0 +1,391 @@
+"""
+In-process approximate nearest-neighbour index of recent vehicle embeddings
+from all cameras, for cross-camera lookup.
+
+Inverted-file (IVF) layout in NumPy: embeddings are assigned to the nearest of
+`nlist` centroids and a query only scans the `nprobe` closest lists. Until
+`train_size` vectors have been inserted the index is a single flat list (exact
+search); the centroids are then trained with a few k-means iterations over what
+has been inserted so far. Each list keeps its vectors in a preallocated array
+that grows by doubling, removal swaps the last slot into the freed one.
+
+Entries expire `ttl` seconds after their last insert; expired entries are
+dropped by evict(), which insert() runs at most every `evict_interval` seconds.
+
+With pre-fork workers (utils.prefork) the index is held by one worker only;
+the others use a RemoteVehicleIndex, which sends the same calls to it over
+its loopback port (served with serve_call).
+"""
+import logging
+import os
+import threading
+import time
+
+import httpx
+import numpy as np
+
+from utils.embedding import EMBEDDING_DIM
+
+logger = logging.getLogger(__name__)
+
+
+class _List:
+    """One inverted list; cameras are stored as integer codes so they can be filtered as an array."""
+
+    __slots__ = ("vectors", "keys", "cameras", "times", "size")
+
+    def __init__(self, dim, capacity=64):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.keys = [None] * capacity
+        self.cameras = np.zeros(capacity, dtype=np.int32)
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+
+    def _grow(self):
+        capacity = 2 * len(self.keys)
+        vectors = np.zeros((capacity, self.vectors.shape[1]), dtype=np.float32)
+        vectors[: self.size] = self.vectors[: self.size]
+        cameras = np.zeros(capacity, dtype=np.int32)
+        cameras[: self.size] = self.cameras[: self.size]
+        times = np.zeros(capacity, dtype=np.float64)
+        times[: self.size] = self.times[: self.size]
+        self.vectors, self.cameras, self.times = vectors, cameras, times
+        self.keys.extend([None] * (capacity - self.size))
+
+    def append(self, key, vector, camera, timestamp):
+        if self.size == len(self.keys):
+            self._grow()
+        slot = self.size
+        self.vectors[slot] = vector
+        self.keys[slot] = key
+        self.cameras[slot] = camera
+        self.times[slot] = timestamp
+        self.size += 1
+        return slot
+
+    def remove(self, slot):
+        """Remove a slot; returns the key that was moved into it, or None."""
+        last = self.size - 1
+        moved = None
+        if slot != last:
+            self.vectors[slot] = self.vectors[last]
+            self.keys[slot] = self.keys[last]
+            self.cameras[slot] = self.cameras[last]
+            self.times[slot] = self.times[last]
+            moved = self.keys[slot]
+        self.keys[last] = None
+        self.size = last
+        return moved
+
+
+class VehicleIndex:
+    def __init__(self, dim=EMBEDDING_DIM, nlist=256, nprobe=8, train_size=4096,
+                 ttl=3600.0, evict_interval=10.0, clock=time.time):
+        """
+        :param dim: embedding dimension
+        :param nlist: number of inverted lists once trained
+        :param nprobe: lists scanned per query
+        :param train_size: inserted vectors needed before the centroids are trained
+        :param ttl: seconds an entry stays in the index after its last insert
+        :param evict_interval: minimum seconds between automatic evictions
+        :param clock: time source, seconds
+        """
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.ttl = ttl
+        self.evict_interval = evict_interval
+        self.clock = clock
+        self.centroids = None
+        self._lists = [_List(dim)]
+        self._where = {}  # key -> (list number, slot)
+        self._meta = {}
+        self._camera_codes = {}
+        self._camera_ids = []
+        self._lock = threading.RLock()
+        self._last_evict = clock()
+        self.inserts = 0
+        self.queries = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._where)
+
+    # -- writes ------------------------------------------------------------------
+
+    def _camera_code(self, camera_id):
+        code = self._camera_codes.get(camera_id)
+        if code is None:
+            code = self._camera_codes[camera_id] = len(self._camera_ids)
+            self._camera_ids.append(camera_id)
+        return code
+
+    def _assign(self, vector):
+        if self.centroids is None:
+            return 0
+        return int(np.argmax(self.centroids @ vector))
+
+    def _remove(self, key):
+        number, slot = self._where.pop(key)
+        self._meta.pop(key, None)
+        moved = self._lists[number].remove(slot)
+        if moved is not None:
+            self._where[moved] = (number, slot)
+
+    def insert(self, key, vector, camera_id, meta=None, timestamp=None):
+        """
+        Add or refresh an entry.
+
+        :param key: unique id of the vehicle (stored vehicle id)
+        :param vector: unit-norm embedding of length dim
+        :param camera_id: camera that saw the vehicle
+        :param meta: small dict returned with query hits
+        :param timestamp: time of the sighting, defaults to now
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (self.dim,):
+            raise ValueError(f"Expected an embedding of {self.dim} values, got {vector.shape}")
+        now = self.clock()
+        timestamp = now if timestamp is None else timestamp
+        with self._lock:
+            if key in self._where:
+                self._remove(key)
+            number = self._assign(vector)
+            slot = self._lists[number].append(key, vector, self._camera_code(camera_id), timestamp)
+            self._where[key] = (number, slot)
+            if meta:
+                self._meta[key] = meta
+            self.inserts += 1
+            if self.centroids is None and len(self._where) >= self.train_size:
+                self._train()
+            if now - self._last_evict >= self.evict_interval:
+                self._evict(now)
+
+    def remove(self, key):
+        with self._lock:
+            if key in self._where:
+                self._remove(key)
+
+    def update(self, entries, removed=()):
+        """
+        Remove keys, then add or refresh entries, in one call (one round trip
+        through a RemoteVehicleIndex).
+
+        :param entries: (key, vector, camera_id, meta) tuples, see insert
+        :param removed: keys to remove first
+        """
+        with self._lock:
+            for key in removed:
+                self.remove(key)
+            for key, vector, camera_id, meta in entries:
+                self.insert(key, vector, camera_id, meta=meta)
+
+    def evict(self, now=None):
+        """Drop entries older than ttl; returns how many were removed."""
+        with self._lock:
+            return self._evict(self.clock() if now is None else now)
+
+    def _evict(self, now):
+        self._last_evict = now
+        cutoff = now - self.ttl
+        removed = 0
+        for entries in self._lists:
+            expired = np.flatnonzero(entries.times[: entries.size] < cutoff)
+            # highest slots first, so swapped-in entries have already been checked
+            for slot in expired[::-1]:
+                self._remove(entries.keys[slot])
+                removed += 1
+        self.evicted += removed
+        return removed
+
+    def _train(self, iterations=8, seed=0):
+        entries = self._lists[0]
+        data = entries.vectors[: entries.size]
+        rng = np.random.default_rng(seed)
+        centroids = data[rng.choice(len(data), size=min(self.nlist, len(data)), replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(data @ centroids.T, axis=1)
+            for c in range(len(centroids)):
+                members = data[assignment == c]
+                if len(members):
+                    mean = members.sum(axis=0)
+                    norm = np.linalg.norm(mean)
+                    if norm > 0:
+                        centroids[c] = mean / norm
+        self.centroids = centroids
+        old = entries
+        self._lists = [_List(self.dim) for _ in range(len(centroids))]
+        self._where = {}
+        assignment = np.argmax(data @ centroids.T, axis=1)
+        for slot in range(old.size):
+            number = int(assignment[slot])
+            key = old.keys[slot]
+            self._where[key] = (
+                number,
+                self._lists[number].append(key, old.vectors[slot], old.cameras[slot], old.times[slot]),
+            )
+
+    # -- reads -------------------------------------------------------------------
+
+    def query(self, vector, top_k=5, threshold=0.0, exclude_camera=None, max_age=None):
+        """
+        Most similar recent vehicles.
+
+        :param vector: unit-norm query embedding
+        :param top_k: maximum number of hits
+        :param threshold: minimum cosine similarity
+        :param exclude_camera: skip entries seen by this camera
+        :param max_age: only entries inserted within this many seconds (defaults to ttl)
+        :return: list of {"key", "cameraId", "score", "timestamp", "meta"}, best first
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        cutoff = self.clock() - (self.ttl if max_age is None else max_age)
+        with self._lock:
+            self.queries += 1
+            if self.centroids is None:
+                numbers = [0]
+            else:
+                sims = self.centroids @ vector
+                nprobe = min(self.nprobe, len(sims))
+                numbers = np.argpartition(-sims, nprobe - 1)[:nprobe]
+            excluded = self._camera_codes.get(exclude_camera, -1)
+            candidates = []
+            for number in numbers:
+                entries = self._lists[number]
+                if not entries.size:
+                    continue
+                scores = entries.vectors[: entries.size] @ vector
+                keep = (scores >= threshold) & (entries.times[: entries.size] >= cutoff)
+                if excluded >= 0:
+                    keep &= entries.cameras[: entries.size] != excluded
+                slots = np.flatnonzero(keep)
+                if len(slots) > top_k:
+                    slots = slots[np.argpartition(-scores[slots], top_k - 1)[:top_k]]
+                candidates.extend((float(scores[slot]), entries, int(slot)) for slot in slots)
+            candidates.sort(key=lambda c: c[0], reverse=True)
+            return [
+                {
+                    "key": entries.keys[slot],
+                    "cameraId": self._camera_ids[entries.cameras[slot]],
+                    "score": round(score, 4),
+                    "timestamp": float(entries.times[slot]),
+                    "meta": self._meta.get(entries.keys[slot]),
+                }
+                for score, entries, slot in candidates[:top_k]
+            ]
+
+    def stats(self):
+        with self._lock:
+            sizes = [entries.size for entries in self._lists]
+            return {
+                "size": len(self._where),
+                "trained": self.centroids is not None,
+                "lists": len(sizes),
+                "largest_list": max(sizes) if sizes else 0,
+                "inserts": self.inserts,
+                "queries": self.queries,
+                "evicted": self.evicted,
+            }
+
+
+class RemoteVehicleIndex:
+    """
+    The insert/remove/update/query/stats calls of a VehicleIndex held by another
+    process. The index is a best-effort lookup: a failed call is logged and
+    skipped, a failed query finds nothing.
+    """
+
+    def __init__(self, url, timeout=2.0, client=None):
+        """
+        :param url: base URL of the serving endpoint, one path segment per call is appended
+        :param timeout: seconds a call may take
+        :param client: httpx.Client to use, one is created when None
+        """
+        self.url = url.rstrip("/")
+        self._client = client or httpx.Client(timeout=timeout)
+
+    def _call(self, op, body, default=None):
+        try:
+            response = self._client.post(f"{self.url}/{op}", json=body)
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning("Vehicle index %s at %s failed: %s", op, self.url, e)
+            return default
+
+    def insert(self, key, vector, camera_id, meta=None, timestamp=None):
+        self._call(
+            "insert",
+            {
+                "key": key,
+                "vector": np.asarray(vector, dtype=np.float32).tolist(),
+                "camera_id": camera_id,
+                "meta": meta,
+                "timestamp": timestamp,
+            },
+        )
+
+    def remove(self, key):
+        self._call("remove", {"key": key})
+
+    def update(self, entries, removed=()):
+        self._call(
+            "update",
+            {
+                "entries": [
+                    [key, np.asarray(vector, dtype=np.float32).tolist(), camera_id, meta]
+                    for key, vector, camera_id, meta in entries
+                ],
+                "removed": list(removed),
+            },
+        )
+
+    def query(self, vector, top_k=5, threshold=0.0, exclude_camera=None, max_age=None):
+        return self._call(
+            "query",
+            {
+                "vector": np.asarray(vector, dtype=np.float32).tolist(),
+                "top_k": top_k,
+                "threshold": threshold,
+                "exclude_camera": exclude_camera,
+                "max_age": max_age,
+            },
+            default=[],
+        )
+
+    def stats(self):
+        return self._call("stats", {}, default={})
+
+
+def serve_call(index, op, body):
+    """
+    Run a RemoteVehicleIndex call on the local index.
+
+    :raises KeyError: for an unknown op
+    """
+    if op == "insert":
+        index.insert(
+            body["key"], body["vector"], body["camera_id"], meta=body.get("meta"), timestamp=body.get("timestamp")
+        )
+        return None
+    if op == "remove":
+        index.remove(body["key"])
+        return None
+    if op == "update":
+        index.update([tuple(entry) for entry in body["entries"]], body.get("removed", ()))
+        return None
+    if op == "query":
+        return index.query(
+            body["vector"],
+            top_k=body.get("top_k", 5),
+            threshold=body.get("threshold", 0.0),
+            exclude_camera=body.get("exclude_camera"),
+            max_age=body.get("max_age"),
+        )
+    if op == "stats":
+        return index.stats()
+    raise KeyError(op)
+
+
+vehicle_index = VehicleIndex(ttl=float(os.getenv("VEHICLE_INDEX_TTL", "3600")))
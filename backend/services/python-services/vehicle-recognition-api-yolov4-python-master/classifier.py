@@ -9,34 +9,61 @@ def load_labels(filename):
 	with open(filename, 'r') as f:
 		return [line.strip() for line in f.readlines()]
 
+def _output_name(model):
+    """
+    Name of the model's output tensor. Read from a session of a throwaway
+    interpreter: pymnn cannot release a session, but frees the interpreter's
+    sessions with it, so the probe does not stay allocated next to the real one.
+    """
+    probe = MNN.Interpreter(model)
+    # single threaded so the probe session does not take a slot of MNN's thread pool
+    session = probe.createSession({"numThread": 1})
+    return next(iter(probe.getSessionOutputAll(session)))
+
+# output of the last hard-swish block, the pooled 1024-d feature the Logits layer reads
+EMBEDDING_TENSOR = "multiply_18/mul"
+
 class Classifier():
-    def __init__(self, model, labels):
+    def __init__(self, model, labels, embedding_tensor=EMBEDDING_TENSOR, precision=None, num_threads=None):
         self.interpreter = MNN.Interpreter(model)
-        self.session = self.interpreter.createSession()
+        self.embedding_tensor = embedding_tensor
+        # saveTensors replaces the session outputs, so the softmax output name is read first
+        self.output_name = _output_name(model) if embedding_tensor else None
+        config = {"saveTensors": (embedding_tensor, self.output_name)} if embedding_tensor else {}
+        if precision:
+            # "low" lets MNN run FP16/INT8 kernels where the CPU has them
+            config["precision"] = precision
+        if num_threads:
+            config["numThread"] = num_threads
+        self.session = self.interpreter.createSession(config)
+        if self.output_name is None:
+            self.output_name = next(iter(self.interpreter.getSessionOutputAll(self.session)))
         self.input_tensor = self.interpreter.getSessionInput(self.session)
         self.labels = load_labels(labels)
 
-    def predict(self, image):
-        # change to rgb format
-        image = image[..., ::-1]
-        image = cv2.resize(image, (224, 224))
-
-        # preprocess image
-        image = image - (127.5, 127.5, 127.5)
-        image = image * (0.00784, 0.00784, 0.00784)
+    def predict(self, image, with_embedding=False):
+        """
+        Top-1 label and probability of an image crop.
 
-        # cv2 read shape is NHWC, Tensor's need is NCHW, transpose it
-        image = image.transpose((2, 0, 1))
-        image = image.astype(np.float32)  # Ensure correct data type
-        # Debug: Check shape and dtype
+        :param with_embedding: also return the penultimate-layer feature vector
+        :return: (label, prob) or (label, prob, embedding) with a float32 array
+        """
+        # resize, BGR->RGB, (x - 127.5) * 0.00784 and HWC->NCHW in one float32 pass
+        image = cv2.dnn.blobFromImage(
+            image, 0.00784, (224, 224), (127.5, 127.5, 127.5), swapRB=True, crop=False
+        )
         # construct tensor from np.ndarray
         tmp_input = MNN.Tensor((1, 3, 224, 224), MNN.Halide_Type_Float, image, MNN.Tensor_DimensionType_Caffe)
         self.input_tensor.copyFrom(tmp_input)
         self.interpreter.runSession(self.session)
-        output_tensor = self.interpreter.getSessionOutput(self.session)
-        preds = output_tensor.getData()
+        output_tensor = self.interpreter.getSessionOutput(self.session, self.output_name)
+        preds = np.array(output_tensor.getData())
 
-        top = 1
-        top_indices = np.array(preds).argsort()[-top:][::-1]
-        ix = top_indices[0]
-        return (self.labels[ix], str(float(np.array(preds)[ix])))
+        ix = int(np.argmax(preds))
+        label = (self.labels[ix], float(preds[ix]))
+        if not with_embedding:
+            return label
+        if not self.embedding_tensor:
+            return label + (None,)
+        feature = self.interpreter.getSessionOutput(self.session, self.embedding_tensor).getData()
+        return label + (np.array(feature, dtype=np.float32).ravel(),)
@@ -1,6 +1,8 @@
 import cv2
 import os
+from dataclasses import dataclass
 from tempfile import NamedTemporaryFile
+from typing import Optional
 import classifier
 from cv2 import dnn_DetectionModel
 
@@ -29,20 +31,59 @@ _brand_classifier = None
 _color_classifier = None
 
 
-def get_brand_classifier(modelbrandweights, labels_makes):
+def get_brand_classifier(modelbrandweights, labels_makes, precision=None, num_threads=None):
     global _brand_classifier
     if _brand_classifier is None:
-        _brand_classifier = classifier.Classifier(modelbrandweights, labels_makes)
+        _brand_classifier = classifier.Classifier(
+            modelbrandweights, labels_makes, precision=precision, num_threads=num_threads
+        )
     return _brand_classifier
 
 
-def get_color_classifier(modelcolorweights, labels_colors):
+def get_color_classifier(modelcolorweights, labels_colors, precision=None, num_threads=None):
     global _color_classifier
     if _color_classifier is None:
-        _color_classifier = classifier.Classifier(modelcolorweights, labels_colors)
+        _color_classifier = classifier.Classifier(
+            modelcolorweights, labels_colors, precision=precision, num_threads=num_threads
+        )
     return _color_classifier
 
 
+@dataclass(slots=True)
+class VehicleDetection:
+    """One detected vehicle; the box is clipped to the frame. Make/color are set by classify()."""
+
+    object: str
+    object_prob: float
+    left: int
+    top: int
+    width: int
+    height: int
+    make: str = ""
+    make_prob: float = 0.0
+    color: str = ""
+    color_prob: float = 0.0
+    # penultimate-layer features of the make and color classifiers
+    features: tuple = ()
+    crop_hash: Optional[int] = None
+
+    def to_dict(self):
+        return {
+            "object": self.object,
+            "make": self.make,
+            "color": self.color,
+            "make_prob": self.make_prob,
+            "color_prob": self.color_prob,
+            "object_prob": self.object_prob,
+            "rect": {
+                "left": self.left,
+                "top": self.top,
+                "width": self.width,
+                "height": self.height,
+            },
+        }
+
+
 class VehicleRecognitionModel:
     def __init__(
         self,
@@ -53,52 +94,125 @@ class VehicleRecognitionModel:
         labels_colors,
         labels_makes,
         coco_names,
+        dnn_target=None,
+        make_precision=None,
+        color_precision=None,
+        num_threads=None,
     ):
+        """
+        :param dnn_target: OpenCV DNN target of YOLO (e.g. cv2.dnn.DNN_TARGET_CPU_FP16)
+        :param make_precision: MNN precision of the make classifier ("low" for reduced precision)
+        :param color_precision: MNN precision of the color classifier
+        :param num_threads: MNN threads per classifier session (MNN's default when None)
+        """
         self.net = dnn_DetectionModel(yolocfg, yoloweights)
+        if dnn_target is not None:
+            self.net.setPreferableTarget(dnn_target)
         self.net.setInputSize(608, 608)
         self.net.setInputScale(1.0 / 255)
         self.net.setInputSwapRB(True)
-        self.car_make_classifier = get_brand_classifier(modelbrandweights, labels_makes)
+        self.car_make_classifier = get_brand_classifier(
+            modelbrandweights, labels_makes, make_precision, num_threads
+        )
         self.car_color_classifier = get_color_classifier(
-            modelcolorweights, labels_colors
+            modelcolorweights, labels_colors, color_precision, num_threads
         )
         self.LABELS = open(coco_names).read().strip().split("\n")
+        # optional result cache for unchanged crops (utils.crop_cache.CropCache)
+        self.crop_cache = None
 
-    def objectDetect(self, image):
-        objects = []
-        if isinstance(image, str):
-            img = cv2.imread(image)
-            if img is None:
-                raise ValueError("Invalid or unreadable image")
-        else:
-            img = image.copy()
+    def _classify(self, car_img):
+        make, make_conf, make_feature = self.car_make_classifier.predict(
+            car_img, with_embedding=True
+        )
+        color, color_conf, color_feature = self.car_color_classifier.predict(
+            car_img, with_embedding=True
+        )
+        return make, make_conf, color, color_conf, (make_feature, color_feature)
+
+    def detect(self, img):
+        """
+        Vehicle boxes of a BGR frame, without classification.
+
+        :return: list of VehicleDetection
+        """
+        frame_h, frame_w = img.shape[:2]
         classes, confidences, boxes = self.net.detect(
             img, confThreshold=0.1, nmsThreshold=0.4
         )
+        detections = []
         for classId, confidence, box in zip(
             classes.flatten(), confidences.flatten(), boxes
         ):
             if classId in [2, 5, 7] and confidence > 0.3:
-                left, top, width, height = box
-                x1, y1, x2, y2 = left, top, left + width, top + height
-                car_img = img[y1:y2, x1:x2]
-                make, make_conf = self.car_make_classifier.predict(car_img)
-                color, color_conf = self.car_color_classifier.predict(car_img)
-                rect = {
-                    "left": str(x1),
-                    "top": str(y1),
-                    "width": str(x2 - x1),
-                    "height": str(y2 - y1),
-                }
-                objects.append(
-                    {
-                        "object": self.LABELS[classId],
-                        "make": make,
-                        "color": color,
-                        "make_prob": str(make_conf),
-                        "color_prob": str(color_conf),
-                        "object_prob": str(confidence),
-                        "rect": rect,
-                    }
+                left, top, width, height = (int(v) for v in box)
+                # boxes can reach outside the frame; negative starts would wrap the slice
+                x1, y1 = max(left, 0), max(top, 0)
+                x2, y2 = min(left + width, frame_w), min(top + height, frame_h)
+                if x2 <= x1 or y2 <= y1:
+                    continue
+                detections.append(
+                    VehicleDetection(
+                        object=self.LABELS[classId],
+                        object_prob=float(confidence),
+                        left=x1,
+                        top=y1,
+                        width=x2 - x1,
+                        height=y2 - y1,
+                    )
                 )
-        return {"vehicles": objects}
+        return detections
+
+    def classify(self, img, detection, scope=None):
+        """
+        Fill in make, color and features of a detection.
+
+        :param img: the frame the detection was found in
+        :param scope: crop cache scope (e.g. camera id); the cache is only used with a scope
+        """
+        cache = self.crop_cache if scope is not None else None
+        box = (detection.left, detection.top, detection.width, detection.height)
+        car_img = img[
+            detection.top : detection.top + detection.height,
+            detection.left : detection.left + detection.width,
+        ]
+        crop_hash = cache.hash_crop(car_img) if cache is not None else None
+        cached = (
+            cache.lookup(scope, box, crop_hash, "classify")
+            if crop_hash is not None
+            else None
+        )
+        if cached is None:
+            cached = self._classify(car_img)
+            if crop_hash is not None:
+                cache.store(scope, box, crop_hash, "classify", cached)
+        (
+            detection.make,
+            detection.make_prob,
+            detection.color,
+            detection.color_prob,
+            detection.features,
+        ) = cached
+        detection.crop_hash = crop_hash
+        return detection
+
+    def objectDetect(self, image, scope=None):
+        """
+        Detect and classify all vehicles of an image.
+
+        :param image: image path or BGR array
+        :param scope: crop cache scope (e.g. camera id); the cache is only used with a scope
+        :return: {"vehicles": [VehicleDetection, ...]}
+        """
+        if isinstance(image, str):
+            img = cv2.imread(image)
+            if img is None:
+                raise ValueError("Invalid or unreadable image")
+        else:
+            # detection and classification only read the frame, crops are views of it
+            img = image
+        return {
+            "vehicles": [
+                self.classify(img, detection, scope) for detection in self.detect(img)
+            ]
+        }
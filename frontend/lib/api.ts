@@ -1,6 +1,7 @@
 
 // API Configuration
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8080"
+const PROCESSING_API_URL = process.env.NEXT_PUBLIC_PROCESSING_API_URL || "http://localhost:5000"
 
 // Types matching your backend
 export interface VehicleBoundary {
@@ -25,6 +26,15 @@ export interface VehicleBoundary {
   longitude: number
 }
 
+// One processed frame pushed by the processing service stream
+export interface DetectionFrame {
+  cameraId: string
+  frame: number
+  timestamp: string
+  vehicles: Partial<VehicleBoundary>[]
+  matches: unknown
+}
+
 export interface Alert {
   id: string
   cameraId: string
@@ -157,6 +167,55 @@ class ApiService {
     return this.request(`/alerts/${alertId}`)
   }
 
+  // Live detections (Server-Sent Events from the processing service).
+  // Returns a function that closes the stream.
+  subscribeDetections(
+    cameraId: string,
+    onFrame: (frame: DetectionFrame) => void,
+    onError?: (error: unknown) => void,
+  ): () => void {
+    const controller = new AbortController()
+    const token = localStorage.getItem("authToken")
+
+    const run = async () => {
+      const response = await fetch(`${PROCESSING_API_URL}/stream/${cameraId}`, {
+        headers: {
+          Accept: "text/event-stream",
+          ...(token && { Authorization: `Bearer ${token}` }),
+        },
+        signal: controller.signal,
+      })
+      if (!response.ok || !response.body) {
+        throw new Error(`HTTP error! status: ${response.status}`)
+      }
+
+      const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+      let buffer = ""
+      while (true) {
+        const { value, done } = await reader.read()
+        if (done) break
+        buffer += value
+        const events = buffer.split("\n\n")
+        buffer = events.pop() ?? ""
+        for (const event of events) {
+          const data = event
+            .split("\n")
+            .filter((line) => line.startsWith("data: "))
+            .map((line) => line.slice(6))
+            .join("\n")
+          if (data) onFrame(JSON.parse(data))
+        }
+      }
+    }
+
+    run().catch((error) => {
+      if (controller.signal.aborted) return
+      console.error("Detection stream failed:", error)
+      onError?.(error)
+    })
+    return () => controller.abort()
+  }
+
   // Dashboard Stats
   async getDashboardStats(): Promise<{
     totalCameras: number